@@ -1,313 +1,964 @@
 """This is a script that provides support for managing a shopping list in the Home Assistant platform."""
 import asyncio
+from collections import deque
 import logging
+import random
 import uuid
-import requests
-import json
-import secrets
-import aiohttp
 
+from aiohttp import web
 import voluptuous as vol #It uses the voluptuous library to provide validation of the configuration options passed to the script
 
 #from homeassistant.const import HTTP_NOT_FOUND, HTTP_BAD_REQUEST
-from homeassistant.core import callback
-from homeassistant.components import http
+from homeassistant.core import SupportsResponse, callback
+from homeassistant.components import http, persistent_notification
 from homeassistant.components.http.data_validator import RequestDataValidator
 from homeassistant.helpers import intent
+from homeassistant.helpers.discovery import async_load_platform
+from homeassistant.helpers.json import json_dumps
 import homeassistant.helpers.config_validation as cv
-from homeassistant.util.json import load_json, save_json
+from homeassistant.helpers.storage import Store
 from homeassistant.components import websocket_api
-from homeassistant.const import (CONF_PASSWORD, CONF_USERNAME)
-
-# Above it imports the asyncio, logging, uuid, requests, json, and secrets libraries. It also imports various modules from the homeassistant package such as const, core, components, helpers and util.
+from homeassistant.const import (CONF_PASSWORD, CONF_USERNAME, EVENT_HOMEASSISTANT_STOP)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import slugify
+
+from .aisles import AisleOrder, SortedItems, load_aisles
+from .api import API_URL, REQUEST_DEADLINE, IcaApiError, IcaClient, IcaList
+from .cache import ResponseCache
+from .history import TOP_K, PurchaseHistory
+from .metrics import LoopLagProbe, Metrics
+from .model import ROW_FIELDS, parse_row
+from .poller import ListPoller
+from .scheduler import DEFAULT_MAX_IN_FLIGHT, DEFAULT_RATE_LIMIT, PRIORITY_BACKGROUND, request_priority
+from .search import DEFAULT_LIMIT, MAX_LIMIT, NameIndex
+from .store import ItemStore, normalize_name
+from .sync import DEFAULT_SYNC_DELAY, SyncQueue
+from .trace import TraceRecorder
+
+# Above it imports the logging library. It also imports various modules from the homeassistant package such as const, core, components, helpers and util, and the async ICA client from api.py.
 
 ATTR_NAME = "name"  #Defines the constant ATTR_NAME.
+ATTR_ITEMS = "items"
+ATTR_LIST = "list"
+ATTR_ORDER = "order"
+ORDER_AISLE = "aisle"
 
 DOMAIN = "ica_shopping_list" #Defines the constant DOMAIN.
 _LOGGER = logging.getLogger(__name__) #Defines the constant LOGGER.
-CONFIG_SCHEMA = vol.Schema({ #Defines the constant CONFIG_SCHEMA.
-  DOMAIN: {
+CONF_LISTNAME = "listname"
+CONF_TIMEOUT = "timeout"
+CONF_SYNC_DELAY = "sync_delay"
+CONF_API_URL = "api_url"
+CONF_RATE_LIMIT = "rate_limit"
+CONF_MAX_IN_FLIGHT = "max_in_flight"
+CONF_DEADLINE = "deadline"
+CONF_AISLES = "aisles"
+CONF_TRACE = "trace"
+CONF_PREFIX = "prefix"
+ACCOUNT_SCHEMA = vol.Schema({ #One ICA account with one or more lists.
     vol.Required(CONF_USERNAME): cv.string,
     vol.Required(CONF_PASSWORD): cv.string,
-  },
-}, extra=vol.ALLOW_EXTRA)
+    vol.Required(CONF_LISTNAME): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(CONF_TIMEOUT, default=10): cv.positive_int,
+    vol.Optional(CONF_SYNC_DELAY, default=DEFAULT_SYNC_DELAY): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_API_URL, default=API_URL): cv.url,
+    vol.Optional(CONF_RATE_LIMIT, default=DEFAULT_RATE_LIMIT): vol.All(vol.Coerce(float), vol.Range(min=0.1)),
+    vol.Optional(CONF_MAX_IN_FLIGHT, default=DEFAULT_MAX_IN_FLIGHT): cv.positive_int,
+    vol.Optional(CONF_DEADLINE, default=REQUEST_DEADLINE): cv.positive_int,
+    vol.Optional(CONF_AISLES): cv.string,
+    vol.Optional(CONF_TRACE): cv.string,
+    vol.Optional(CONF_PREFIX): cv.string,
+})
+
+
+#The following functions key every list by the slug of its name, with the `prefix` of its account in front when the account has one.
+#The key only depends on the account the list is configured on, so adding, removing or reordering other accounts never renames a list
+#and never moves its snapshot, history, entities or events to another key. Two lists that would get the same key are refused as a configuration error.
+def list_key(conf, listname):
+    """Return the key for `listname` on the account configured by `conf`."""
+    if CONF_PREFIX in conf:
+        return slugify(f"{conf[CONF_PREFIX]} {listname}")
+    return slugify(listname)
+
+
+def unique_list_keys(config):
+    """Refuse a configuration where two lists get the same key."""
+    keys = set()
+    for conf in config:
+        for listname in conf[CONF_LISTNAME]:
+            key = list_key(conf, listname)
+            if key in keys:
+                raise vol.Invalid(f"More than one list would be addressed as {key}, give the accounts that share it a different prefix")
+            keys.add(key)
+    return config
 
-#The following defines variables to store credentials and the shoppinglist.
-icaUser = None
-icaPassword = None
-icaList = None
+
+CONFIG_SCHEMA = vol.Schema({ #Defines the constant CONFIG_SCHEMA.
+  DOMAIN: vol.All(cv.ensure_list, [ACCOUNT_SCHEMA], unique_list_keys),
+}, extra=vol.ALLOW_EXTRA)
 
 #Here it also defines various event, intent, and schema constants such as EVENT, INTENT_ADD_ITEM, INTENT_LAST_ITEMS, ITEM_UPDATE_SCHEMA, etc. which are used to handle different actions and events related to the shopping list.
 EVENT = "shopping_list_updated"
 INTENT_ADD_ITEM = "HassShoppingListAddItem"
 INTENT_LAST_ITEMS = "HassShoppingListLastItems"
+INTENT_USUAL_ITEMS = "IcaShoppingListUsualItems"
 ITEM_UPDATE_SCHEMA = vol.Schema({"complete": bool, ATTR_NAME: str})
-PERSISTENCE = ".shopping_list.json"
+SNAPSHOT_KEY = f"{DOMAIN}.snapshot_{{}}"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SAVE_DELAY = 1
+CHANGELOG_SIZE = 100
+EVENT_DELAY = 0.1
+READY_TIMEOUT = 10
+REVISION_EPOCH_BITS = 31
+REVISION_COUNTER_BITS = 20
+ATTR_EXPECTED_REVISION = "expected_revision"
+REVISION_HEADER = "X-Shopping-List-Revision"
 
 #It also defines various service constants such as SERVICE_ADD_ITEM, SERVICE_COMPLETE_ITEM, etc. which are used to handle different actions related to the shopping list.
 SERVICE_ADD_ITEM = "add_item"
 SERVICE_COMPLETE_ITEM = "complete_item"
+SERVICE_ADD_ITEMS = "add_items"
 
-SERVICE_ITEM_SCHEMA = vol.Schema({vol.Required(ATTR_NAME): vol.Any(None, cv.string)})
+SERVICE_ITEM_SCHEMA = vol.Schema(
+    {vol.Required(ATTR_NAME): vol.Any(None, cv.string), vol.Optional(ATTR_LIST): cv.string}
+)
+ITEMS_SCHEMA = vol.Any(cv.string, [cv.string])
+SERVICE_ITEMS_SCHEMA = vol.Schema({vol.Required(ATTR_ITEMS): ITEMS_SCHEMA, vol.Optional(ATTR_LIST): cv.string})
+SERVICE_COMPLETE_ITEM_SCHEMA = vol.Schema(
+    {vol.Required(ATTR_NAME): vol.Any(None, cv.string, [cv.string]), vol.Optional(ATTR_LIST): cv.string}
+)
 
 #It also defines various websocket constants such as WS_TYPE_SHOPPING_LIST_ITEMS, WS_TYPE_SHOPPING_LIST_ADD_ITEM, WS_TYPE_SHOPPING_LIST_UPDATE_ITEM, etc. which are used to handle different websocket events related to the shopping list.
 WS_TYPE_SHOPPING_LIST_ITEMS = "shopping_list/items"
 WS_TYPE_SHOPPING_LIST_ADD_ITEM = "shopping_list/items/add"
+WS_TYPE_SHOPPING_LIST_ADD_ITEMS = "shopping_list/items/add_items"
 WS_TYPE_SHOPPING_LIST_UPDATE_ITEM = "shopping_list/items/update"
+WS_TYPE_SHOPPING_LIST_UPDATE_ITEMS = "shopping_list/items/update_items"
 WS_TYPE_SHOPPING_LIST_CLEAR_ITEMS = "shopping_list/items/clear"
+WS_TYPE_SHOPPING_LIST_SUBSCRIBE = "shopping_list/subscribe"
+WS_TYPE_SHOPPING_LIST_SEARCH = "shopping_list/search"
+WS_TYPE_SHOPPING_LIST_SUGGESTIONS = "shopping_list/suggestions"
 
 #It also defines various schema constants such as SCHEMA_WEBSOCKET_ITEMS, SCHEMA_WEBSOCKET_ADD_ITEM, SCHEMA_WEBSOCKET_UPDATE_ITEM, etc. which are used to validate the incoming data for different websocket events.
 SCHEMA_WEBSOCKET_ITEMS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
-    {vol.Required("type"): WS_TYPE_SHOPPING_LIST_ITEMS}
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_ITEMS,
+        vol.Optional(ATTR_LIST): str,
+        vol.Optional(ATTR_ORDER): vol.In([ORDER_AISLE]),
+    }
 )
 
 SCHEMA_WEBSOCKET_ADD_ITEM = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
-    {vol.Required("type"): WS_TYPE_SHOPPING_LIST_ADD_ITEM, vol.Required("name"): str}
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_ADD_ITEM,
+        vol.Optional(ATTR_LIST): str,
+        vol.Required("name"): str,
+        vol.Optional(ATTR_EXPECTED_REVISION): int,
+    }
+)
+
+SCHEMA_WEBSOCKET_ADD_ITEMS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_ADD_ITEMS,
+        vol.Optional(ATTR_LIST): str,
+        vol.Required(ATTR_ITEMS): ITEMS_SCHEMA,
+        vol.Optional(ATTR_EXPECTED_REVISION): int,
+    }
 )
 
 SCHEMA_WEBSOCKET_UPDATE_ITEM = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     {
         vol.Required("type"): WS_TYPE_SHOPPING_LIST_UPDATE_ITEM,
+        vol.Optional(ATTR_LIST): str,
         vol.Required("item_id"): str,
         vol.Optional("name"): str,
         vol.Optional("complete"): bool,
+        vol.Optional(ATTR_EXPECTED_REVISION): int,
+    }
+)
+
+SCHEMA_WEBSOCKET_UPDATE_ITEMS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_UPDATE_ITEMS,
+        vol.Optional(ATTR_LIST): str,
+        vol.Required("changes"): [
+            {
+                vol.Required("item_id"): str,
+                vol.Optional("name"): str,
+                vol.Optional("complete"): bool,
+                vol.Optional("delete"): bool,
+            }
+        ],
+        vol.Optional(ATTR_EXPECTED_REVISION): int,
     }
 )
 
 SCHEMA_WEBSOCKET_CLEAR_ITEMS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
-    {vol.Required("type"): WS_TYPE_SHOPPING_LIST_CLEAR_ITEMS}
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_CLEAR_ITEMS,
+        vol.Optional(ATTR_LIST): str,
+        vol.Optional(ATTR_EXPECTED_REVISION): int,
+    }
+)
+
+SCHEMA_WEBSOCKET_SUBSCRIBE = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_SUBSCRIBE,
+        vol.Optional(ATTR_LIST): str,
+        vol.Optional("revision"): vol.Coerce(int),
+    }
+)
+
+SCHEMA_WEBSOCKET_SEARCH = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_SEARCH,
+        vol.Optional(ATTR_LIST): str,
+        vol.Required("query"): str,
+        vol.Optional("limit", default=DEFAULT_LIMIT): vol.All(int, vol.Range(min=1, max=MAX_LIMIT)),
+    }
+)
+
+SCHEMA_WEBSOCKET_SUGGESTIONS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SHOPPING_LIST_SUGGESTIONS,
+        vol.Optional(ATTR_LIST): str,
+        vol.Optional("limit", default=DEFAULT_LIMIT): vol.All(int, vol.Range(min=1, max=TOP_K)),
+    }
 )
 """ Overall, the above script is responsible for providing support for managing a shopping list in the Home Assistant platform by validating the configuration options, handling different events and actions related to the shopping list, and handling websocket events related to the shopping list."""
 
 
 
 #The following is an async_setup function that is responsible for setting up the shopping list feature when the script is loaded by the Home Assistant platform.
-#It first declares three global variables icaUser, icaPassword, icaList and assigns them the values of the username, password, and listname keys in the config dictionary respectively.
+#Nothing is loaded during setup. Every list is started in a background task that loads the local snapshot, reconciles it with ICA and then starts polling,
+#so neither the disk nor a slow or unreachable ICA holds up startup. Services, views and websocket commands are registered at once and wait for the list to be ready.
+#It first creates an IcaClient for every configured account from its username and password. The client owns the one aiohttp session used for every call to that account,
+#and every list on the account gets its own ShoppingData in hass.data[DOMAIN], keyed by list_key(). Accounts with the `trace` option record their ICA requests,
+#and accounts that name the same trace file share one recorder. Every list is loaded, reconciled and polled on its own,
+#so one slow list does not hold up the others. Lists on the same account share one login.
 #It then registers several services that can be called by the Home Assistant platform to perform actions related to the shopping list, such as adding or completing an item in the list. It also registers several views that can handle HTTP requests related to the shopping list.
 #It also registers the #####built-in panel for the shopping list in the Home Assistant frontend##### and registers various commands that can be called via websockets to handle different actions related to the shopping list.
-#It also has a commented out line that appears to be trying to authenticate the user with the Connect.authenticate(icaUser, icaPassword) method, but it is not clear from the code snippet provided what the Connect object is or how it is used.
 #At the end of the function, it returns True to indicate that the setup was successful.
-@asyncio.coroutine
-def async_setup(hass, config):
+async def async_setup(hass, config):
     """Initialize the shopping list."""
-    global icaUser
-    icaUser = config["ica_shopping_list"]["username"]
-    global icaPassword
-    icaPassword = config["ica_shopping_list"]["password"]
-    global icaList
-    icaList = config["ica_shopping_list"]["listname"]
     _LOGGER.debug(config)
 
-    @asyncio.coroutine
-    def add_item_service(call):
+    async def add_item_service(call):
         """Add an item with `name`."""
-        data = hass.data[DOMAIN]
+        data = service_shopping_data(hass, call)
         name = call.data.get(ATTR_NAME)
         if name is not None:
-            data.async_add(name)
+            await data.async_add(name)
 
-    @asyncio.coroutine
-    def complete_item_service(call):
-        """Mark the item provided via `name` as completed."""
-        data = hass.data[DOMAIN]
-        name = call.data.get(ATTR_NAME)
-        if name is None:
+    async def add_items_service(call):
+        """Add every item in `items` with one sync and report which were already present."""
+        return await service_shopping_data(hass, call).async_add_items(call.data[ATTR_ITEMS])
+
+    async def complete_item_service(call):
+        """Mark the item, or list of items, provided via `name` as completed."""
+        data = service_shopping_data(hass, call)
+        names = call.data.get(ATTR_NAME)
+        if names is None:
             return
-        try:
-            item = [item for item in data.items if item["name"] == name][0]
-        except IndexError:
-            _LOGGER.error("Removing of item failed: %s cannot be found", name)
-        else:
-            data.async_update(item["id"], {"name": name, "complete": True})
+        if isinstance(names, str):
+            names = [names]
+        await data.async_wait_ready()
+        changes = []
+        for name in names:
+            item = data.find_item(name)
+            if item is None:
+                _LOGGER.error("Removing of item failed: %s cannot be found", name)
+            else:
+                _LOGGER.info("Completing %s in %s", item.name, data.client.listname)
+                changes.append({"item_id": item.id, "complete": True})
+        if changes:
+            await data.async_update_items(changes)
+
+    metrics = Metrics()
+    lists = hass.data[DOMAIN] = {}
+    recorders = {}
+    for conf in config[DOMAIN]:
+        recorder = None
+        if CONF_TRACE in conf:
+            path = hass.config.path(conf[CONF_TRACE])
+            if path not in recorders:
+                recorders[path] = TraceRecorder(hass, path)
+            recorder = recorders[path]
+        client = IcaClient(
+            hass,
+            conf[CONF_USERNAME],
+            conf[CONF_PASSWORD],
+            timeout=conf[CONF_TIMEOUT],
+            api_url=conf[CONF_API_URL],
+            metrics=metrics,
+            rate_limit=conf[CONF_RATE_LIMIT],
+            max_in_flight=conf[CONF_MAX_IN_FLIGHT],
+            deadline=conf[CONF_DEADLINE],
+            recorder=recorder,
+        )
+        for listname in conf[CONF_LISTNAME]:
+            key = list_key(conf, listname)
+            lists[key] = ShoppingData(
+                hass, IcaList(client, listname), conf[CONF_SYNC_DELAY], key, conf.get(CONF_AISLES)
+            )
 
-    data = hass.data[DOMAIN] = ShoppingData(hass)
-    yield from data.async_load()
+    for data in lists.values():
+        hass.async_create_task(data.async_start())
+
+    probe = LoopLagProbe(hass.loop, metrics)
+    probe.start()
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, lambda event: probe.stop())
+    hass.async_create_task(async_load_platform(hass, "sensor", DOMAIN, {}, config))
+    hass.async_create_task(async_load_platform(hass, "todo", DOMAIN, {}, config))
 
     intent.async_register(hass, AddItemIntent())
     intent.async_register(hass, ListTopItemsIntent())
+    intent.async_register(hass, ListUsualItemsIntent())
 
     hass.services.async_register(
         DOMAIN, SERVICE_ADD_ITEM, add_item_service, schema=SERVICE_ITEM_SCHEMA
     )
     hass.services.async_register(
-        DOMAIN, SERVICE_COMPLETE_ITEM, complete_item_service, schema=SERVICE_ITEM_SCHEMA
+        DOMAIN, SERVICE_COMPLETE_ITEM, complete_item_service, schema=SERVICE_COMPLETE_ITEM_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_ADD_ITEMS,
+        add_items_service,
+        schema=SERVICE_ITEMS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
     )
 
     hass.http.register_view(ShoppingListView)
     hass.http.register_view(CreateShoppingListItemView)
+    hass.http.register_view(CreateShoppingListItemsView)
     hass.http.register_view(UpdateShoppingListItemView)
     hass.http.register_view(ClearCompletedItemsView)
+    hass.http.register_view(DiagnosticsView)
 
-    hass.components.websocket_api.async_register_command(
-        WS_TYPE_SHOPPING_LIST_ITEMS, websocket_handle_items, SCHEMA_WEBSOCKET_ITEMS
+    websocket_api.async_register_command(
+        hass, WS_TYPE_SHOPPING_LIST_ITEMS, websocket_handle_items, SCHEMA_WEBSOCKET_ITEMS
+    )
+    websocket_api.async_register_command(
+        hass, WS_TYPE_SHOPPING_LIST_ADD_ITEM, websocket_handle_add, SCHEMA_WEBSOCKET_ADD_ITEM
     )
-    hass.components.websocket_api.async_register_command(
-        WS_TYPE_SHOPPING_LIST_ADD_ITEM, websocket_handle_add, SCHEMA_WEBSOCKET_ADD_ITEM
+    websocket_api.async_register_command(
+        hass, WS_TYPE_SHOPPING_LIST_ADD_ITEMS, websocket_handle_add_items, SCHEMA_WEBSOCKET_ADD_ITEMS
     )
-    hass.components.websocket_api.async_register_command(
+    websocket_api.async_register_command(
+        hass,
         WS_TYPE_SHOPPING_LIST_UPDATE_ITEM,
         websocket_handle_update,
         SCHEMA_WEBSOCKET_UPDATE_ITEM,
     )
-    hass.components.websocket_api.async_register_command(
+    websocket_api.async_register_command(
+        hass,
+        WS_TYPE_SHOPPING_LIST_UPDATE_ITEMS,
+        websocket_handle_update_items,
+        SCHEMA_WEBSOCKET_UPDATE_ITEMS,
+    )
+    websocket_api.async_register_command(
+        hass,
         WS_TYPE_SHOPPING_LIST_CLEAR_ITEMS,
         websocket_handle_clear,
         SCHEMA_WEBSOCKET_CLEAR_ITEMS,
     )
-
-    #Connect.authenticate(icaUser, icaPassword)
+    websocket_api.async_register_command(
+        hass,
+        WS_TYPE_SHOPPING_LIST_SUBSCRIBE,
+        websocket_handle_subscribe,
+        SCHEMA_WEBSOCKET_SUBSCRIBE,
+    )
+    websocket_api.async_register_command(
+        hass,
+        WS_TYPE_SHOPPING_LIST_SEARCH,
+        websocket_handle_search,
+        SCHEMA_WEBSOCKET_SEARCH,
+    )
+    websocket_api.async_register_command(
+        hass,
+        WS_TYPE_SHOPPING_LIST_SUGGESTIONS,
+        websocket_handle_suggestions,
+        SCHEMA_WEBSOCKET_SUGGESTIONS,
+    )
 
     return True
 
 
 
+#The following functions find the ShoppingData a call is about. Every list is keyed by list_key().
+#Services, views and websocket commands take that key as `list`, and use the first configured list without it.
+@callback
+def get_shopping_data(hass, key=None):
+    """Return the ShoppingData for `key`, the first list without a key, or None if there is no such list."""
+    lists = hass.data[DOMAIN]
+    if key is None:
+        return next(iter(lists.values()))
+    return lists.get(key)
+
+
+@callback
+def service_shopping_data(hass, call):
+    """Return the ShoppingData a service call is for."""
+    data = get_shopping_data(hass, call.data.get(ATTR_LIST))
+    if data is None:
+        raise HomeAssistantError(f"Unknown shopping list: {call.data[ATTR_LIST]}")
+    return data
+
+
+
+#The following class is raised by the ShoppingData mutations when the caller passed an expected revision and the list has moved on since.
+#It carries the current revision, so the client can fetch the changes it missed and decide whether to try again.
+class RevisionMismatch(Exception):
+    """The list is not at the revision the caller expected."""
+
+    def __init__(self, revision):
+        """Initialize the error."""
+        super().__init__(f"The shopping list is at revision {revision}")
+        self.revision = revision
+
+
+
 #The following code defines a new class called ShoppingData which is responsible for holding and manipulating the shopping list data. The class has several methods, including async_add, async_update, async_clear_completed, and async_load.
+#Mutations are optimistic: they are applied to the store and handed to the listeners at once, and then to a SyncQueue, so a burst of calls is sent to ICA as one sync request.
+#When ICA answers, its rows with every still unconfirmed mutation laid over them become the list. If the sync fails the same is done from the last rows ICA confirmed,
+#which rolls the failed mutations back, and the user is told with a persistent notification.
+#Every change bumps the revision. A mutation can pass the revision it was based on, and is refused with RevisionMismatch if the list has changed since.
+#Revisions are not kept across restarts, so each ShoppingData counts from a random epoch in the high bits of the revision. A revision a client saw before a restart
+#is then never one the list has reached since, and subscribers resume with the full list and stale writes are refused.
+#Checking the revision and applying the mutation happen without yielding to the event loop, so concurrent writers need no lock, and the SyncQueue sends their batches to ICA in order.
+#ShoppingData is the one copy of the list that everything reads. The views, websocket commands, intents, todo entity and sensors are all fed from its store
+#and response cache, and are told about changes through its listeners, so none of them fetches the list on its own.
+#`ready` is a future that is resolved once the list has been loaded, from the snapshot or from ICA. Mutations and the handlers that read the list wait for it,
+#for at most READY_TIMEOUT seconds, so a call made right after startup does not act on an empty list.
 class ShoppingData:
     """Class to hold shopping list data."""
 
-    def __init__(self, hass):
+    def __init__(self, hass, client, sync_delay=DEFAULT_SYNC_DELAY, key=None, aisles_file=None):
         """Initialize the shopping list."""
         self.hass = hass
-        self.items = []
+        self.client = client
+        self.key = key or slugify(client.listname)
+        self.metrics = client.metrics
+        self.queue = SyncQueue(hass, client, sync_delay, self._async_batch_done)
+        self.store = ItemStore()
+        self.names = NameIndex()
+        self.history = PurchaseHistory(hass, self.key)
+        self.snapshot = Store(hass, SNAPSHOT_VERSION, SNAPSHOT_KEY.format(self.key), atomic_writes=True)
+        self.poller = ListPoller(hass, self)
+        self.revision = random.getrandbits(REVISION_EPOCH_BITS) << REVISION_COUNTER_BITS
+        self.changelog = deque(maxlen=CHANGELOG_SIZE)
+        self.response_cache = ResponseCache(self.store.items)
+        self.aisles_file = aisles_file
+        self.sorted = SortedItems(self.store)
+        self.sorted_cache = ResponseCache(self.sorted.items)
+        self._listeners = []
+        self._server_rows = []
+        self._rows_hash = None
+        self.ready = hass.loop.create_future()
+        self._refresh_task = None
+        self._announced = {}
+        self._baseline = False
+        self._complete = {}
+        self._cleared = {}
+        self._purchased = set()
+        self._event_ids = {}
+        self._event_timer = None
+
+    @property
+    def items(self):
+        """Return the items on the list."""
+        return self.store.items()
+
+    #The find_item method looks up an item by normalized name. Items that are added but not yet confirmed by ICA are already in the store.
+    #Case, accents and whitespace are folded, so "mjolk" finds "Mjölk", but names are never matched by spelling distance:
+    #completing an item cannot be undone from a voice command, and "Mjölk" is close to "Mjöl".
+    def find_item(self, name):
+        """Return the item called `name`, or None."""
+        return self.store.find(name)
+
+    #The _apply method takes the Rows of a response from ICA as the confirmed state of the list and applies them, with any unconfirmed mutations on top, to the store.
+    #Without a snapshot, the first rows applied are the baseline of the list. Items that were changed here before that are still announced.
+    def _apply(self, api_data):
+        """Apply the rows in `api_data` and return True if the list changed."""
+        self._server_rows = api_data["Rows"]
+        pending = None if self._baseline else set(self._event_ids)
+        with self.metrics.timer("shopping_data apply"):
+            changed = self._apply_rows(self.queue.overlay(self._server_rows))
+        if pending is not None:
+            self._async_set_baseline([item.id for item in self.store.items() if item.id not in pending])
+        return changed
+
+    #The Rows are hashed first, and rows with the same content as the ones applied last are not applied at all.
+    def _apply_rows(self, rows):
+        """Apply `rows` to the store and return True if the list changed."""
+        rows_hash = hash(tuple((row["OfflineId"], *parse_row(row)) for row in rows))
+        if rows_hash == self._rows_hash:
+            return False
+        self._rows_hash = rows_hash
+        added, changed, removed = self.store.apply_rows(rows)
+        _LOGGER.debug("Applied rows: %d added, %d changed, %d removed", len(added), len(changed), len(removed))
+        if not (added or changed or removed):
+            return False
+        self._async_record_change(added, changed, removed)
+        self.poller.async_mark_active()
+        return True
+
+    #The _async_apply_local method is called after a mutation was applied to the store, before it is sent to ICA. It records the change,
+    #so the frontend sees the mutation right away. The hash of the last applied rows no longer describes the store, so it is dropped.
+    @callback
+    def _async_apply_local(self, added, changed, removed):
+        """Record and announce a change that ICA has not confirmed yet."""
+        self._rows_hash = None
+        if not (added or changed or removed):
+            return
+        self._async_record_change(added, changed, removed)
+        self.poller.async_mark_active()
 
-    #The async_add method takes in a name as a parameter and adds it to the shopping list by calling an API using the Connect class's post_request method.
+    #The _async_batch_done method is called by the SyncQueue when ICA answered a sync request, or when it failed.
     @callback
-    async def async_add(self, name):
-        """Add a shopping list item."""
-        self.items = []
-        item = json.dumps({"CreatedRows":[{"IsStrikedOver": "false", "ProductName": name}]})
-        _LOGGER.debug("Item: " + str(item))
-        URI = "/api/user/offlineshoppinglists"
-        #api_data = Connect.post_request(URI, item)
-        api_data = await hass.async_add_executor_job(Connect.post_request, URI, item)
-        _LOGGER.debug("Adding product: " + str(item))
-        for row in api_data["Rows"]:
-            name = row["ProductName"].capitalize()
-            uuid = row["OfflineId"]
-            complete = row["IsStrikedOver"]
+    def _async_batch_done(self, payload, api_data, err):
+        """Reconcile the store with the result of a sync request."""
+        if err is None:
+            self._async_fill_created(payload, api_data)
+            self._apply(api_data)
+            self.snapshot.async_delay_save(self._snapshot_data, SNAPSHOT_SAVE_DELAY)
+            return
+        mutations = sum(len(rows) for rows in payload.values())
+        _LOGGER.warning(
+            "Could not sync %d changes to %s, rolling them back: %s", mutations, self.client.listname, err
+        )
+        persistent_notification.async_create(
+            self.hass,
+            f"{mutations} changes to {self.client.listname} could not be saved to ICA and were undone: {err}",
+            title="ICA shopping list",
+            notification_id=f"{DOMAIN}_{self.key}_sync_failed",
+        )
+        with self.metrics.timer("shopping_data rollback"):
+            self._apply_rows(self.queue.overlay(self._server_rows))
 
-            item = {"name": name, "id": uuid, "complete": complete}
-            _LOGGER.debug("Item: " + str(item))
-            self.items.append(item)
+    #ICA fills in the InternalOrder of every row it creates. For the rows this process created, that is taken into the store before the answer is applied,
+    #so ICA confirming our own adds is not a change of its own: it does not bump the revision, and a client that added with expected_revision
+    #can go on with the revision it got back. Anything else ICA changed on those rows, or on other rows, is still a change.
+    @callback
+    def _async_fill_created(self, payload, api_data):
+        """Take the order ICA gave the rows created by `payload` into the store without recording a change."""
+        created = {row["OfflineId"] for row in payload.get("CreatedRows", ())}
+        if not created:
+            return
+        filled = False
+        for row in api_data["Rows"]:
+            if row["OfflineId"] not in created or row.get("InternalOrder") is None:
+                continue
+            item = self.store.get(row["OfflineId"])
+            if item is not None and item.order is None:
+                self.store.apply_row({"OfflineId": row["OfflineId"], "InternalOrder": row["InternalOrder"]})
+                filled = True
+        if filled:
+            self.response_cache.invalidate()
+            self.sorted_cache.invalidate()
+
+    #The event is not fired for every change. Changes within EVENT_DELAY seconds are collected and announced with one event, which tells
+    #the net effect of all of them compared to the last event: which items were added, completed, otherwise changed and removed, with their ids and names.
+    #`_announced` holds the name and completion of every item as of the last event, so working that out only looks at the items that were touched.
+    #Every item is recorded in the purchase history once, the first time an event finds it completed. That includes items that were added already completed,
+    #and items that were completed and removed before an event saw them: `_complete` holds the name of every item that is completed as of the last change,
+    #and `_cleared` the ones that were removed while completed, until the next event. An item completed and cleared in the ICA app between two polls
+    #is never seen completed, and is not recorded.
+    #The first state of the list, from the snapshot or the first load from ICA, is not announced: nothing was added to the list,
+    #it was only read. Its items are taken as announced, so the first event only tells what changed after it, and its completed items
+    #as recorded, since they were bought before Home Assistant started or before the history was written.
+    @callback
+    def _async_set_baseline(self, item_ids):
+        """Take the items with `item_ids` as announced, and the completed ones as recorded in the purchase history."""
+        for item_id in item_ids:
+            item = self.store.get(item_id)
+            self._announced[item_id] = (item.name, item.complete)
+            if item.complete:
+                self._complete[item_id] = item.name
+                self._purchased.add(item_id)
+        self._baseline = True
 
-        _LOGGER.debug("Items: " + str(self.items))
-        return self.items
+    @callback
+    def _async_schedule_event(self, item_ids):
+        """Collect `item_ids` for the next event and start the window if it is not running."""
+        self._event_ids.update(dict.fromkeys(item_ids))
+        if self._event_timer is None:
+            self._event_timer = self.hass.loop.call_later(EVENT_DELAY, self._async_fire_event)
 
-    #The async_update method takes in an item ID and information (info) as parameters. It updates a shopping list item by calling an API using the Connect class's post_request method.
     @callback
-    async def async_update(self, item_id, info):
-        """Update a shopping list item."""
+    def _async_fire_event(self):
+        """Tell listeners on the bus what changed on this list since the last event."""
+        self._event_timer = None
+        added, completed, updated, removed = [], [], [], []
+        for item_id in self._event_ids:
+            item = self.store.get(item_id)
+            before = self._announced.pop(item_id, None)
+            if item is None:
+                if before is not None:
+                    removed.append({"id": item_id, "name": before[0]})
+                name = self._cleared.pop(item_id, None)
+                if name is not None and item_id not in self._purchased:
+                    self.history.async_record(name)
+                self._purchased.discard(item_id)
+                continue
+            if item.complete and item_id not in self._purchased:
+                self._purchased.add(item_id)
+                self.history.async_record(item.name)
+            self._announced[item_id] = (item.name, item.complete)
+            entry = {"id": item_id, "name": item.name}
+            if before is None:
+                added.append(entry)
+            elif item.complete and not before[1]:
+                completed.append(entry)
+            elif before != (item.name, item.complete):
+                updated.append(entry)
+        self._event_ids = {}
+        if not (added or completed or updated or removed):
+            return
+        self.hass.bus.async_fire(
+            EVENT,
+            {
+                ATTR_LIST: self.key,
+                "revision": self.revision,
+                "added": added,
+                "completed": completed,
+                "updated": updated,
+                "removed": removed,
+            },
+        )
 
-        _LOGGER.debug("Info: " + str(info))
-        self.items = []
+    #The _async_record_change method bumps the revision, keeps the change in a short changelog so subscribers can resume, and hands it to every listener.
+    @callback
+    def _async_record_change(self, added, changed, removed):
+        """Record a change to the list and notify listeners."""
+        self.revision += 1
+        for item_id in added:
+            self.names.add(self.store.get(item_id).name)
+        for item_id in changed:
+            self.names.add(self.store.get(item_id).name, 0)
+        for item_id in (*added, *changed):
+            item = self.store.get(item_id)
+            if item.complete:
+                self._complete[item_id] = item.name
+            else:
+                self._complete.pop(item_id, None)
+        for item_id in removed:
+            name = self._complete.pop(item_id, None)
+            if name is not None:
+                self._cleared[item_id] = name
+        change = {
+            "revision": self.revision,
+            "added": [self.store.get(item_id).as_dict() for item_id in added],
+            "changed": [self.store.get(item_id).as_dict() for item_id in changed],
+            "removed": removed,
+        }
+        self.changelog.append(change)
+        self.response_cache.invalidate()
+        self.sorted.update([*added, *changed, *removed])
+        self.sorted_cache.invalidate()
+        for listener in list(self._listeners):
+            listener(change)
+        self._async_schedule_event([*added, *changed, *removed])
 
-        if info.get("complete") == True or info.get("complete") == False:
-            item = {"ChangedRows": [{"OfflineId": item_id, "IsStrikedOver": info.get("complete")}]}
-        elif info.get("name"):
-            item = {"ChangedRows": [{"OfflineId": item_id, "ProductName": info.get("name")}]}
-        _LOGGER.debug("Item: " + str(item))
+    @callback
+    def async_add_listener(self, listener):
+        """Call `listener` with every change to the list. Returns a function that removes it."""
+        self._listeners.append(listener)
 
-        URI = "/api/user/offlineshoppinglists"
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(URI, json=item) as resp:
-                    api_data = await resp.json()
-            except Exception as e:
-                _LOGGER.error("Error occured while updating the item: %s", e)
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
 
-        _LOGGER.debug("Updating product: " + str(item))
-        for row in api_data["Rows"]:
-            name = row["ProductName"].capitalize()
-            uuid = row["OfflineId"]
-            complete = row["IsStrikedOver"]
+        return remove_listener
 
-            item = {"name": name, "id": uuid, "complete": complete}
-            _LOGGER.debug("Item: " + str(item))
-            self.items.append(item)
+    def _check_revision(self, expected_revision):
+        """Raise RevisionMismatch unless the list is at `expected_revision`."""
+        if expected_revision is not None and expected_revision != self.revision:
+            raise RevisionMismatch(self.revision)
 
-        _LOGGER.debug("Items: " + str(self.items))
-        return self.items
+    async def async_wait_ready(self):
+        """Wait until the list is loaded, or READY_TIMEOUT seconds have passed."""
+        if self.ready.done():
+            return
+        await asyncio.wait([self.ready], timeout=READY_TIMEOUT)
+        if not self.ready.done():
+            _LOGGER.debug("%s is not loaded after %d seconds, going ahead", self.client.listname, READY_TIMEOUT)
 
-    #The async_clear_completed method clears completed items by deleting them from the shopping list by calling an API using the Connect class's post_request method.
     @callback
-    def async_clear_completed(self, hass):
-        """Clear completed items."""
-        completed_items = []
-
-        for c_item in self.items:
-            if c_item["complete"] == True:
-                completed_items.append(c_item["id"])
-        _LOGGER.debug("Items to delete: " + str(completed_items))
-
-        self.items = []
-        item = json.dumps({ "DeletedRows": completed_items })
-        _LOGGER.debug("Item: " + str(item))
+    def _async_set_ready(self):
+        """Resolve `ready` if it is not resolved yet."""
+        if not self.ready.done():
+            self.ready.set_result(None)
+
+    def changes_since(self, revision):
+        """Return the changes after `revision`, or None if they are no longer in the changelog."""
+        if revision > self.revision:
+            return None
+        if revision == self.revision:
+            return []
+        if not self.changelog or self.changelog[0]["revision"] > revision + 1:
+            return None
+        return [change for change in self.changelog if change["revision"] > revision]
+
+    #The async_add method takes in a name as a parameter and adds it to the shopping list under a new OfflineId, then queues a CreatedRows entry for the next sync to ICA.
+    async def async_add(self, name, expected_revision=None):
+        """Add a shopping list item."""
+        await self.async_wait_ready()
+        self._check_revision(expected_revision)
+        row = {"OfflineId": str(uuid.uuid4()), "IsStrikedOver": False, "ProductName": name}
+        _LOGGER.debug("Adding product: %s", row)
+        with self.metrics.timer("shopping_data add"):
+            self.queue.async_add(row)
+            self._async_apply_local(*self.store.apply_row(row))
+        return self.items
 
-        URI = "/api/user/offlineshoppinglists"
-        api_data = Connect.post_request(URI, item)
-        _LOGGER.debug("Adding product: " + str(api_data))
-        for row in api_data["Rows"]:
-            name = row["ProductName"].capitalize()
-            uuid = row["OfflineId"]
-            complete = row["IsStrikedOver"]
+    #The async_add_items method takes a list of names, or text with one name per line. Names that are already on the list, or repeated in the input,
+    #are reported as present. The rest are added as one change and queued together, so they reach ICA as CreatedRows in a single sync request.
+    async def async_add_items(self, names, expected_revision=None):
+        """Add several shopping list items and return which were added and which were already present."""
+        await self.async_wait_ready()
+        self._check_revision(expected_revision)
+        if isinstance(names, str):
+            names = names.splitlines()
+        added, present, seen = [], [], set()
+        for name in names:
+            name = " ".join(name.split())
+            if not name:
+                continue
+            key = normalize_name(name)
+            existing = self.store.find(name)
+            if key in seen or (existing is not None and not existing.complete):
+                present.append(name)
+                continue
+            seen.add(key)
+            added.append(name)
+
+        with self.metrics.timer("shopping_data add_items"):
+            added_ids = []
+            for name in added:
+                row = {"OfflineId": str(uuid.uuid4()), "IsStrikedOver": False, "ProductName": name}
+                self.queue.async_add(row)
+                added_ids += self.store.apply_row(row)[0]
+            self._async_apply_local(added_ids, [], [])
+        return {"added": added, "present": present}
+
+    #The async_update method takes in an item ID and information (info) as parameters. It updates a shopping list item and queues a ChangedRows entry for the next sync to ICA.
+    async def async_update(self, item_id, info, expected_revision=None):
+        """Update a shopping list item."""
 
-            item = {"name": name, "id": uuid, "complete": complete}
-            _LOGGER.debug("Item: " + str(item))
-            self.items.append(item)
+        _LOGGER.debug("Info: %s", info)
+        await self.async_wait_ready()
+        self._check_revision(expected_revision)
+        if item_id not in self.store:
+            raise KeyError(item_id)
+        row = {"OfflineId": item_id}
+        if info.get("complete") is not None:
+            row["IsStrikedOver"] = info["complete"]
+        if info.get("name"):
+            row["ProductName"] = info["name"]
+
+        _LOGGER.debug("Updating product: %s", row)
+        with self.metrics.timer("shopping_data update"):
+            self.queue.async_change(row)
+            self._async_apply_local(*self.store.apply_row(row))
+        return self.items
 
-        _LOGGER.debug("Items: " + str(self.items))
+    #The async_update_items method takes a list of changes, each with an item_id and any of name, complete or delete.
+    #All of them are applied as one change and queued for one sync request to ICA. Ids that are not on the list are returned as not found.
+    async def async_update_items(self, changes, expected_revision=None):
+        """Update or delete several items and return the ids that were not found."""
+        await self.async_wait_ready()
+        self._check_revision(expected_revision)
+        changed, removed, not_found = [], [], []
+        with self.metrics.timer("shopping_data update_items"):
+            for change in changes:
+                item_id = change["item_id"]
+                if item_id not in self.store:
+                    not_found.append(item_id)
+                    continue
+                if change.get("delete"):
+                    self.queue.async_delete(item_id)
+                    self.store.remove(item_id)
+                    removed.append(item_id)
+                    continue
+                row = {"OfflineId": item_id}
+                if change.get("complete") is not None:
+                    row["IsStrikedOver"] = change["complete"]
+                if change.get("name"):
+                    row["ProductName"] = change["name"]
+                self.queue.async_change(row)
+                changed += self.store.apply_row(row)[1]
+            self._async_apply_local([], [item_id for item_id in dict.fromkeys(changed) if item_id in self.store], removed)
+        return not_found
+
+    #The async_clear_completed method removes completed items and queues them as DeletedRows for the next sync to ICA.
+    async def async_clear_completed(self, expected_revision=None):
+        """Clear completed items."""
+        await self.async_wait_ready()
+        self._check_revision(expected_revision)
+        completed_items = [item.id for item in self.store.items() if item.complete]
+        _LOGGER.debug("Items to delete: %s", completed_items)
+
+        with self.metrics.timer("shopping_data clear_completed"):
+            for item_id in completed_items:
+                self.queue.async_delete(item_id)
+                self.store.remove(item_id)
+            self._async_apply_local([], [], completed_items)
         return self.items
 
-    #The async_load method loads the items by calling an API using the Connect class's get_request method and populating the self.items list with the data returned from the API.
-    @asyncio.coroutine
-    def async_load(self):
+    #The async_load method loads the items by fetching the list from ICA and applying the returned rows to the store.
+    #If a sync request was sent while the list was being fetched, the list may or may not include it, so it is dropped and the sync response is used instead.
+    async def async_load(self):
         """Load items."""
+        with self.metrics.timer("shopping_data load"):
+            sequence = self.queue.sequence
+            api_data = await self.client.async_get_list()
+            _LOGGER.debug("Loaded %d rows from ica", len(api_data["Rows"]))
+            if sequence != self.queue.sequence:
+                _LOGGER.debug("Dropping list fetched while a sync was sent")
+                return False
+            changed = self._apply(api_data)
+        if changed:
+            self.snapshot.async_delay_save(self._snapshot_data, SNAPSHOT_SAVE_DELAY)
+        return changed
+
+    #The async_refresh method is used by the poller. It fetches the list, and the event is only fired if the content changed.
+    #Callers that ask for a refresh while one is running share it instead of starting another.
+    async def async_refresh(self):
+        """Fetch the list and return True if it changed."""
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_task(self._async_do_refresh())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _async_do_refresh(self):
+        """Fetch the list and return True if it changed."""
+        try:
+            return await self.async_load()
+        finally:
+            self._refresh_task = None
+
+    #The async_start method is run as a background task at setup. The list is ready as soon as the snapshot is loaded,
+    #or, when there is no snapshot yet, once ICA has answered or failed. The purchase history is loaded first, so no purchase is recorded before it.
+    #The history and the aisles only add to the list, so when one of them can not be read it is logged and the list is loaded without it.
+    #Whatever fails while starting, the list is made ready and polling is started, so callers never wait on a list that will not load and polling can still recover it.
+    async def async_start(self):
+        """Load the list and start polling."""
+        try:
+            await self.history.async_load()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Loading the purchase history of %s failed", self.client.listname)
+        if self.aisles_file is not None:
+            try:
+                await self.async_load_aisles()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Loading the aisles of %s failed", self.client.listname)
+        try:
+            if await self.async_load_snapshot():
+                self._async_set_ready()
+            await self.async_reconcile()
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Starting %s failed", self.client.listname)
+        finally:
+            self._async_set_ready()
+            self.poller.async_start()
+
+    #The async_load_aisles method reads the aisles of this list from the aisle file, which is keyed by list name, and sorts the items by them.
+    async def async_load_aisles(self):
+        """Load the aisles of this list."""
+        aisles = await self.hass.async_add_executor_job(load_aisles, self.hass.config.path(self.aisles_file))
+        self.sorted.order = AisleOrder(aisles.get(self.client.listname))
+        self.sorted.rebuild()
+        self.sorted_cache.invalidate()
+        _LOGGER.debug("Loaded %d aisles for %s", len(self.sorted.order.aisles), self.client.listname)
+
+    #The suggestions method returns the names bought most often and most recently that are not on the list now. It only looks at the top TOP_K names of the history.
+    def suggestions(self, limit=DEFAULT_LIMIT):
+        """Return up to `limit` usual purchases that are not on the list."""
+        suggestions = []
+        for entry in self.history.top():
+            item = self.store.find(entry["name"])
+            if item is None or item.complete:
+                suggestions.append(entry)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    #The items_cache method returns the response cache of the list in the order a client asked for, as given by the `order` parameter.
+    def items_cache(self, order=None):
+        """Return the response cache for `order`."""
+        return self.sorted_cache if order == ORDER_AISLE else self.response_cache
+
+    #The async_load_snapshot method fills the store from the snapshot that was written after ICA last confirmed the list, without talking to ICA.
+    async def async_load_snapshot(self):
+        """Load items from the local snapshot and return True if there was one."""
+        snapshot = await self.snapshot.async_load()
+        if not snapshot:
+            return False
+        self._server_rows = snapshot["rows"]
+        self.store.apply_rows(self._server_rows)
+        self._async_set_baseline([item.id for item in self.store.items()])
+        for name, count in snapshot.get("names", {}).items():
+            self.names.add(name, count)
+        for item in self.store.items():
+            self.names.add(item.name, 0)
+        self.sorted.rebuild()
+        self.response_cache.invalidate()
+        self.sorted_cache.invalidate()
+        _LOGGER.debug("Loaded %d items from snapshot", len(self.store))
+        return True
+
+    #The async_reconcile method brings the snapshot up to date with ICA, with background priority. If ICA can not be reached the snapshot keeps being served.
+    async def async_reconcile(self):
+        """Reconcile the list with ICA in the background."""
+        request_priority.set(PRIORITY_BACKGROUND)
+        try:
+            await self.async_load()
+        except IcaApiError as err:
+            _LOGGER.warning(
+                "Could not load %s from ICA, serving the local snapshot: %s", self.client.listname, err
+            )
+            return
 
-        def load():
-            """Load the items synchronously."""
-            URI = "/api/user/offlineshoppinglists"
-            api_data = Connect.get_request(URI)
-            _LOGGER.debug("Adding to ica: " + str(api_data))
-            for row in api_data["Rows"]:
-                name = row["ProductName"].capitalize()
-                uuid = row["OfflineId"]
-                complete = row["IsStrikedOver"]
-
-                item = {"name": name, "id": uuid, "complete": complete}
-                _LOGGER.debug("Item: " + str(item))
-                self.items.append(item)
-
-            _LOGGER.debug("Items: " + str(self.items))
-            return self.items
-#            return load_json(self.hass.config.path(PERSISTENCE), default=[])
-
-        self.items = yield from self.hass.async_add_job(load)
-
-    def save(self):
-        """Save the items."""
-        save_json(self.hass.config.path(PERSISTENCE), self.items)
+    #The snapshot only holds rows ICA has confirmed, so a change that was never synced does not come back after a restart.
+    #It also holds the names in the search index, so names that were bought before can be suggested after a restart.
+    @callback
+    def _snapshot_data(self):
+        """Return the data to write to the snapshot."""
+        return {
+            "rows": [
+                {"OfflineId": row["OfflineId"], **{field: value for (field, _), value in zip(ROW_FIELDS, parse_row(row))}}
+                for row in self._server_rows
+            ],
+            "names": self.names.as_dict(),
+        }
 
 
 
 #The following code defines a new class called "AddItemIntent" which is derived from the "intent.IntentHandler" class. This class is used to handle the "AddItem" intent, which allows the user to add an item to their shopping list. The class defines a single method called "async_handle" which is called when the intent is invoked.
 #The method takes an "intent_obj" as an input, which contains information about the intent such as the slots (parameters) passed by the user. The method starts by validating the slots and extracting the "item" slot from the intent_obj. Then it calls the async_add function of the ShoppingData class passing the item name.
-#Finally, the method creates a response object, sets the speech output and fires an event. The response object is returned to the user, which contains the speech output and any other information that was set.
+#Finally, the method creates a response object, sets the speech output. ShoppingData fires the event when the item is added. The response object is returned to the user, which contains the speech output and any other information that was set.
+#Spoken names are matched with whitespace, case and accents folded. A name that is already on the list is not added again, and a name that was bought before is added in the spelling it had then.
 class AddItemIntent(intent.IntentHandler):
     """Handle AddItem intents."""
 
     intent_type = INTENT_ADD_ITEM
     slot_schema = {"item": cv.string}
 
-    @asyncio.coroutine
-    def async_handle(self, intent_obj):
+    async def async_handle(self, intent_obj):
         """Handle the intent."""
         slots = self.async_validate_slots(intent_obj.slots)
-        item = slots["item"]["value"]
-        intent_obj.hass.data[DOMAIN].async_add(item)
-
+        data = get_shopping_data(intent_obj.hass)
+        await data.async_wait_ready()
+        item = data.names.canonical(slots["item"]["value"])
         response = intent_obj.create_response()
+        existing = data.store.find(item)
+        if existing is not None and not existing.complete:
+            response.async_set_speech(f"{existing.name} is already on your shopping list")
+            return response
+
+        await data.async_add(item)
         response.async_set_speech(f"I've added {item} to your shopping list")
-        intent_obj.hass.bus.async_fire(EVENT)
         return response
 
 
@@ -320,10 +971,11 @@ class ListTopItemsIntent(intent.IntentHandler):
     intent_type = INTENT_LAST_ITEMS
     slot_schema = {"item": cv.string}
 
-    @asyncio.coroutine
-    def async_handle(self, intent_obj):
+    async def async_handle(self, intent_obj):
         """Handle the intent."""
-        items = intent_obj.hass.data[DOMAIN].items[-5:]
+        data = get_shopping_data(intent_obj.hass)
+        await data.async_wait_ready()
+        items = data.items[-5:]
         response = intent_obj.create_response()
 
         if not items:
@@ -332,97 +984,297 @@ class ListTopItemsIntent(intent.IntentHandler):
             response.async_set_speech(
                 "These are the top {} items on your shopping list: {}".format(
                     min(len(items), 5),
-                    ", ".join(itm["name"] for itm in reversed(items)),
+                    ", ".join(itm.name for itm in reversed(items)),
                 )
             )
         return response
 
 
 
-#The following code This code creates a new Home Assistant view, accessible at the URL "/api/shopping_list"(See Shopping List in side bar), that retrieves and returns the current items in the shopping list. The view is named "api:shopping_list" and when a GET request is made to this endpoint, it will return the items stored in the "hass.data[DOMAIN].items" object in JSON format. This allows other parts of your system or external clients to access the shopping list data through this API endpoint.
+#The following code defines ListUsualItemsIntent, which answers "what do I usually buy". It reads the usual purchases that are not on the list
+#from the top of the purchase history, so it neither calls ICA nor goes through the whole history.
+class ListUsualItemsIntent(intent.IntentHandler):
+    """Handle UsualItems intents."""
+
+    intent_type = INTENT_USUAL_ITEMS
+
+    async def async_handle(self, intent_obj):
+        """Handle the intent."""
+        data = get_shopping_data(intent_obj.hass)
+        await data.async_wait_ready()
+        names = [entry["name"] for entry in data.suggestions(5)]
+        response = intent_obj.create_response()
+        if not names:
+            response.async_set_speech("I don't know what you usually buy yet")
+        else:
+            response.async_set_speech(f"You usually buy {', '.join(names)}")
+        return response
+
+
+
+#The following functions are shared by the views. view_shopping_data returns the list named by the `list` query parameter, the first list without one.
+#items_response answers with the items from the response cache, so a view that returns the list does not serialize it again.
+#revision_response adds the revision the list is at after the change,
+#and revision_mismatch_response turns a RevisionMismatch into a 409 Conflict that tells the client which revision the list is at.
+def view_shopping_data(request):
+    """Return the ShoppingData a request is for, or None."""
+    return get_shopping_data(request.app["hass"], request.query.get(ATTR_LIST))
+
+
+def items_response(shopping_data):
+    """Return a response with the items of `shopping_data` and its revision."""
+    response = web.Response(body=shopping_data.response_cache.body, content_type="application/json")
+    return revision_response(response, shopping_data)
+
+
+def revision_response(response, shopping_data):
+    """Add the current revision to `response`."""
+    response.headers[REVISION_HEADER] = str(shopping_data.revision)
+    return response
+
+
+def revision_mismatch_response(view, err):
+    """Return a 409 response for a RevisionMismatch."""
+    response = view.json({"message": str(err), "revision": err.revision}, 409)
+    response.headers[REVISION_HEADER] = str(err.revision)
+    return response
+
+
+
+#The following code This code creates a new Home Assistant view, accessible at the URL "/api/shopping_list"(See Shopping List in side bar), that retrieves and returns the current items in the shopping list. The view is named "api:shopping_list" and when a GET request is made to this endpoint, it will return the items of the list named by the "list" query parameter, or of the first list, in JSON format. This allows other parts of your system or external clients to access the shopping list data through this API endpoint.
+#The body comes from the ShoppingData response cache, so it is only serialized once per change. The response carries an ETag and Last-Modified,
+#a client that sends a matching If-None-Match or an up to date If-Modified-Since gets an empty 304, and large bodies are sent gzip compressed when the client accepts it.
+#The gzip and the uncompressed body have different ETags, and weak W/ tags in If-None-Match are matched as well.
+#The current revision is sent in the X-Shopping-List-Revision header, so the client can pass it back as expected_revision when it changes the list.
+#With ?order=aisle the items are returned in the order of the aisles of the store, from a second cache that is kept sorted as the list changes.
 class ShoppingListView(http.HomeAssistantView):
     """View to retrieve shopping list content."""
 
     url = "/api/shopping_list"
     name = "api:shopping_list"
 
-    @callback
-    def get(self, request):
+    async def get(self, request):
         """Retrieve shopping list items."""
-        return self.json(request.app["hass"].data[DOMAIN].items)
+        data = view_shopping_data(request)
+        if data is None:
+            return self.json_message("List not found", 404)
+        await data.async_wait_ready()
+        cache = data.items_cache(request.query.get(ATTR_ORDER))
+        body = cache.body
+        last_modified = cache.last_modified.replace(microsecond=0)
+
+        compressed = cache.compressible and "gzip" in request.headers.get("Accept-Encoding", "")
+        etag = cache.gzip_etag if compressed else cache.etag
+
+        not_modified = False
+        if request.headers.get("If-None-Match") is not None:
+            # If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+            etags = [tag.strip().removeprefix("W/") for tag in request.headers["If-None-Match"].split(",")]
+            not_modified = etag in etags or "*" in etags
+        elif request.if_modified_since is not None:
+            not_modified = request.if_modified_since >= last_modified
+
+        if not_modified:
+            response = web.Response(status=304)
+        elif compressed:
+            response = web.Response(body=cache.gzip_body, content_type="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = web.Response(body=body, content_type="application/json")
+        response.headers["ETag"] = etag
+        response.headers[REVISION_HEADER] = str(data.revision)
+        response.headers["Vary"] = "Accept-Encoding"
+        response.last_modified = last_modified
+        return response
 
 
 
 #This code defines a new view that can be accessed via the HTTP API of Home Assistant. The view is accessible at the endpoint '/api/shopping_list/item/{item_id}' and is designed to handle POST requests.
-#When the endpoint is accessed, the view will attempt to update a shopping list item by calling the 'async_update' method on the 'ShoppingData' object with the provided item_id and the data provided in the request body. If the update is successful, it will fire an event and return the updated item as a JSON object. If there is an error, such as the item not being found or the data being invalid, it will return an appropriate message and HTTP status code.
+#When the endpoint is accessed, the view will attempt to update a shopping list item by calling the 'async_update' method on the 'ShoppingData' object with the provided item_id and the data provided in the request body. If the update is successful, ShoppingData fires an event and the view returns the updated list as a JSON object. If there is an error, such as the item not being found or the data being invalid, it will return an appropriate message and HTTP status code.
+#Like the other views that change the list, it takes an optional expected_revision in the body and answers 409 with the current revision if the list has changed since.
 class UpdateShoppingListItemView(http.HomeAssistantView):
     """View to retrieve shopping list content."""
 
     url = "/api/shopping_list/item/{item_id}"
     name = "api:shopping_list:item:id"
 
-    async def post(self, request, item_id):
+    @RequestDataValidator(ITEM_UPDATE_SCHEMA.extend({vol.Optional(ATTR_EXPECTED_REVISION): int}))
+    async def post(self, request, data, item_id):
         """Update a shopping list item."""
-        data = await request.json()
+        shopping_data = view_shopping_data(request)
+        if shopping_data is None:
+            return self.json_message("List not found", 404)
 
         try:
-            item = request.app["hass"].data[DOMAIN].async_update(item_id, data)
-            request.app["hass"].bus.async_fire(EVENT)
-            return self.json(item)
+            expected_revision = data.pop(ATTR_EXPECTED_REVISION, None)
+            await shopping_data.async_update(item_id, data, expected_revision)
+            return items_response(shopping_data)
         except KeyError:
             return self.json_message("Item not found", 404)
-        except vol.Invalid:
-            return self.json_message("Item not found", 400)
+        except RevisionMismatch as err:
+            return revision_mismatch_response(self, err)
 
 
 
 #This code defines a new class called CreateShoppingListItemView, which is a subclass of http.HomeAssistantView. This class creates a new endpoint at the URL "/api/shopping_list/item" that accepts POST requests. When a POST request is made to this endpoint, the post method of the class will be called.
 #The post method uses the RequestDataValidator decorator to validate the incoming JSON data against a schema that requires a single field called "name", which must be a string. If the incoming data is not valid, a HTTPBadRequest response will be returned.
-#The post method then calls the async_add method on the ShoppingData instance stored in hass.data[DOMAIN] with the value of the "name" field from the incoming JSON as the argument. This will add the item to the shopping list.
-#Then it fires an event "EVENT" and returns the response in json format containing the item, which was just added.
+#The post method then calls the async_add method on the ShoppingData instance for the requested list with the value of the "name" field from the incoming JSON as the argument. This will add the item to the shopping list.
+#ShoppingData fires the "EVENT", and the view returns the response in json format containing the list with the item, which was just added.
 class CreateShoppingListItemView(http.HomeAssistantView):
     """View to retrieve shopping list content."""
 
     url = "/api/shopping_list/item"
     name = "api:shopping_list:item"
 
-    @RequestDataValidator(vol.Schema({vol.Required("name"): str}))
-    @asyncio.coroutine
-    def post(self, request, data):
+    @RequestDataValidator(vol.Schema({vol.Required("name"): str, vol.Optional(ATTR_EXPECTED_REVISION): int}))
+    async def post(self, request, data):
         """Create a new shopping list item."""
-        item = request.app["hass"].data[DOMAIN].async_add(data["name"])
-        request.app["hass"].bus.async_fire(EVENT)
-        return self.json(item)
+        shopping_data = view_shopping_data(request)
+        if shopping_data is None:
+            return self.json_message("List not found", 404)
+        try:
+            await shopping_data.async_add(data["name"], data.get(ATTR_EXPECTED_REVISION))
+        except RevisionMismatch as err:
+            return revision_mismatch_response(self, err)
+        return items_response(shopping_data)
+
+
+
+#This code defines CreateShoppingListItemsView, which adds many items with one POST to "/api/shopping_list/items". The body holds "items", either a list of names or text with one name per line.
+#Names that are already on the list are skipped, the rest are sent to ICA in one sync request, and the response tells which names were added and which were already present.
+class CreateShoppingListItemsView(http.HomeAssistantView):
+    """View to add several shopping list items."""
+
+    url = "/api/shopping_list/items"
+    name = "api:shopping_list:items"
+
+    @RequestDataValidator(
+        vol.Schema({vol.Required(ATTR_ITEMS): ITEMS_SCHEMA, vol.Optional(ATTR_EXPECTED_REVISION): int})
+    )
+    async def post(self, request, data):
+        """Create several shopping list items."""
+        shopping_data = view_shopping_data(request)
+        if shopping_data is None:
+            return self.json_message("List not found", 404)
+        try:
+            result = await shopping_data.async_add_items(data[ATTR_ITEMS], data.get(ATTR_EXPECTED_REVISION))
+        except RevisionMismatch as err:
+            return revision_mismatch_response(self, err)
+        return revision_response(self.json(result), shopping_data)
 
 
 
-#This code defines a new class ClearCompletedItemsView, which is a subclass of http.HomeAssistantView. The class has a single method post() which allows the user to clear all the completed items in the shopping list by sending a post request to the specified endpoint "/api/shopping_list/clear_completed". When the endpoint is hit, the post() method is executed and it calls the async_clear_completed() method from the ShoppingData class which removes all the completed items from the shopping list and then it fires an event EVENT to notify any listening component that the list has been updated. Finally, it returns a json message "Cleared completed items." to the client.
+#This code defines a new class ClearCompletedItemsView, which is a subclass of http.HomeAssistantView. The class has a single method post() which allows the user to clear all the completed items in the shopping list by sending a post request to the specified endpoint "/api/shopping_list/clear_completed". When the endpoint is hit, the post() method is executed and it calls the async_clear_completed() method from the ShoppingData class which removes all the completed items from the shopping list and fires an event EVENT to notify any listening component that the list has been updated. Finally, it returns a json message "Cleared completed items." to the client.
 class ClearCompletedItemsView(http.HomeAssistantView):
     """View to retrieve shopping list content."""
 
     url = "/api/shopping_list/clear_completed"
     name = "api:shopping_list:clear_completed"
 
-    @callback
-    def post(self, request):
+    async def post(self, request):
         """Retrieve if API is running."""
-        hass = request.app["hass"]
-        hass.data[DOMAIN].async_clear_completed()
-        hass.bus.async_fire(EVENT)
-        return self.json_message("Cleared completed items.")
+        shopping_data = view_shopping_data(request)
+        if shopping_data is None:
+            return self.json_message("List not found", 404)
+        data = await request.json() if request.body_exists else {}
+        try:
+            await shopping_data.async_clear_completed(data.get(ATTR_EXPECTED_REVISION))
+        except RevisionMismatch as err:
+            return revision_mismatch_response(self, err)
+        return revision_response(self.json_message("Cleared completed items."), shopping_data)
+
+
+
+#This code defines DiagnosticsView, which lets the user download the integration's metrics as a JSON file from "/api/ica_shopping_list/diagnostics".
+#It holds the latency histograms per ICA endpoint and per ShoppingData operation, the error, retry and re-authentication counters and the in-flight gauges of all accounts,
+#and per list the state of the sync queue and the poller.
+class DiagnosticsView(http.HomeAssistantView):
+    """View to download ICA shopping list diagnostics."""
+
+    url = "/api/ica_shopping_list/diagnostics"
+    name = "api:ica_shopping_list:diagnostics"
+
+    @callback
+    def get(self, request):
+        """Return the diagnostics."""
+        lists = request.app["hass"].data[DOMAIN]
+        response = self.json(
+            {
+                "metrics": next(iter(lists.values())).metrics.as_dict(),
+                "lists": {
+                    key: {
+                        "listname": data.client.listname,
+                        "items": len(data.store),
+                        "pending": data.store.pending,
+                        "revision": data.revision,
+                        "sync_pending": data.queue.is_pending(),
+                        "poll_interval": data.poller.interval,
+                        "history": len(data.history),
+                        "scheduler": data.client.client.scheduler.as_dict(),
+                        "circuit_breaker": data.client.client.breaker.as_dict(),
+                    }
+                    for key, data in lists.items()
+                },
+            }
+        )
+        response.headers["Content-Disposition"] = f'attachment; filename="{DOMAIN}_diagnostics.json"'
+        return response
+
+
+
+#This code defines revision_mismatch_message, the error every websocket command that changes the list sends when its expected_revision is out of date.
+#The client can then catch up with shopping_list/subscribe and the revision it last saw.
+def revision_mismatch_message(msg_id, err):
+    """Return the websocket error for a RevisionMismatch."""
+    return websocket_api.error_message(msg_id, "revision_mismatch", str(err))
+
+
+
+#This code defines result_json_message and event_json_message, which build websocket messages around JSON that is already serialized, like the items in the response cache.
+#The messages are built as text, which every supported Home Assistant version sends as it is, so the items are not parsed and serialized again for every command.
+def result_json_message(msg_id, result_json):
+    """Return a websocket result message holding `result_json`."""
+    return f'{{"id":{msg_id},"type":"result","success":true,"result":{result_json}}}'
+
+
+def event_json_message(msg_id, event_json):
+    """Return a websocket event message holding `event_json`."""
+    return f'{{"id":{msg_id},"type":"event","event":{event_json}}}'
+
+
+#This code defines items_result_message, the result of every websocket command that returns the list. The items come from the response cache as JSON bytes,
+#so they are not serialized again for every command.
+def items_result_message(msg_id, shopping_data, order=None):
+    """Return the websocket result holding the items of `shopping_data` in `order`."""
+    return result_json_message(msg_id, shopping_data.items_cache(order).body.decode())
+
+
+
+#This code defines websocket_shopping_data, which every websocket command uses to find the list named by `list` in the message, or the first list without it.
+#If there is no such list it sends the list_not_found error and returns None.
+@callback
+def websocket_shopping_data(hass, connection, msg):
+    """Return the ShoppingData a websocket command is for, or None."""
+    data = get_shopping_data(hass, msg.get(ATTR_LIST))
+    if data is None:
+        connection.send_message(websocket_api.error_message(msg["id"], "list_not_found", "List not found"))
+    return data
 
 
 
 #This code defines a websocket_handle_items() function, which is a callback function that handles incoming WebSocket messages for getting the items on the shopping list. The function takes three arguments: hass, connection, and msg.
 #hass is an instance of the Home Assistant object that represents the running instance of the Home Assistant platform. connection is an instance of a WebSocket connection, and msg is the message received via the WebSocket connection.
-#The function uses the hass.data[DOMAIN].items attribute to retrieve the items on the shopping list, and then sends a message back to the client via the WebSocket connection using the connection.send_message() method. The message sent is a result message containing the items on the shopping list.
+#The function uses the items attribute of the ShoppingData for the requested list to retrieve the items on the shopping list, and then sends a message back to the client via the WebSocket connection using the connection.send_message() method. The message sent is a result message containing the items on the shopping list.
 #This function would typically be used in conjuction with the websocket_api library and registered to handle a specific type of message. So when client will send a message with a specific type, this function will be called to handle that message.
-@callback
-def websocket_handle_items(hass, connection, msg):
+#With "order": "aisle" the items are sent in the order of the aisles of the store.
+@websocket_api.async_response
+async def websocket_handle_items(hass, connection, msg):
     """Handle get shopping_list items."""
-    connection.send_message(
-        websocket_api.result_message(msg["id"], hass.data[DOMAIN].items)
-    )
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    await data.async_wait_ready()
+    connection.send_message(items_result_message(msg["id"], data, msg.get(ATTR_ORDER)))
 
 
 
@@ -438,13 +1290,35 @@ def websocket_handle_items(hass, connection, msg):
 #    hass.bus.async_fire(EVENT)
 #    connection.send_message(websocket_api.result_message(msg["id"], item))
 
-@callback
+@websocket_api.async_response
 async def websocket_handle_add(hass, connection, msg):
     """Handle add command."""
-    if "name" not in msg:
-        return "Error: The 'name' key is missing in the message"
-    item = await hass.data[DOMAIN].async_add(msg["name"])
-    connection.send_message(websocket_api.result_message(msg["id"], item))
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    try:
+        await data.async_add(msg["name"], msg.get(ATTR_EXPECTED_REVISION))
+    except RevisionMismatch as err:
+        connection.send_message(revision_mismatch_message(msg["id"], err))
+        return
+    connection.send_message(items_result_message(msg["id"], data))
+
+
+
+#This code defines websocket_handle_add_items, which adds a list of names, or text with one name per line, in one sync request to ICA.
+#The result tells which names were added and which were already on the list.
+@websocket_api.async_response
+async def websocket_handle_add_items(hass, connection, msg):
+    """Handle adding several items to shopping_list."""
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    try:
+        result = await data.async_add_items(msg[ATTR_ITEMS], msg.get(ATTR_EXPECTED_REVISION))
+    except RevisionMismatch as err:
+        connection.send_message(revision_mismatch_message(msg["id"], err))
+        return
+    connection.send_message(websocket_api.result_message(msg["id"], result))
 
 
 
@@ -454,189 +1328,132 @@ async def websocket_handle_add(hass, connection, msg):
 @websocket_api.async_response
 async def websocket_handle_update(hass, connection, msg):
     """Handle update shopping_list item."""
+    shopping_data = websocket_shopping_data(hass, connection, msg)
+    if shopping_data is None:
+        return
     msg_id = msg.pop("id")
     item_id = msg.pop("item_id")
     msg.pop("type")
+    msg.pop(ATTR_LIST, None)
+    expected_revision = msg.pop(ATTR_EXPECTED_REVISION, None)
     data = msg
 
     try:
-        item = hass.data[DOMAIN].async_update(item_id, data)
-        hass.bus.async_fire(EVENT)
-        connection.send_message(websocket_api.result_message(msg_id, item))
+        await shopping_data.async_update(item_id, data, expected_revision)
+        connection.send_message(items_result_message(msg_id, shopping_data))
     except KeyError:
         connection.send_message(
             websocket_api.error_message(msg_id, "item_not_found", "Item not found")
         )
+    except RevisionMismatch as err:
+        connection.send_message(revision_mismatch_message(msg_id, err))
+
+
+
+#This code defines websocket_handle_update_items, which strikes, unstrikes, renames or deletes many items with one message.
+#Every entry in "changes" has an item_id and any of name, complete or delete. They are sent to ICA in one sync request and the resulting list is returned once,
+#together with the ids that were not found.
+@websocket_api.async_response
+async def websocket_handle_update_items(hass, connection, msg):
+    """Handle updating several shopping_list items."""
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    try:
+        not_found = await data.async_update_items(msg["changes"], msg.get(ATTR_EXPECTED_REVISION))
+    except RevisionMismatch as err:
+        connection.send_message(revision_mismatch_message(msg["id"], err))
+        return
+    connection.send_message(
+        result_json_message(
+            msg["id"],
+            f'{{"items":{data.response_cache.body.decode()},"not_found":{json_dumps(not_found)},"revision":{data.revision}}}',
+        )
+    )
 
 
 
 #This code is defining a new WebSocket API handle function called websocket_handle_clear. This function is intended to be used as a callback function that will be called when the client sends a WebSocket message of type "clear" to the server.
 #The function takes three arguments: hass, connection and msg. hass is the Home Assistant object, connection is the WebSocket connection object and msg is the message sent by the client.
-#The function first calls the async_clear_completed method on the hass.data[DOMAIN] object, which is expected to be an instance of the ShoppingData class, which clears all completed items from the shopping list. Then the function triggers an event EVENT and sends the response message to the client with the id of the message.
-@callback
-def websocket_handle_clear(hass, connection, msg):
+#The function first calls the async_clear_completed method on the ShoppingData for the requested list, which is expected to be an instance of the ShoppingData class, which clears all completed items from the shopping list and triggers an event EVENT. Then the function sends the response message to the client with the id of the message.
+@websocket_api.async_response
+async def websocket_handle_clear(hass, connection, msg):
     """Handle clearing shopping_list items."""
-    hass.data[DOMAIN].async_clear_completed()
-    hass.bus.async_fire(EVENT)
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    try:
+        await data.async_clear_completed(msg.get(ATTR_EXPECTED_REVISION))
+    except RevisionMismatch as err:
+        connection.send_message(revision_mismatch_message(msg["id"], err))
+        return
     connection.send_message(websocket_api.result_message(msg["id"]))
 
 
 
+#This code defines websocket_handle_subscribe, which lets a client follow the shopping list instead of re-fetching it after every shopping_list_updated event.
+#After the result, the client gets one event with the revision and all items. After that it only gets events with the added, changed and removed rows of each change.
+#A client that reconnects can send the last revision it saw. If the changes since then are still in the changelog, only those are sent instead of the full list.
+@websocket_api.async_response
+async def websocket_handle_subscribe(hass, connection, msg):
+    """Handle subscribing to shopping_list changes."""
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    await data.async_wait_ready()
+    msg_id = msg["id"]
 
-#The following is a class called Connect, which appears to be handling the authentication and communication with the ICA shopping list API. The class has several static methods such as get_request, post_request, authenticate etc.
-#The authenticate method is used to get an authentication ticket and list id from the ICA API. It uses the icaUser, icaPassword, and icaList global variables that are set in the async_setup function.
-#The get_request and post_request methods are used to make GET and POST requests to the ICA API respectively. These methods add the authentication ticket and list id to the headers of the request and handle the case of the authentication ticket expiring.
-#It also have some global variable getters such as glob_user, glob_password and glob_list. It will return the value of the global variable which is set in async_setup method.
-#Overall, this class is responsible for handling the authentication and communication with the ICA shopping list API and it appears to be used by other parts of the script to interact with the API.
-class Connect:
-
-    AUTHTICKET = None
-    listId = None
-
-    def glob_user():
-        global icaUser
-        return icaUser
-
-    def glob_password():
-        global icaPassword
-        return icaPassword
-
-    def glob_list():
-        global icaList
-        return icaList
-
-    @staticmethod
-    def get_request(uri):
-        """Do API request."""
-        if Connect.AUTHTICKET is None:
-            renewTicket = Connect.authenticate()
-            Connect.AUTHTICKET = renewTicket["authTicket"]
-            Connect.listId = renewTicket["listId"]
-
-        url = "https://handla.api.ica.se" + uri + "/" + Connect.listId
-        headers = {"Content-Type": "application/json", "AuthenticationTicket": Connect.AUTHTICKET}
-        req = requests.get(url, headers=headers)
-
-        if req.status_code == 401:
-            _LOGGER.debug("API key expired. Aquire new")
-
-            renewTicket = Connect.authenticate()
-            Connect.AUTHTICKET = renewTicket["authTicket"]
-            Connect.listId = renewTicket["listId"]
-            
-            headers = {"Content-Type": "application/json", "AuthenticationTicket": Connect.AUTHTICKET}
-            req = requests.get(url, headers=headers)
-
-            if req.status_code != requests.codes.ok:
-                _LOGGER.exception("API request returned error %d", req.status_code)
-
-            else:
-                _LOGGER.debug("API request returned OK %d", req.text)
-
-                json_data = json.loads(req.content)
-                return json_data
-
-        elif req.status_code != requests.codes.ok:
-            _LOGGER.exception("API request returned error %d", req.status_code)
-        else:
-            _LOGGER.debug("API request returned OK %d", req.text)
-
-        json_data = json.loads(req.content)
-        return json_data
-
-    @staticmethod
-    def post_request(uri, data):
-        """Do API request."""
-        if Connect.AUTHTICKET is None:
-            renewTicket = Connect.authenticate()
-            Connect.AUTHTICKET = renewTicket["authTicket"]
-            Connect.listId = renewTicket["listId"]
-
-        url = "https://handla.api.ica.se" + uri + "/" + Connect.listId + "/sync"
-        _LOGGER.debug("URL: " + url)
-        headers = {"Content-Type": "application/json", "AuthenticationTicket": Connect.AUTHTICKET}
-        req = requests.post(url, headers=headers, data=data)
-
-        if req.status_code == 401:
-            _LOGGER.debug("API key expired. Aquire new")
-
-            renewTicket = Connect.authenticate()
-            Connect.AUTHTICKET = renewTicket["authTicket"]
-            Connect.listId = renewTicket["listId"]
-            
-            headers = {"Content-Type": "application/json", "AuthenticationTicket": Connect.AUTHTICKET}
-            req = requests.post(url, headers=headers)
-
-            if req.status_code != requests.codes.ok:
-                _LOGGER.exception("API request returned error %d", req.status_code)
+    @callback
+    def forward_change(change):
+        connection.send_message(websocket_api.event_message(msg_id, change))
 
-            else:
-                _LOGGER.debug("API request returned OK %d", req.text)
+    connection.subscriptions[msg_id] = data.async_add_listener(forward_change)
+    connection.send_message(websocket_api.result_message(msg_id))
 
-                json_data = json.loads(req.content)
-                return json_data
+    changes = None
+    if "revision" in msg:
+        changes = data.changes_since(msg["revision"])
+    if changes is None:
+        connection.send_message(
+            event_json_message(msg_id, f'{{"revision":{data.revision},"items":{data.response_cache.body.decode()}}}')
+        )
+        return
+    for change in changes:
+        forward_change(change)
 
-        elif req.status_code != requests.codes.ok:
-            _LOGGER.exception("API request returned error %d", req.status_code)
-        else:
-            _LOGGER.debug("API request returned OK %d", req.text)
 
-        json_data = json.loads(req.content)
-        return json_data
 
-    @staticmethod
-    def authenticate():
-        """Do API request"""
+#This code defines websocket_handle_search, which autocompletes item names. It returns up to `limit` names that start with `query`, or any word in them does,
+#from the items on the list and the ones bought before, ranked by how often they were added. When nothing starts with the query, names spelled close to it are returned.
+#Every result tells whether the item is on the list now, with its id and whether it is completed.
+@websocket_api.async_response
+async def websocket_handle_search(hass, connection, msg):
+    """Handle searching shopping_list item names."""
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    await data.async_wait_ready()
+    results = []
+    for name in data.names.search(msg["query"], msg["limit"]):
+        item = data.store.find(name)
+        results.append(
+            {
+                "name": name,
+                "id": None if item is None else item.id,
+                "complete": None if item is None else item.complete,
+            }
+        )
+    connection.send_message(websocket_api.result_message(msg["id"], results))
 
-        icaUser = Connect.glob_user()
-        icaPassword = Connect.glob_password()
-        icaList = Connect.glob_list()
-        listId = None
 
-        url = "https://handla.api.ica.se/api/login"
-        req = requests.get(url, auth=(str(icaUser), str(icaPassword)))
 
-        if req.status_code != requests.codes.ok:
-            _LOGGER.exception("API request returned error %d", req.status_code)
-        else:
-            _LOGGER.debug("API request returned OK %d", req.text)
-            authTick = req.headers["AuthenticationTicket"]
-
-            if Connect.listId is None:
-                url = 'https://handla.api.ica.se/api/user/offlineshoppinglists'
-                headers = {"Content-Type": "application/json", "AuthenticationTicket": authTick}
-                req = requests.get(url, headers=headers)
-                response = json.loads(req.content)
-
-                for lists in response["ShoppingLists"]:
-                    if lists["Title"] == icaList:
-                        listId = lists["OfflineId"]
-            
-                if Connect.listId is None and listId is None:
-                    _LOGGER.info("Shopping-list not found: %s", icaList)
-                    newOfflineId = secrets.token_hex(4) + "-" + secrets.token_hex(2) + "-" + secrets.token_hex(2) + "-"
-                    newOfflineId = newOfflineId + secrets.token_hex(2) + "-" + secrets.token_hex(6)
-                    _LOGGER.debug("New hex-string: %s", newOfflineId)
-                    data = json.dumps({"OfflineId": newOfflineId, "Title": icaList, "SortingStore": 0})
-
-                    url = 'https://handla.api.ica.se/api/user/offlineshoppinglists'
-                    headers = {"Content-Type": "application/json", "AuthenticationTicket": authTick}
-                    
-                    _LOGGER.debug("List does not exist. Creating %s", icaList)
-                    req = requests.post(url, headers=headers, data=data)
-
-                    if req.status_code == 200:
-                        url = 'https://handla.api.ica.se/api/user/offlineshoppinglists'
-                        headers = {"Content-Type": "application/json", "AuthenticationTicket": authTick}
-                        req = requests.get(url, headers=headers)
-                        response = json.loads(req.content)
-
-                        _LOGGER.debug(response)
-
-                        for lists in response["ShoppingLists"]:
-                            if lists["Title"] == icaList:
-                                listId = lists["OfflineId"]
-                                _LOGGER.debug(icaList + " created with offlineId %s", listId)
-
-            authResult = {"authTicket": authTick, "listId": listId}
-            return authResult
+#This code defines websocket_handle_suggestions, which returns what is usually bought that is not on the list, ranked by how often and how recently it was bought.
+#Every suggestion has the name, how many times it was bought and when it was last bought, as a Unix timestamp.
+@websocket_api.async_response
+async def websocket_handle_suggestions(hass, connection, msg):
+    """Handle getting shopping_list suggestions."""
+    data = websocket_shopping_data(hass, connection, msg)
+    if data is None:
+        return
+    await data.async_wait_ready()
+    connection.send_message(websocket_api.result_message(msg["id"], data.suggestions(msg["limit"])))
@@ -0,0 +1,405 @@
+"""Async client for the ICA shopping list API."""
+import asyncio
+from datetime import timedelta
+import hashlib
+import logging
+import random
+import uuid
+
+import aiohttp
+
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+import homeassistant.util.dt as dt_util
+
+from .breaker import CircuitBreaker
+from .metrics import Metrics
+from .scheduler import (
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_RATE_LIMIT,
+    PRIORITY_INTERACTIVE,
+    RequestScheduler,
+    request_priority,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+API_URL = "https://handla.api.ica.se"
+URI_LOGIN = "/api/login"
+URI_LISTS = "/api/user/offlineshoppinglists"
+REQUEST_TIMEOUT = 10
+REQUEST_DEADLINE = 30
+REQUEST_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+TICKET_LIFETIME = timedelta(hours=1)
+TICKET_REFRESH_MARGIN = timedelta(minutes=5)
+TICKET_STORAGE_KEY = "ica_shopping_list.auth_{}"
+TICKET_STORAGE_VERSION = 1
+
+
+class IcaApiError(Exception):
+    """Raised when the ICA API returns an error."""
+
+
+class IcaAuthError(IcaApiError):
+    """Raised when the ICA API rejects the credentials."""
+
+
+class IcaUnavailableError(IcaApiError):
+    """Raised when ICA can not be reached, times out or fails with a server error."""
+
+
+class IcaCircuitOpenError(IcaUnavailableError):
+    """Raised without sending the request while the circuit breaker is open."""
+
+
+#The following class replaces the old blocking Connect class. It owns one aiohttp session for the lifetime of Home Assistant, so every call reuses
+#the same keep-alive connection to handla.api.ica.se instead of paying for a new TCP/TLS handshake. Every request gets its own timeout.
+#There is one client per ICA account, shared by every list on it. Tickets and list ids come from a TicketManager.
+#If the API answers 401 the request is sent once more with a refreshed ticket.
+#Every request is timed per endpoint in `metrics`, together with error and re-authentication counters.
+#Requests go out through a RequestScheduler, which keeps the account under its rate limit and lets interactive requests go first.
+#A call, with its login, list lookup, wait for the scheduler, retries and the second try after a 401, has to finish within `deadline` seconds.
+#The absolute deadline is computed once per call and passed to every request it makes. GET requests are safe to repeat, so they are
+#retried up to REQUEST_ATTEMPTS times with jittered exponential backoff when ICA is unavailable. POSTs are not, a sync that reached ICA before it
+#failed would create its rows twice. A CircuitBreaker makes requests fail at once while ICA keeps failing, and ShoppingData keeps serving its last list.
+#Fetches of a list that is already being fetched wait for that request instead of sending another one.
+#When a TraceRecorder is given, every request that is sent is written to its trace, including the ones that fail.
+class IcaClient:
+    """Talk to the ICA shopping list API over a pooled session."""
+
+    def __init__(
+        self,
+        hass,
+        username,
+        password,
+        timeout=REQUEST_TIMEOUT,
+        api_url=API_URL,
+        metrics=None,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+        deadline=REQUEST_DEADLINE,
+        recorder=None,
+    ):
+        """Initialize the client."""
+        self.hass = hass
+        self._session = async_create_clientsession(hass)
+        self._timeout = timeout
+        self._api_url = api_url
+        self._deadline = max(deadline, timeout)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.scheduler = RequestScheduler(hass.loop, self.metrics, rate_limit, max_in_flight=max_in_flight)
+        self.breaker = CircuitBreaker(self.metrics)
+        self.tickets = TicketManager(hass, self, username, password)
+        self.recorder = recorder
+        self._fetches = {}
+
+    def _new_deadline(self):
+        """Return the loop time a call starting now has to finish by."""
+        return self.hass.loop.time() + self._deadline
+
+    async def _request(self, method, uri, *, json=None, auth=None, ticket=None, endpoint=None, deadline=None):
+        """Do one API request before `deadline` and return the response and its decoded body."""
+        headers = {"Content-Type": "application/json"}
+        if ticket is not None:
+            headers["AuthenticationTicket"] = ticket
+        attempts = REQUEST_ATTEMPTS if method == "GET" else 1
+        loop = self.hass.loop
+        # The deadline is enforced by bounding every wait, not with asyncio.timeout, which does not mix with aiohttp's own timeouts.
+        if deadline is None:
+            deadline = self._new_deadline()
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise IcaCircuitOpenError("ICA is unavailable, not sending the request")
+            if loop.time() >= deadline:
+                raise IcaUnavailableError(f"No time left to send to ICA within {self._deadline} seconds: {uri}")
+            try:
+                async with self.scheduler.slot(deadline - loop.time()):
+                    with self.metrics.timer(f"ica {endpoint or method + ' ' + uri}"):
+                        timeout = min(self._timeout, deadline - loop.time())
+                        result = await self._send(method, uri, headers, json, auth, timeout)
+            except TimeoutError as err:
+                raise IcaUnavailableError(f"No slot to send to ICA within {self._deadline} seconds: {uri}") from err
+            except IcaUnavailableError as err:
+                self.breaker.record_failure()
+                delay = random.uniform(0, RETRY_BACKOFF * 2**attempt)
+                if attempt + 1 == attempts or loop.time() + delay >= deadline:
+                    raise
+                _LOGGER.debug("Retrying %s %s in %.2f seconds: %s", method, uri, delay, err)
+                self.metrics.increment("ica retries")
+                await asyncio.sleep(delay)
+                continue
+            except IcaApiError:
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _send(self, method, uri, headers, json, auth, timeout):
+        """Send the request, recording it when a recorder is set."""
+        if self.recorder is None:
+            return await self._send_request(method, uri, headers, json, auth, timeout)
+        start = self.hass.loop.time()
+        try:
+            resp, body = await self._send_request(method, uri, headers, json, auth, timeout)
+        except IcaApiError as err:
+            self.recorder.async_record(start, method, uri, json, None, None, err)
+            raise
+        # The login body describes the account, and is not needed to replay a trace.
+        self.recorder.async_record(start, method, uri, json, resp.status, None if uri == URI_LOGIN else body)
+        return resp, body
+
+    async def _send_request(self, method, uri, headers, json, auth, timeout):
+        """Send the request on the pooled session."""
+        try:
+            async with self._session.request(
+                method,
+                self._api_url + uri,
+                headers=headers,
+                json=json,
+                auth=auth,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as resp:
+                if resp.status == 401:
+                    raise IcaAuthError("API request returned 401")
+                if resp.status >= 500 or resp.status == 429:
+                    raise IcaUnavailableError(f"API request returned error {resp.status}")
+                if resp.status != 200:
+                    raise IcaApiError(f"API request returned error {resp.status}")
+                body = await resp.json(content_type=None)
+                return resp, body
+        except aiohttp.ClientError as err:
+            raise IcaUnavailableError(f"Error talking to ICA: {err}") from err
+        except ValueError as err:
+            raise IcaApiError(f"ICA returned a body that is not JSON: {uri}") from err
+        except TimeoutError as err:
+            raise IcaUnavailableError(f"Timeout talking to ICA: {uri}") from err
+
+    async def _authed_request(self, method, uri, listname, json=None):
+        """Do an authenticated request, refreshing the ticket once on 401."""
+        endpoint = method + " " + uri
+        deadline = self._new_deadline()
+        ticket, list_id = await self.tickets.async_get(listname, deadline)
+        try:
+            _, body = await self._request(
+                method, uri.format(list_id=list_id), json=json, ticket=ticket, endpoint=endpoint, deadline=deadline
+            )
+        except IcaAuthError:
+            _LOGGER.debug("API key expired. Aquire new")
+            self.metrics.increment("ica reauth on 401")
+            await self.tickets.async_refresh(ticket, deadline)
+            ticket, list_id = await self.tickets.async_get(listname, deadline)
+            self.metrics.increment("ica retries")
+            _, body = await self._request(
+                method, uri.format(list_id=list_id), json=json, ticket=ticket, endpoint=endpoint, deadline=deadline
+            )
+        return body
+
+    async def async_wait_shared(self, task, deadline=None):
+        """Wait for a task other calls may share, until `deadline` at most, without cancelling it."""
+        if deadline is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), deadline - self.hass.loop.time())
+        except TimeoutError as err:
+            raise IcaUnavailableError(f"No answer from ICA within {self._deadline} seconds") from err
+
+    async def async_get_list(self, listname):
+        """Fetch the shopping list called `listname`, sharing a fetch that is already in flight."""
+        task = self._fetches.get(listname)
+        if task is None:
+            task = self.hass.async_create_task(self._authed_request("GET", URI_LISTS + "/{list_id}", listname))
+            if not task.done():
+                self._fetches[listname] = task
+                task.add_done_callback(lambda _: self._fetches.pop(listname, None))
+        else:
+            self.metrics.increment("ica coalesced fetches")
+        return await asyncio.shield(task)
+
+    async def async_sync(self, listname, payload):
+        """Send Created/Changed/DeletedRows to the list called `listname` and return the new list."""
+        _LOGGER.debug("Sync: %s", payload)
+        return await self._authed_request("POST", URI_LISTS + "/{list_id}/sync", listname, payload)
+
+    async def async_login(self, username, password):
+        """Log in and return a new authentication ticket."""
+        try:
+            resp, _ = await self._request(
+                "GET", URI_LOGIN, auth=aiohttp.BasicAuth(str(username), str(password))
+            )
+        except IcaAuthError as err:
+            raise IcaAuthError("ICA rejected the username or password") from err
+        return resp.headers["AuthenticationTicket"]
+
+    async def async_find_or_create_list(self, ticket, listname):
+        """Return the OfflineId of the list called `listname`, creating it if needed."""
+        deadline = self._new_deadline()
+        _, response = await self._request("GET", URI_LISTS, ticket=ticket, deadline=deadline)
+        for lists in response["ShoppingLists"]:
+            if lists["Title"] == listname:
+                return lists["OfflineId"]
+
+        _LOGGER.info("Shopping-list not found: %s", listname)
+        list_id = str(uuid.uuid4())
+        _LOGGER.debug("List does not exist. Creating %s", listname)
+        await self._request(
+            "POST",
+            URI_LISTS,
+            json={"OfflineId": list_id, "Title": listname, "SortingStore": 0},
+            ticket=ticket,
+            deadline=deadline,
+        )
+        _LOGGER.debug("%s created with offlineId %s", listname, list_id)
+        return list_id
+
+
+#The following class owns the authentication ticket of one account and the ids of its lists. Both are persisted together with the ticket expiry,
+#so a restart does not need a new login, and a list id is only looked up the first time a list title is seen.
+#The ticket is refreshed shortly before it expires, and when ICA rejects it, also while a list is looked up. Callers that hit a 401 at the same time share one in-flight refresh instead of all logging in,
+#and lists that are loaded at the same time share one lookup of the account's lists. A caller waits for a shared login or lookup only until its own deadline,
+#while the login or lookup itself goes on for the callers that come after it.
+class TicketManager:
+    """Hand out ICA tickets and refresh them single-flight."""
+
+    def __init__(self, hass, client, username, password):
+        """Initialize the ticket manager."""
+        self.hass = hass
+        self.client = client
+        self._username = username
+        self._password = password
+        key = hashlib.sha256(str(username).encode()).hexdigest()[:12]
+        self._store = Store(hass, TICKET_STORAGE_VERSION, TICKET_STORAGE_KEY.format(key), private=True)
+        self._loaded = False
+        self._ticket = None
+        self._expires = None
+        self._lists = {}
+        self._refresh_task = None
+        self._resolve_tasks = {}
+        self._unsub_refresh = None
+
+    async def async_get(self, listname, deadline=None):
+        """Return a valid (ticket, list_id) for `listname`, logging in if needed."""
+        if not self._loaded:
+            await self._async_load()
+        ticket = self._ticket
+        if ticket is None or dt_util.utcnow() >= self._expires:
+            ticket = await self.async_refresh(ticket, deadline)
+        list_id = self._lists.get(listname)
+        if list_id is None:
+            try:
+                list_id = await self._async_resolve(ticket, listname, deadline)
+            except IcaAuthError:
+                _LOGGER.debug("Ticket rejected while looking up %s, logging in again", listname)
+                self.client.metrics.increment("ica reauth on 401")
+                ticket = await self.async_refresh(ticket, deadline)
+                list_id = await self._async_resolve(ticket, listname, deadline)
+        return ticket, list_id
+
+    async def async_refresh(self, stale_ticket, deadline=None):
+        """Replace `stale_ticket`, sharing the work with concurrent callers."""
+        if self._ticket is not None and self._ticket != stale_ticket:
+            return self._ticket
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_task(self._async_do_refresh())
+        task = self._refresh_task
+        return await self.client.async_wait_shared(task, deadline)
+
+    async def _async_resolve(self, ticket, listname, deadline=None):
+        """Look up the id of `listname`, sharing the work with concurrent callers."""
+        task = self._resolve_tasks.get(listname)
+        if task is None:
+            task = self._resolve_tasks[listname] = self.hass.async_create_task(
+                self._async_do_resolve(ticket, listname)
+            )
+        return await self.client.async_wait_shared(task, deadline)
+
+    async def _async_do_resolve(self, ticket, listname):
+        """Find or create `listname` and persist its id."""
+        request_priority.set(PRIORITY_INTERACTIVE)
+        try:
+            list_id = self._lists[listname] = await self.client.async_find_or_create_list(ticket, listname)
+            self._store.async_delay_save(self._data_to_save, 0)
+            return list_id
+        finally:
+            self._resolve_tasks.pop(listname, None)
+
+    async def _async_load(self):
+        """Restore the persisted ticket and list ids."""
+        self._loaded = True
+        data = await self._store.async_load()
+        if not data:
+            return
+        self._lists = data.get("lists", {})
+        expires = dt_util.parse_datetime(data.get("expires") or "")
+        if data.get("ticket") and expires and expires > dt_util.utcnow():
+            self._ticket = data["ticket"]
+            self._expires = expires
+            self._async_schedule_refresh()
+
+    async def _async_do_refresh(self):
+        """Log in and persist the new ticket."""
+        # Everything on the account waits for the login, so it is never queued behind background work.
+        request_priority.set(PRIORITY_INTERACTIVE)
+        self.client.metrics.increment("ica logins")
+        try:
+            self._ticket = await self.client.async_login(self._username, self._password)
+            self._expires = dt_util.utcnow() + TICKET_LIFETIME
+            self._store.async_delay_save(self._data_to_save, 0)
+            self._async_schedule_refresh()
+            return self._ticket
+        finally:
+            self._refresh_task = None
+
+    @callback
+    def _async_schedule_refresh(self):
+        """Refresh the ticket a little before it expires."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+        delay = (self._expires - TICKET_REFRESH_MARGIN - dt_util.utcnow()).total_seconds()
+        self._unsub_refresh = async_call_later(self.hass, max(delay, 0), self._async_refresh_timer)
+
+    @callback
+    def _async_refresh_timer(self, _now):
+        """Start a proactive refresh."""
+        self._unsub_refresh = None
+        if self._refresh_task is None:
+            self._refresh_task = self.hass.async_create_task(self._async_proactive_refresh())
+
+    async def _async_proactive_refresh(self):
+        """Refresh ahead of expiry and log failures instead of raising them."""
+        try:
+            await self._async_do_refresh()
+        except IcaApiError as err:
+            _LOGGER.warning("Could not refresh the ICA ticket: %s", err)
+
+    @callback
+    def _data_to_save(self):
+        """Return the data to persist."""
+        return {
+            "ticket": self._ticket,
+            "expires": self._expires.isoformat() if self._expires else None,
+            "lists": self._lists,
+        }
+
+
+
+#The following class is the view of one list through the client of its account. ShoppingData and its SyncQueue talk to ICA through it,
+#so they do not need to know which account or list title they belong to.
+class IcaList:
+    """One shopping list on an ICA account."""
+
+    def __init__(self, client, listname):
+        """Initialize the list."""
+        self.client = client
+        self.listname = listname
+        self.metrics = client.metrics
+
+    async def async_get_list(self):
+        """Fetch the list."""
+        return await self.client.async_get_list(self.listname)
+
+    async def async_sync(self, payload):
+        """Send Created/Changed/DeletedRows to the list and return the new list."""
+        return await self.client.async_sync(self.listname, payload)
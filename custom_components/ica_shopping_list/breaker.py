@@ -0,0 +1,69 @@
+"""Circuit breaker that stops sending requests to an ICA that keeps failing."""
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+#The following class counts consecutive failures of one ICA account. After FAILURE_THRESHOLD of them it opens, and every request fails at once
+#instead of waiting for its own timeout. After RESET_TIMEOUT seconds it lets one trial request through: if that one succeeds it closes again,
+#if it fails it stays open for another RESET_TIMEOUT. Only failures that say ICA is down count, a 401 or a 404 shows ICA is there.
+class CircuitBreaker:
+    """Fail fast while ICA is down."""
+
+    def __init__(self, metrics, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        """Initialize the breaker."""
+        self._metrics = metrics
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._opened = None
+        self._trial = None
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        if self.state == STATE_CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == STATE_OPEN and now - self._opened >= self.reset_timeout:
+            self.state = STATE_HALF_OPEN
+            self._trial = None
+        # A trial that never reported back, because its caller was cancelled, does not block the breaker for good.
+        if self.state == STATE_HALF_OPEN and (self._trial is None or now - self._trial >= self.reset_timeout):
+            self._trial = now
+            return True
+        self._metrics.increment("ica circuit rejected")
+        return False
+
+    def record_success(self):
+        """Close the breaker after a request reached ICA."""
+        if self.state != STATE_CLOSED:
+            _LOGGER.info("ICA is reachable again")
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._trial = None
+
+    def record_failure(self):
+        """Count a failure and open the breaker when there are too many."""
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED and self.failures >= self.failure_threshold):
+            if self.state == STATE_CLOSED:
+                _LOGGER.warning(
+                    "ICA failed %d times in a row, not sending requests for %d seconds", self.failures, self.reset_timeout
+                )
+            self._metrics.increment("ica circuit opened")
+            self.state = STATE_OPEN
+            self._opened = time.monotonic()
+            self._trial = None
+
+    def as_dict(self):
+        """Return the state of the breaker, for diagnostics."""
+        return {"state": self.state, "failures": self.failures}
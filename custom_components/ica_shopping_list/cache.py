@@ -0,0 +1,63 @@
+"""Pre-serialized response cache for the shopping list view."""
+import gzip
+import hashlib
+
+import homeassistant.util.dt as dt_util
+
+from .model import items_json
+
+COMPRESS_MIN_SIZE = 1024
+
+
+#The following class keeps the JSON body of GET /api/shopping_list serialized between changes, together with its ETag and the time it was built.
+#ShoppingData calls invalidate() whenever the list changes. The body is joined from the JSON every item keeps of itself, so only changed items are encoded again. The gzip version is only built the first time a client asks for it.
+#The gzip version is a different representation and has its own strong ETag, the ETag of the body with a -gz suffix.
+class ResponseCache:
+    """Cache the serialized shopping list."""
+
+    def __init__(self, get_items):
+        """Initialize the cache."""
+        self._get_items = get_items
+        self._body = None
+        self._gzip = None
+        self.etag = None
+        self.last_modified = dt_util.utcnow()
+
+    def invalidate(self):
+        """Drop the cached body after the list changed."""
+        self._body = None
+        self._gzip = None
+        self.last_modified = dt_util.utcnow()
+
+    @property
+    def body(self):
+        """Return the serialized list, building it if needed."""
+        self._build()
+        return self._body
+
+    @property
+    def compressible(self):
+        """Return True if the list is large enough to be worth compressing."""
+        return len(self.body) >= COMPRESS_MIN_SIZE
+
+    @property
+    def gzip_etag(self):
+        """Return the ETag of the gzip compressed list."""
+        self._build()
+        return self.etag[:-1] + '-gz"'
+
+    @property
+    def gzip_body(self):
+        """Return the gzip compressed list, or None if it is too small to be worth it."""
+        body = self.body
+        if not self.compressible:
+            return None
+        if self._gzip is None:
+            self._gzip = gzip.compress(body, compresslevel=6)
+        return self._gzip
+
+    def _build(self):
+        """Serialize the list and compute its ETag if the list changed since."""
+        if self._body is None:
+            self._body = items_json(self._get_items())
+            self.etag = '"' + hashlib.blake2b(self._body, digest_size=8).hexdigest() + '"'
@@ -0,0 +1,170 @@
+"""Purchase history and top-K suggestions for a shopping list."""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.helpers.storage import STORAGE_DIR
+
+from .store import normalize_name
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_FILE = "ica_shopping_list.history_{}.jsonl"
+HISTORY_FLUSH_DELAY = 5
+COMPACT_LINES = 1000
+TOP_K = 20
+HALF_LIFE = 30 * 24 * 3600
+SCORE_EPOCH = 1704067200
+
+
+def _weight(timestamp):
+    """Return the weight of a purchase at `timestamp`.
+
+    Weights double every HALF_LIFE seconds, which ranks purchases the same as letting older ones decay, without ever touching stored scores.
+    """
+    return 2 ** ((timestamp - SCORE_EPOCH) / HALF_LIFE)
+
+
+#The following class remembers what was bought from one list, after the items have been cleared from it. Every purchase is appended as one JSON line to
+#a file in .storage. Purchases are written in batches HISTORY_FLUSH_DELAY seconds apart, and once COMPACT_LINES lines have been appended
+#the file is rewritten with one line per name holding its count, score and last purchase.
+#Each name has a score that adds up the weight of every purchase, so frequent and recent purchases rank high. Scores only grow, so the K best names are kept in a small list,
+#and a purchase either moves its name within that list or replaces its lowest entry. Suggestions are read from that list alone, never from the whole history.
+class PurchaseHistory:
+    """Log purchases and keep the most bought names."""
+
+    def __init__(self, hass, key):
+        """Initialize the history."""
+        self.hass = hass
+        self.path = hass.config.path(STORAGE_DIR, HISTORY_FILE.format(key))
+        self._stats = {}
+        self._top = []
+        self._pending = []
+        self._lines = 0
+        self._flush_handle = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        """Return the number of names that were bought."""
+        return len(self._stats)
+
+    async def async_load(self):
+        """Load the history from disk and compact it if it has grown."""
+        # Purchases recorded after a failed load are still written when Home Assistant stops.
+        self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_flush)
+        self._stats, self._lines = await self.hass.async_add_executor_job(self._load)
+        self._top = sorted(((stats["score"], name) for name, stats in self._stats.items()), reverse=True)[:TOP_K]
+        if self._lines >= len(self._stats) + COMPACT_LINES:
+            await self._async_compact()
+        _LOGGER.debug("Loaded purchase history with %d names", len(self._stats))
+
+    @callback
+    def async_record(self, name, timestamp=None):
+        """Record a purchase of `name`."""
+        key = normalize_name(name)
+        if not key:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        weight = _weight(timestamp)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {"name": name, "count": 0, "score": 0.0, "last": timestamp}
+        stats["count"] += 1
+        stats["score"] += weight
+        stats["last"] = timestamp
+        self._update_top(key, stats["score"])
+        self._pending.append({"name": name, "count": 1, "score": weight, "last": timestamp})
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_later(
+                HISTORY_FLUSH_DELAY, lambda: self.hass.async_create_task(self._async_flush())
+            )
+
+    def top(self, limit=TOP_K):
+        """Return up to `limit` of the most bought names, best first, with their count and last purchase."""
+        return [
+            {"name": self._stats[key]["name"], "count": self._stats[key]["count"], "last": self._stats[key]["last"]}
+            for _, key in self._top[:limit]
+        ]
+
+    def _update_top(self, key, score):
+        """Put `key` with its new score where it belongs among the K best names."""
+        top = self._top
+        for index, (_, top_key) in enumerate(top):
+            if top_key == key:
+                del top[index]
+                break
+        else:
+            if len(top) >= TOP_K:
+                if score <= top[-1][0]:
+                    return
+                top.pop()
+        index = len(top)
+        while index and top[index - 1][0] < score:
+            index -= 1
+        top.insert(index, (score, key))
+
+    async def _async_flush(self, _event=None):
+        """Append the purchases that were not written yet."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self._lines += len(pending)
+            await self.hass.async_add_executor_job(self._append, pending)
+        if self._lines >= len(self._stats) + COMPACT_LINES:
+            await self._async_compact()
+
+    async def _async_compact(self):
+        """Rewrite the file with one line per name."""
+        async with self._lock:
+            # The stats already hold the purchases that are waiting to be appended.
+            self._pending = []
+            records = [dict(stats) for stats in self._stats.values()]
+            self._lines = len(records)
+            await self.hass.async_add_executor_job(self._write, records)
+        _LOGGER.debug("Compacted purchase history to %d lines", len(records))
+
+    def _load(self):
+        """Read the file and return the stats per name and the number of lines."""
+        stats, lines = {}, 0
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    # A line cut off by a crash, or edited by hand, is skipped rather than losing the rest of the history.
+                    try:
+                        record = json.loads(line)
+                        key = normalize_name(record["name"])
+                        record = {field: record[field] for field in ("name", "count", "score", "last")}
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+                    lines += 1
+                    old = stats.get(key)
+                    if old is None:
+                        stats[key] = record
+                    else:
+                        old["count"] += record["count"]
+                        old["score"] += record["score"]
+                        old["last"] = max(old["last"], record["last"])
+        except FileNotFoundError:
+            pass
+        return stats, lines
+
+    def _append(self, records):
+        """Append `records` to the file."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def _write(self, records):
+        """Replace the file with `records`."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        os.replace(tmp_path, self.path)
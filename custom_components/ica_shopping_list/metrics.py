@@ -0,0 +1,130 @@
+"""Latency histograms, counters and gauges for the ICA integration."""
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+import time
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+#The following class is a fixed-bucket latency histogram. Observing a value is one bisect and two additions,
+#so it can sit on every request without allocating. Percentiles are estimated from the bucket bounds.
+class Histogram:
+    """Latency histogram in milliseconds."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        """Initialize the histogram."""
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        """Record one value."""
+        self.buckets[bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the given percentile."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def as_dict(self):
+        """Return a summary of the histogram."""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "max_ms": round(self.max, 1),
+            "buckets": dict(zip([*map(str, BUCKETS_MS), "inf"], self.buckets)),
+        }
+
+
+#The following class holds every metric of one ICA client and the ShoppingData that uses it.
+#timer() wraps an operation: it keeps the in-flight gauge, records the duration in the histogram for the name and counts failures.
+class Metrics:
+    """Registry of histograms, counters and in-flight gauges."""
+
+    def __init__(self):
+        """Initialize the registry."""
+        self.histograms = {}
+        self.counters = Counter()
+        self.in_flight = Counter()
+
+    def histogram(self, name):
+        """Return the histogram called `name`, creating it if needed."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def increment(self, name, amount=1):
+        """Increment the counter called `name`."""
+        self.counters[name] += amount
+
+    @contextmanager
+    def timer(self, name):
+        """Time the wrapped block under `name`."""
+        self.in_flight[name] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.counters[f"{name} errors"] += 1
+            raise
+        finally:
+            self.in_flight[name] -= 1
+            self.histogram(name).observe((time.perf_counter() - start) * 1000)
+
+    def as_dict(self):
+        """Return every metric, for diagnostics."""
+        return {
+            "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+            "counters": dict(self.counters),
+            "in_flight": {name: value for name, value in self.in_flight.items() if value},
+        }
+
+
+#The following class samples how long a callback waits in the event loop queue before it runs. When the list feels slow and
+#the ICA histograms look fine, a high loop lag points at something else blocking Home Assistant's event loop.
+class LoopLagProbe:
+    """Sample event loop lag into the `event loop lag` histogram."""
+
+    def __init__(self, loop, metrics, interval=10):
+        """Initialize the probe."""
+        self._loop = loop
+        self._metrics = metrics
+        self._interval = interval
+        self._handle = None
+
+    def start(self):
+        """Start sampling."""
+        self._handle = self._loop.call_later(self._interval, self._sample)
+
+    def stop(self):
+        """Stop sampling."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _sample(self):
+        """Queue a callback and measure how long it waits."""
+        self._handle = self._loop.call_soon(self._measure, time.perf_counter())
+
+    def _measure(self, queued):
+        """Record the wait and schedule the next sample."""
+        self._metrics.histogram("event loop lag").observe((time.perf_counter() - queued) * 1000)
+        self._handle = self._loop.call_later(self._interval, self._sample)
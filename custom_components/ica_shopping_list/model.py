@@ -0,0 +1,65 @@
+"""Typed shopping list item and the parser for ICA rows."""
+from homeassistant.helpers.json import json_bytes
+
+#The fields of an ICA row that make up an item, in the order parse_row returns them, with the value a new row gets when it leaves one out.
+ROW_FIELDS = (("ProductName", None), ("IsStrikedOver", False), ("Quantity", None), ("InternalOrder", None))
+
+
+def parse_row(row, old=None):
+    """Return the item fields of an ICA row as a tuple.
+
+    Fields missing from `row` keep their value in `old`, the fields returned for the row before it.
+    """
+    if old is None:
+        return tuple(row.get(field, default) for field, default in ROW_FIELDS)
+    return tuple(row.get(field, value) for (field, _), value in zip(ROW_FIELDS, old))
+
+
+#The following class is one item on the list. It has slots instead of a __dict__, so a large list costs one small object per row.
+#The item keeps its JSON encoding once it has been built, until the item changes, so serializing the list after a change only encodes the rows that changed.
+#Home Assistant's JSON encoder falls back to as_dict(), so items can also be handed to it directly.
+class ShoppingItem:
+    """An item on the shopping list."""
+
+    __slots__ = ("id", "name", "complete", "quantity", "order", "_json")
+
+    def __init__(self, item_id, fields):
+        """Initialize the item from the fields returned by parse_row."""
+        self.id = item_id
+        self._json = None
+        self.update(fields)
+
+    def update(self, fields):
+        """Set the item from the fields returned by parse_row."""
+        product_name, complete, quantity, order = fields
+        self.name = product_name.capitalize()
+        self.complete = bool(complete)
+        self.quantity = quantity
+        self.order = order
+        self._json = None
+
+    def as_dict(self):
+        """Return the item as a dict."""
+        return {
+            "name": self.name,
+            "id": self.id,
+            "complete": self.complete,
+            "quantity": self.quantity,
+            "order": self.order,
+        }
+
+    @property
+    def json(self):
+        """Return the item encoded as JSON bytes."""
+        if self._json is None:
+            self._json = json_bytes(self.as_dict())
+        return self._json
+
+    def __repr__(self):
+        """Return the representation."""
+        return f"<ShoppingItem {self.id} {self.name!r} complete={self.complete}>"
+
+
+def items_json(items):
+    """Return `items` encoded as a JSON array."""
+    return b"[" + b",".join([item.json for item in items]) + b"]"
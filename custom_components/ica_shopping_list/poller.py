@@ -0,0 +1,85 @@
+"""Background poller that picks up changes made outside Home Assistant."""
+import logging
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from .api import IcaApiError
+from .scheduler import PRIORITY_BACKGROUND, request_priority
+
+_LOGGER = logging.getLogger(__name__)
+
+POLL_INTERVAL_MIN = 15
+POLL_INTERVAL_MAX = 300
+POLL_BACKOFF = 2
+
+
+#The following class fetches the list from ICA in the background, so edits made in the ICA app show up without a restart.
+#ShoppingData hashes the returned Rows and only updates the store and fires the event when the hash differs from the last response.
+#Polls are sent with background priority, so they wait for user actions on the same account.
+#The interval starts at POLL_INTERVAL_MIN after any activity and is multiplied by POLL_BACKOFF after every unchanged poll, up to POLL_INTERVAL_MAX.
+#A poll that fails counts as unchanged, whatever the error, so polling always goes on.
+class ListPoller:
+    """Poll the ICA list with an adaptive interval."""
+
+    def __init__(self, hass, data, interval_min=POLL_INTERVAL_MIN, interval_max=POLL_INTERVAL_MAX):
+        """Initialize the poller."""
+        self.hass = hass
+        self.data = data
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.interval = interval_min
+        self._unsub = None
+        self._stopped = False
+
+    @callback
+    def async_start(self):
+        """Schedule the first poll."""
+        self.hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_stop)
+        self._async_schedule()
+
+    @callback
+    def async_mark_active(self):
+        """Go back to the short interval after the list changed."""
+        if self.interval == self.interval_min:
+            return
+        self.interval = self.interval_min
+        self._async_schedule()
+
+    @callback
+    def _async_schedule(self):
+        """Schedule the next poll after the current interval."""
+        if self._stopped:
+            return
+        if self._unsub is not None:
+            self._unsub()
+        self._unsub = async_call_later(self.hass, self.interval, self._async_poll)
+
+    async def _async_poll(self, _now):
+        """Fetch the list and adjust the interval."""
+        request_priority.set(PRIORITY_BACKGROUND)
+        self._unsub = None
+        changed = False
+        if not self.data.queue.is_pending():
+            try:
+                changed = await self.data.async_refresh()
+            except IcaApiError as err:
+                _LOGGER.debug("Polling ICA failed: %s", err)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Polling ICA failed")
+        if changed:
+            self.interval = self.interval_min
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF, self.interval_max)
+        _LOGGER.debug("Next poll in %d seconds", self.interval)
+        if self._unsub is None:
+            self._async_schedule()
+
+    @callback
+    def _async_stop(self, _event):
+        """Stop polling."""
+        self._stopped = True
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
@@ -0,0 +1,124 @@
+"""Rate limit and prioritize the requests an ICA client sends."""
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import heapq
+from itertools import count
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+DEFAULT_RATE_LIMIT = 5.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_IN_FLIGHT = 4
+
+# Work that nobody is waiting for, like polling and reconciling, sets this to PRIORITY_BACKGROUND in its own task.
+request_priority = ContextVar("ica_request_priority", default=PRIORITY_INTERACTIVE)
+
+
+#The following class sits in front of every request one IcaClient sends. A request needs a token from a token bucket that holds `burst` tokens
+#and refills at `rate` tokens per second, and a free slot under `max_in_flight`. Requests that can not go right away wait in a heap ordered by
+#priority and arrival, so a user adding an item goes ahead of a background poll that is waiting for the same slot.
+#The priority is taken from request_priority, so it follows the task that makes the request without being passed through every call.
+class RequestScheduler:
+    """Token bucket and in-flight cap with priority ordering."""
+
+    def __init__(self, loop, metrics, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """Initialize the scheduler."""
+        self._loop = loop
+        self._metrics = metrics
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._tokens = float(burst)
+        self._updated = loop.time()
+        self._waiting = []
+        self._order = count()
+        self._timer = None
+
+    @property
+    def waiting(self):
+        """Return the number of requests waiting for a slot."""
+        return sum(1 for _, _, future in self._waiting if not future.done())
+
+    @asynccontextmanager
+    async def slot(self, timeout=None):
+        """Wait for a token and a free slot, at most `timeout` seconds, and hold the slot while the block runs."""
+        priority = request_priority.get()
+        start = time.perf_counter()
+        if not self._waiting and self.in_flight < self.max_in_flight and self._take_token():
+            self.in_flight += 1
+        else:
+            self._metrics.increment(f"scheduler queued {PRIORITY_NAMES[priority]}")
+            future = self._loop.create_future()
+            heapq.heappush(self._waiting, (priority, next(self._order), future))
+            self._dispatch()
+            try:
+                await asyncio.wait_for(future, timeout)
+            except BaseException:
+                # The slot may have been handed over just before the caller was cancelled.
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        self._metrics.histogram(f"scheduler wait {PRIORITY_NAMES[priority]}").observe(
+            (time.perf_counter() - start) * 1000
+        )
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        """Free a slot and let the next request go."""
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _take_token(self):
+        """Refill the bucket and take a token if there is one."""
+        now = self._loop.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _dispatch(self):
+        """Hand slots to waiting requests in priority order."""
+        while self._waiting:
+            future = self._waiting[0][2]
+            if future.done():
+                heapq.heappop(self._waiting)
+                continue
+            if self.in_flight >= self.max_in_flight:
+                return
+            if not self._take_token():
+                if self._timer is None:
+                    self._metrics.increment("scheduler throttled")
+                    self._timer = self._loop.call_later((1 - self._tokens) / self.rate, self._timer_fired)
+                return
+            heapq.heappop(self._waiting)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _timer_fired(self):
+        """Retry after the bucket had time to refill."""
+        self._timer = None
+        self._dispatch()
+
+    def as_dict(self):
+        """Return the state of the scheduler, for diagnostics."""
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "tokens": round(self._tokens, 2),
+        }
@@ -0,0 +1,134 @@
+"""Name index for searching and autocompleting shopping list items."""
+from bisect import bisect_left, insort
+from collections import Counter
+import difflib
+import heapq
+
+from .store import normalize_name
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+SHORT_PREFIX = 2
+FUZZY_CUTOFF = 0.75
+FUZZY_CANDIDATES = 50
+CACHE_SIZE = 256
+
+
+def _trigrams(key):
+    """Return the three-letter sequences of `key`, with its start and end marked."""
+    padded = f" {key} "
+    return {padded[index : index + 3] for index in range(len(padded) - 2)}
+
+
+#The following class indexes every name that has been on the list, both the items on it now and the ones bought before.
+#Names are keyed by normalize_name, so "Mjölk", "mjölk " and "mjolk" are one name, shown in the spelling it was first added with.
+#The full key and each of its words are kept in one sorted list of (token, key) pairs, so a prefix lookup is a bisect and a scan over the matches only.
+#Matches are ranked by how many times the name was added. Queries of up to SHORT_PREFIX letters match the most names, so for every prefix of that length
+#the best MAX_LIMIT names are kept ranked as names are added and counted. Those queries read the top of that list instead of ranking every match,
+#and longer queries, which match few names, scan and rank their matches. When no name starts with the query, close matches are found with difflib instead,
+#among the FUZZY_CANDIDATES names that share the most three-letter sequences with it, so a miss does not compare the query with every name ever seen.
+#ShoppingData adds names as items are added or renamed, so the index is never rebuilt. Searches are far more frequent than additions,
+#so the results of the last CACHE_SIZE searches are kept until a new name is added, which makes short, broad queries cheap while typing.
+class NameIndex:
+    """Index item names for prefix and fuzzy search."""
+
+    def __init__(self):
+        """Initialize the index."""
+        self._names = {}
+        self._counts = {}
+        self._tokens = []
+        self._trigrams = {}
+        self._top = {}
+        self._cache = {}
+
+    def __len__(self):
+        """Return the number of names."""
+        return len(self._names)
+
+    def add(self, name, count=1):
+        """Add `name`, counting it `count` more times."""
+        key = normalize_name(name)
+        if not key:
+            return
+        if key not in self._counts:
+            self._cache.clear()
+            self._names[key] = " ".join(name.split())
+            self._counts[key] = count
+            for trigram in _trigrams(key):
+                self._trigrams.setdefault(trigram, []).append(key)
+            for token in {key, *key.split()}:
+                insort(self._tokens, (token, key))
+        elif count:
+            # Ranks change, the matches do not.
+            self._cache.clear()
+            self._counts[key] += count
+        else:
+            return
+        self._update_top(key)
+
+    def _update_top(self, key):
+        """Move `key` up in the ranked lists of the short prefixes of its words, after it was added or counted."""
+        # Counts only grow, so no other name moves past another, and `key` is the only one that can enter a list.
+        rank = self._rank(key)
+        for prefix in {token[:length] for token in {key, *key.split()} for length in range(1, SHORT_PREFIX + 1)}:
+            top = self._top.setdefault(prefix, [])
+            if len(top) == MAX_LIMIT and rank > self._rank(top[-1]):
+                continue
+            if key in top:
+                top.remove(key)
+            insort(top, key, key=self._rank)
+            del top[MAX_LIMIT:]
+
+    def canonical(self, name):
+        """Return the known spelling of `name`, or `name` if it is new."""
+        return self._names.get(normalize_name(name), name)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Return up to `limit` names starting with `query`, or close to it, most added first."""
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+        cached = self._cache.get((prefix, limit))
+        if cached is not None:
+            return list(cached)
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.clear()
+        result = self._cache[(prefix, limit)] = self._search(prefix, limit)
+        return list(result)
+
+    def _search(self, prefix, limit):
+        """Search without the cache."""
+        if len(prefix) <= SHORT_PREFIX and limit <= MAX_LIMIT:
+            top = self._top.get(prefix)
+            if not top:
+                return self.closest(prefix, limit)
+            return [self._names[key] for key in top[:limit]]
+        tokens = self._tokens
+        index = bisect_left(tokens, (prefix,))
+        found = set()
+        while index < len(tokens) and tokens[index][0].startswith(prefix):
+            found.add(tokens[index][1])
+            index += 1
+        if not found:
+            return self.closest(prefix, limit)
+        return [self._names[key] for key in heapq.nsmallest(limit, found, key=self._rank)]
+
+    def closest(self, name, limit=DEFAULT_LIMIT):
+        """Return up to `limit` names that are spelled close to `name`, closest first."""
+        key = normalize_name(name)
+        if not key:
+            return []
+        shared = Counter()
+        for trigram in _trigrams(key):
+            shared.update(self._trigrams.get(trigram, ()))
+        candidates = heapq.nlargest(FUZZY_CANDIDATES, shared, key=shared.get)
+        keys = difflib.get_close_matches(key, candidates, limit, FUZZY_CUTOFF)
+        return [self._names[key] for key in keys]
+
+    def as_dict(self):
+        """Return every name with its count."""
+        return {self._names[key]: count for key, count in self._counts.items()}
+
+    def _rank(self, key):
+        """Return the sort key of a match."""
+        return (-self._counts[key], key)
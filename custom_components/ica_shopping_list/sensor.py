@@ -0,0 +1,184 @@
+"""Diagnostic sensors for the ICA shopping list."""
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable
+
+from homeassistant.components.sensor import (
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import UnitOfTime
+from homeassistant.core import callback
+from homeassistant.helpers.entity import EntityCategory
+
+from . import DOMAIN, get_shopping_data
+from .metrics import Histogram
+
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+def _merged(metrics, prefix):
+    """Return one histogram with every histogram whose name starts with `prefix`."""
+    merged = Histogram()
+    for name, histogram in metrics.histograms.items():
+        if name.startswith(prefix):
+            merged.count += histogram.count
+            merged.total += histogram.total
+            merged.max = max(merged.max, histogram.max)
+            merged.buckets = [a + b for a, b in zip(merged.buckets, histogram.buckets)]
+    return merged
+
+
+def _request_summaries(metrics):
+    """Return a summary per ICA endpoint."""
+    return {
+        name: {key: value for key, value in histogram.as_dict().items() if key != "buckets"}
+        for name, histogram in metrics.histograms.items()
+        if name.startswith("ica ")
+    }
+
+
+@dataclass(frozen=True, kw_only=True)
+class IcaMetricSensorEntityDescription(SensorEntityDescription):
+    """Describe an ICA metric sensor."""
+
+    value_fn: Callable[[Any], Any]
+    attributes_fn: Callable[[Any], dict] = lambda metrics: {}
+
+
+SENSORS = (
+    IcaMetricSensorEntityDescription(
+        key="request_latency",
+        name="ICA request latency",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: _merged(metrics, "ica ").percentile(95),
+        attributes_fn=_request_summaries,
+    ),
+    IcaMetricSensorEntityDescription(
+        key="request_errors",
+        name="ICA request errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: sum(
+            value for name, value in metrics.counters.items() if name.startswith("ica ") and name.endswith(" errors")
+        ),
+    ),
+    IcaMetricSensorEntityDescription(
+        key="reauthentications",
+        name="ICA re-authentications",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.counters["ica reauth on 401"],
+        attributes_fn=lambda metrics: {"logins": metrics.counters["ica logins"]},
+    ),
+    IcaMetricSensorEntityDescription(
+        key="sync_round_trips",
+        name="ICA sync round trips",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda metrics: metrics.counters["sync round trips"],
+        attributes_fn=lambda metrics: {"mutations": metrics.counters["sync mutations"]},
+    ),
+    IcaMetricSensorEntityDescription(
+        key="requests_in_flight",
+        name="ICA requests in flight",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: sum(
+            value for name, value in metrics.in_flight.items() if name.startswith("ica ")
+        ),
+    ),
+    IcaMetricSensorEntityDescription(
+        key="event_loop_lag",
+        name="ICA event loop lag",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda metrics: _merged(metrics, "event loop lag").percentile(95),
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class IcaListSensorEntityDescription(SensorEntityDescription):
+    """Describe an ICA list sensor."""
+
+    value_fn: Callable[[Any], Any]
+
+
+LIST_SENSORS = (
+    IcaListSensorEntityDescription(
+        key="items",
+        name="items",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda data: len(data.store),
+    ),
+    IcaListSensorEntityDescription(
+        key="pending",
+        name="items to buy",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda data: data.store.pending,
+    ),
+)
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the diagnostic sensors and the sensors of every list."""
+    if discovery_info is None:
+        return
+    metrics = get_shopping_data(hass).metrics
+    async_add_entities((IcaMetricSensor(metrics, description) for description in SENSORS), True)
+    async_add_entities(
+        IcaListSensor(data, description) for data in hass.data[DOMAIN].values() for description in LIST_SENSORS
+    )
+
+
+#The following class is one diagnostic sensor. Its value is read from the metrics registry every SCAN_INTERVAL,
+#so the hot paths never do more than update a counter or a histogram bucket. The registry is only changed in the event loop,
+#so it is read there too, with async_update, and not in the executor where it could change while it is iterated.
+class IcaMetricSensor(SensorEntity):
+    """Sensor that shows one ICA metric."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, metrics, description):
+        """Initialize the sensor."""
+        self.entity_description = description
+        self._metrics = metrics
+        self._attr_unique_id = f"{DOMAIN}_{description.key}"
+
+    async def async_update(self):
+        """Read the metric."""
+        self._attr_native_value = self.entity_description.value_fn(self._metrics)
+        self._attr_extra_state_attributes = self.entity_description.attributes_fn(self._metrics)
+
+
+
+#The following class is one sensor of a list, such as the number of items on it. It does not poll. ShoppingData calls it with every change,
+#and the value is read from counters the ItemStore keeps up to date, so a change never rescans the items.
+class IcaListSensor(SensorEntity):
+    """Sensor that shows one value of an ICA list."""
+
+    _attr_should_poll = False
+    _attr_icon = "mdi:cart"
+
+    def __init__(self, data, description):
+        """Initialize the sensor."""
+        self.entity_description = description
+        self._data = data
+        self._attr_name = f"ICA {data.client.listname} {description.name}"
+        self._attr_unique_id = f"{DOMAIN}_{data.key}_{description.key}"
+
+    @property
+    def native_value(self):
+        """Return the value."""
+        return self.entity_description.value_fn(self._data)
+
+    async def async_added_to_hass(self):
+        """Follow the changes to the list."""
+        self.async_on_remove(self._data.async_add_listener(self._async_handle_change))
+        if not self._data.ready.done():
+            self._data.ready.add_done_callback(self._async_handle_change)
+            self.async_on_remove(lambda: self._data.ready.remove_done_callback(self._async_handle_change))
+
+    @callback
+    def _async_handle_change(self, _change):
+        """Write the new value."""
+        self.async_write_ha_state()
@@ -0,0 +1,122 @@
+"""Id-indexed store for the items on a shopping list."""
+import unicodedata
+
+from .model import ShoppingItem, parse_row
+
+
+def normalize_name(name):
+    """Return the key used to look items up by name, with whitespace, case and accents folded."""
+    key = " ".join(name.split()).casefold()
+    if key.isascii():
+        return key
+    return "".join(char for char in unicodedata.normalize("NFKD", key) if not unicodedata.combining(char))
+
+
+#The following class keeps the shopping list items in a dict keyed by OfflineId, with a second index from normalized name to ids.
+#apply_rows takes the Rows that ICA returns after each sync and only touches the items that actually differ from what is already stored,
+#so a single strike-over updates one item instead of rebuilding the whole list. apply_row does the same for one row, complete or partial,
+#which is how ShoppingData applies a local change before ICA has confirmed it. Every row is parsed by parse_row, and the parsed fields are kept to compare the next row with.
+#`pending` counts the items that are not completed. It is kept up to date by every change, so it never needs a scan over the items.
+class ItemStore:
+    """Hold shopping list items keyed by OfflineId."""
+
+    def __init__(self):
+        """Initialize the store."""
+        self._items = {}
+        self._rows = {}
+        self._by_name = {}
+        self.pending = 0
+
+    def __len__(self):
+        """Return the number of items."""
+        return len(self._items)
+
+    def __contains__(self, item_id):
+        """Return True if an item with `item_id` exists."""
+        return item_id in self._items
+
+    def get(self, item_id):
+        """Return the item with `item_id`, or None."""
+        return self._items.get(item_id)
+
+    def items(self):
+        """Return all items as a list."""
+        return list(self._items.values())
+
+    def find(self, name):
+        """Return an item called `name`, preferring one that is not completed."""
+        ids = self._by_name.get(normalize_name(name))
+        if not ids:
+            return None
+        found = None
+        for item_id in ids:
+            found = self._items[item_id]
+            if not found.complete:
+                break
+        return found
+
+    def apply_rows(self, rows):
+        """Bring the store in line with `rows` and return (added, changed, removed) ids."""
+        added, changed = [], []
+        seen = set()
+        for row in rows:
+            item_id = row["OfflineId"]
+            seen.add(item_id)
+            key = parse_row(row)
+            if self._rows.get(item_id) == key:
+                continue
+            if item_id in self._items:
+                changed.append(item_id)
+            else:
+                added.append(item_id)
+            self._set(item_id, key)
+        removed = [item_id for item_id in self._items if item_id not in seen]
+        for item_id in removed:
+            self.remove(item_id)
+        return added, changed, removed
+
+    def apply_row(self, row):
+        """Apply one row, missing fields keep their value, and return (added, changed, removed) ids."""
+        item_id = row["OfflineId"]
+        old = self._rows.get(item_id)
+        key = parse_row(row, old)
+        if key == old:
+            return [], [], []
+        self._set(item_id, key)
+        return ([item_id], [], []) if old is None else ([], [item_id], [])
+
+    def remove(self, item_id):
+        """Remove the item with `item_id` and return True if it existed."""
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return False
+        del self._rows[item_id]
+        self.pending -= not item.complete
+        self._unindex(item_id, item.name)
+        return True
+
+    def _set(self, item_id, key):
+        """Insert or update one item from the fields returned by parse_row."""
+        item = self._items.get(item_id)
+        if item is None:
+            item = self._items[item_id] = ShoppingItem(item_id, key)
+            self.pending += not item.complete
+        else:
+            old_name = item.name
+            self.pending += item.complete
+            item.update(key)
+            self.pending -= item.complete
+            if old_name != item.name:
+                self._unindex(item_id, old_name)
+        self._rows[item_id] = key
+        self._by_name.setdefault(normalize_name(item.name), set()).add(item_id)
+
+    def _unindex(self, item_id, name):
+        """Drop `item_id` from the name index."""
+        key = normalize_name(name)
+        ids = self._by_name.get(key)
+        if ids is None:
+            return
+        ids.discard(item_id)
+        if not ids:
+            del self._by_name[key]
@@ -0,0 +1,127 @@
+"""Write-behind queue that batches list mutations into one /sync call."""
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SYNC_DELAY = 0.25
+
+
+#The following class collects adds, changes and deletes for a short window and sends them to ICA as one sync request.
+#Pending rows are merged by OfflineId: a change to a row that has not been created yet is folded into its CreatedRows entry,
+#a delete of such a row cancels it entirely, and repeated changes to the same row are merged into one ChangedRows entry.
+#When a batch has been answered, or has failed, `on_batch_done` is called with the batch, the list ICA returned and the error.
+#Batches that are sent but not answered yet are kept, so overlay() can lay every unconfirmed mutation over a list from ICA.
+#`sequence` is bumped when a batch is sent and when it is answered. ShoppingData compares it before and after fetching the list,
+#so a list that may or may not include a sync is not applied.
+class SyncQueue:
+    """Coalesce shopping list mutations into batched sync requests."""
+
+    def __init__(self, hass, client, delay=DEFAULT_SYNC_DELAY, on_batch_done=None):
+        """Initialize the queue."""
+        self.hass = hass
+        self.client = client
+        self.delay = delay
+        self.on_batch_done = on_batch_done
+        self._created = {}
+        self._changed = {}
+        self._deleted = {}
+        self._outstanding = []
+        self.sequence = 0
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    def is_pending(self):
+        """Return True if mutations are waiting to be sent or answered."""
+        return bool(self._created or self._changed or self._deleted or self._outstanding)
+
+    def async_add(self, row):
+        """Queue a new row."""
+        self._created[row["OfflineId"]] = dict(row)
+        self._async_schedule()
+
+    def async_change(self, row):
+        """Queue a change to an existing or pending row."""
+        offline_id = row["OfflineId"]
+        if offline_id in self._deleted:
+            _LOGGER.debug("Ignoring change to deleted row %s", offline_id)
+        elif offline_id in self._created:
+            self._created[offline_id].update(row)
+        else:
+            self._changed.setdefault(offline_id, {}).update(row)
+        self._async_schedule()
+
+    def async_delete(self, offline_id):
+        """Queue deletion of a row."""
+        if self._created.pop(offline_id, None) is None:
+            self._changed.pop(offline_id, None)
+            self._deleted[offline_id] = None
+        self._async_schedule()
+
+    def overlay(self, rows):
+        """Return `rows` with every unconfirmed mutation applied, oldest first."""
+        merged = {row["OfflineId"]: row for row in rows}
+        pending = {"CreatedRows": self._created.values(), "ChangedRows": self._changed.values(), "DeletedRows": self._deleted}
+        for batch in [*self._outstanding, pending]:
+            for row in batch.get("CreatedRows", ()):
+                merged[row["OfflineId"]] = {**merged.get(row["OfflineId"], {}), **row}
+            for row in batch.get("ChangedRows", ()):
+                if row["OfflineId"] in merged:
+                    merged[row["OfflineId"]] = {**merged[row["OfflineId"]], **row}
+            for offline_id in batch.get("DeletedRows", ()):
+                merged.pop(offline_id, None)
+        return list(merged.values())
+
+    def _async_schedule(self):
+        """Start the window if it is not already running."""
+        if self._timer is None:
+            self._timer = self.hass.loop.call_later(self.delay, self._async_timer_fired)
+
+    def _async_timer_fired(self):
+        """Flush the queue when the window closes."""
+        self._timer = None
+        self.hass.async_create_task(self.async_flush())
+
+    async def async_flush(self):
+        """Send everything that is pending as one sync request and wait for earlier batches.
+
+        Returns the list ICA answered with, or None if nothing was sent or the sync failed.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        payload = {}
+        if self._created:
+            payload["CreatedRows"] = list(self._created.values())
+        if self._changed:
+            payload["ChangedRows"] = list(self._changed.values())
+        if self._deleted:
+            payload["DeletedRows"] = list(self._deleted)
+        self._created, self._changed, self._deleted = {}, {}, {}
+        if payload:
+            self.sequence += 1
+            self._outstanding.append(payload)
+
+        # Batches go out one at a time so ICA sees mutations in the order they were made.
+        async with self._lock:
+            if not payload:
+                return None
+            mutations = sum(len(rows) for rows in payload.values())
+            try:
+                self.client.metrics.increment("sync round trips")
+                self.client.metrics.increment("sync mutations", mutations)
+                with self.client.metrics.timer("sync batch"):
+                    api_data = await self.client.async_sync(payload)
+            except Exception as err:  # pylint: disable=broad-except
+                self._outstanding.remove(payload)
+                self.sequence += 1
+                _LOGGER.debug("Sync of %d mutations failed: %s", mutations, err)
+                if self.on_batch_done is not None:
+                    self.on_batch_done(payload, None, err)
+                return None
+            self._outstanding.remove(payload)
+            self.sequence += 1
+            _LOGGER.debug("Flushed %d mutations in one sync", mutations)
+            if self.on_batch_done is not None:
+                self.on_batch_done(payload, api_data, None)
+            return api_data
@@ -0,0 +1,108 @@
+"""Todo entities for the ICA shopping lists."""
+from homeassistant.components.todo import (
+    TodoItem,
+    TodoItemStatus,
+    TodoListEntity,
+    TodoListEntityFeature,
+)
+from homeassistant.core import callback
+from homeassistant.exceptions import HomeAssistantError
+
+from . import DOMAIN
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up a todo entity for every list."""
+    if discovery_info is None:
+        return
+    async_add_entities(IcaTodoListEntity(data) for data in hass.data[DOMAIN].values())
+
+
+def _todo_item(item):
+    """Return a TodoItem for an item dict."""
+    return TodoItem(
+        summary=item["name"],
+        uid=item["id"],
+        status=TodoItemStatus.COMPLETED if item["complete"] else TodoItemStatus.NEEDS_ACTION,
+        description=None if item["quantity"] is None else str(item["quantity"]),
+    )
+
+
+#The following class exposes one ICA list as a todo entity. It does not poll and does not fetch anything itself, it is fed by the ShoppingData of the list,
+#which is the one copy of the list that the views, websocket commands, sensors and intents read as well.
+#The entity keeps its TodoItems keyed by id and only touches the ones in each change ShoppingData hands to its listeners.
+#The items are built from the store once the list is ready, since loading the snapshot does not go through the listeners.
+#Creating, updating and deleting items go through ShoppingData, so they are applied at once and sent to ICA in a batched sync.
+class IcaTodoListEntity(TodoListEntity):
+    """A todo entity backed by an ICA shopping list."""
+
+    _attr_should_poll = False
+    _attr_icon = "mdi:cart"
+    _attr_supported_features = (
+        TodoListEntityFeature.CREATE_TODO_ITEM
+        | TodoListEntityFeature.UPDATE_TODO_ITEM
+        | TodoListEntityFeature.DELETE_TODO_ITEM
+    )
+
+    def __init__(self, data):
+        """Initialize the entity."""
+        self._data = data
+        self._items = {}
+        self._attr_name = f"ICA {data.client.listname}"
+        self._attr_unique_id = f"{DOMAIN}_{data.key}"
+        self._attr_todo_items = None
+
+    async def async_added_to_hass(self):
+        """Follow the changes to the list."""
+        self.async_on_remove(self._data.async_add_listener(self._async_handle_change))
+        if self._data.ready.done():
+            self._async_rebuild()
+            return
+
+        def ready_callback(_):
+            self._async_rebuild()
+            self.async_write_ha_state()
+
+        self._data.ready.add_done_callback(ready_callback)
+        self.async_on_remove(lambda: self._data.ready.remove_done_callback(ready_callback))
+
+    @callback
+    def _async_rebuild(self):
+        """Build every TodoItem from the store."""
+        self._items = {item.id: _todo_item(item.as_dict()) for item in self._data.store.items()}
+        self._attr_todo_items = list(self._items.values())
+
+    @callback
+    def _async_handle_change(self, change):
+        """Apply one change to the list."""
+        for item in (*change["added"], *change["changed"]):
+            self._items[item["id"]] = _todo_item(item)
+        for item_id in change["removed"]:
+            self._items.pop(item_id, None)
+        self._attr_todo_items = list(self._items.values())
+        self.async_write_ha_state()
+
+    async def async_create_todo_item(self, item):
+        """Add an item to the list."""
+        await self._data.async_add(item.summary)
+
+    #The todo card sends the summary with every update, also when only the status changed. The summary is the capitalized name,
+    #so it is only sent on as a new name when it differs from the name of the item, otherwise completing "iPhone-laddare" would rename it in ICA.
+    async def async_update_todo_item(self, item):
+        """Rename, complete or reopen an item."""
+        info = {}
+        stored = self._data.store.get(item.uid)
+        if stored is None or item.summary != stored.name:
+            info["name"] = item.summary
+        if item.status is not None:
+            info["complete"] = item.status == TodoItemStatus.COMPLETED
+        try:
+            await self._data.async_update(item.uid, info)
+        except KeyError as err:
+            raise HomeAssistantError(f"Item not found: {item.uid}") from err
+
+    async def async_delete_todo_items(self, uids):
+        """Delete items from the list."""
+        not_found = await self._data.async_update_items([{"item_id": uid, "delete": True} for uid in uids])
+        if not_found:
+            raise HomeAssistantError(f"Items not found: {', '.join(not_found)}")
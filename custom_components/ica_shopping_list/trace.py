@@ -0,0 +1,67 @@
+"""Opt-in recorder that writes every ICA request to a JSONL trace."""
+import json
+import logging
+import os
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+
+TRACE_FLUSH_DELAY = 1
+
+
+#The following class writes one compact JSON line per request to ICA: when it was sent, in seconds since recording started, the method and path,
+#the JSON body sent, the status, the time it took and the decoded response or the error. Credentials and tickets are sent as headers and are never written.
+#Lines are serialized when the request finishes and appended in the executor at most every TRACE_FLUSH_DELAY seconds.
+#scripts/replay.py reads these traces to replay them against the local stand-in.
+class TraceRecorder:
+    """Record ICA requests to a JSONL file."""
+
+    def __init__(self, hass, path):
+        """Initialize the recorder."""
+        self.hass = hass
+        self.path = path
+        self._start = hass.loop.time()
+        self._pending = []
+        self._flush_handle = None
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_flush)
+        _LOGGER.info("Recording ICA requests to %s", path)
+
+    @callback
+    def async_record(self, start, method, uri, request, status, response, error=None):
+        """Record one request that was sent at loop time `start`."""
+        record = {
+            "t": round(start - self._start, 4),
+            "method": method,
+            "uri": uri,
+            "ms": round((self.hass.loop.time() - start) * 1000, 2),
+            "status": status,
+        }
+        if request is not None:
+            record["request"] = request
+        if error is not None:
+            record["error"] = str(error)
+        else:
+            record["response"] = response
+        self._pending.append(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+        if self._flush_handle is None:
+            self._flush_handle = self.hass.loop.call_later(
+                TRACE_FLUSH_DELAY, lambda: self.hass.async_create_task(self._async_flush())
+            )
+
+    async def _async_flush(self, _event=None):
+        """Append the recorded lines to the trace."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        await self.hass.async_add_executor_job(self._append, lines)
+
+    def _append(self, lines):
+        """Append `lines` to the file."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.writelines(lines)
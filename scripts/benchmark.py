@@ -0,0 +1,168 @@
+"""Latency and throughput benchmarks for ica_shopping_list.
+
+Runs the integration inside a minimal Home Assistant against the FakeIca
+stand-in, so no network access or ICA account is needed:
+
+    python scripts/benchmark.py --latency 80 --burst 30
+
+Reports setup time, the time until the list is ready, add/update/clear
+latency through ShoppingData, both as seen by the caller and until ICA
+has confirmed an add, and burst throughput through the services,
+websocket commands and HTTP views, together with the number of ICA
+requests each step cost.
+"""
+import argparse
+import asyncio
+import math
+import socket
+import statistics
+import time
+
+from fake_ica import FakeIca
+from harness import DOMAIN, Harness
+
+
+def free_port():
+    """Return a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+#The following class collects one row of results per benchmark step and prints them as a table at the end.
+class Report:
+    """Benchmark results."""
+
+    def __init__(self, fake):
+        """Initialize the report."""
+        self.fake = fake
+        self.rows = []
+
+    def ica_requests(self):
+        """Return the number of requests the stand-in has served."""
+        return sum(self.fake.requests.values())
+
+    def latency(self, name, samples, requests):
+        """Add a row for a sequence of timed operations, with the nearest-rank p95."""
+        samples = sorted(samples)
+        self.rows.append(
+            (
+                name,
+                len(samples),
+                f"{statistics.median(samples) * 1000:.1f}",
+                f"{samples[math.ceil(len(samples) * 0.95) - 1] * 1000:.1f}",
+                f"{len(samples) / sum(samples):.1f}",
+                requests,
+            )
+        )
+
+    def burst(self, name, count, elapsed, requests):
+        """Add a row for a burst of concurrent operations."""
+        self.rows.append((name, count, "", f"{elapsed * 1000:.1f}", f"{count / elapsed:.1f}", requests))
+
+    def print(self):
+        """Print the table."""
+        header = ("benchmark", "n", "p50 ms", "p95/total ms", "ops/s", "ICA requests")
+        widths = [max(len(str(row[col])) for row in [header, *self.rows]) for col in range(len(header))]
+        for row in [header, *self.rows]:
+            print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+
+async def timed(report, name, iterations, operation):
+    """Run `operation` `iterations` times one after another."""
+    before = report.ica_requests()
+    samples = []
+    for index in range(iterations):
+        start = time.perf_counter()
+        await operation(index)
+        samples.append(time.perf_counter() - start)
+    report.latency(name, samples, report.ica_requests() - before)
+
+
+async def burst(report, name, count, operation):
+    """Run `count` operations concurrently."""
+    before = report.ica_requests()
+    start = time.perf_counter()
+    await asyncio.gather(*(operation(index) for index in range(count)))
+    report.burst(name, count, time.perf_counter() - start, report.ica_requests() - before)
+
+
+async def run(args):
+    """Run every benchmark and print the report."""
+    fake = FakeIca(args.latency / 1000, args.jitter / 1000, args.error_rate, seed=1)
+    fake.add_list("Benchmark", [{"ProductName": f"vara {index}"} for index in range(args.items)])
+    api_url = await fake.start()
+    harness = Harness(api_url, free_port(), sync_delay=args.sync_delay)
+    report = Report(fake)
+
+    await harness.start()
+    await harness.hass.async_block_till_done()
+    report.rows.append(("setup", 1, "", f"{harness.setup_time * 1000:.1f}", "", ""))
+    report.rows.append(("ready", 1, "", f"{harness.ready_time * 1000:.1f}", "", ""))
+    data = harness.data
+    hass = harness.hass
+
+    await timed(report, "ShoppingData.async_add", args.iterations, lambda i: data.async_add(f"add {i}"))
+    await data.queue.async_flush()
+
+    async def add_confirmed(index):
+        await data.async_add(f"confirmed {index}")
+        await data.queue.async_flush()
+    await timed(report, "ShoppingData.async_add + sync", args.iterations, add_confirmed)
+    ids = [item.id for item in data.items]
+    await timed(
+        report,
+        "ShoppingData.async_update",
+        args.iterations,
+        lambda i: data.async_update(ids[i % len(ids)], {"complete": True}),
+    )
+    await timed(report, "ShoppingData.async_clear_completed", 1, lambda i: data.async_clear_completed())
+
+    await burst(
+        report,
+        "service add_item burst",
+        args.burst,
+        lambda i: hass.services.async_call(DOMAIN, "add_item", {"name": f"service {i}"}, blocking=True),
+    )
+
+    ws = await harness.websocket()
+    await burst(
+        report,
+        "websocket items/add burst",
+        args.burst,
+        lambda i: ws.call("shopping_list/items/add", name=f"ws {i}"),
+    )
+    await ws.close()
+
+    async def http_add(index):
+        async with harness.session.post(
+            harness.base_url + "/api/shopping_list/item", json={"name": f"http {index}"}
+        ) as resp:
+            await resp.read()
+    await burst(report, "HTTP POST item burst", args.burst, http_add)
+
+    async def http_get(index):
+        async with harness.session.get(harness.base_url + "/api/shopping_list") as resp:
+            await resp.read()
+    await burst(report, "HTTP GET list burst", args.burst * 10, http_get)
+
+    await harness.stop()
+    await fake.stop()
+    report.print()
+
+
+def main():
+    """Parse arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=50, help="stand-in latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="random extra latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with 500")
+    parser.add_argument("--items", type=int, default=50, help="rows on the list at start")
+    parser.add_argument("--iterations", type=int, default=20, help="sequential operations per latency benchmark")
+    parser.add_argument("--burst", type=int, default=30, help="concurrent operations per burst benchmark")
+    parser.add_argument("--sync-delay", type=float, default=0.05, help="sync_delay option in seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Local stand-in for the ICA shopping list API.
+
+Covers login, the offlineshoppinglists endpoints and /sync with
+CreatedRows, ChangedRows and DeletedRows, with optional latency and
+error injection. Run it on its own with
+
+    python scripts/fake_ica.py --port 8099 --latency 80
+
+and point the integration at it with `api_url: http://127.0.0.1:8099`.
+"""
+import argparse
+import asyncio
+from collections import Counter
+import random
+import uuid
+
+from aiohttp import web
+
+
+#The following class is the stand-in itself. It keeps every list in memory and counts the requests per endpoint,
+#so a benchmark can tell how many round trips an operation cost.
+class FakeIca:
+    """In-memory ICA shopping list API."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, expire_rate=0.0, seed=None):
+        """Initialize the stand-in. Times are in seconds, rates between 0 and 1."""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self.lists = {}
+        self.tickets = set()
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._runner = None
+
+    def make_app(self):
+        """Return the aiohttp application."""
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes(
+            [
+                web.get("/api/login", self._login),
+                web.get("/api/user/offlineshoppinglists", self._get_lists),
+                web.post("/api/user/offlineshoppinglists", self._create_list),
+                web.get("/api/user/offlineshoppinglists/{list_id}", self._get_list),
+                web.post("/api/user/offlineshoppinglists/{list_id}/sync", self._sync),
+            ]
+        )
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving and return the base URL."""
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_list(self, title, rows=()):
+        """Create a list directly and return its OfflineId."""
+        list_id = str(uuid.uuid4())
+        self.lists[list_id] = {"OfflineId": list_id, "Title": title, "SortingStore": 0, "Rows": []}
+        for row in rows:
+            self._create_row(self.lists[list_id], row)
+        return list_id
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        """Count the request, then apply latency and injected errors."""
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[f"{request.method} {route}"] += 1
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise web.HTTPInternalServerError(text="Injected error")
+        if request.path != "/api/login":
+            ticket = request.headers.get("AuthenticationTicket")
+            if self.expire_rate and self._random.random() < self.expire_rate:
+                self.tickets.discard(ticket)
+            if ticket not in self.tickets:
+                raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    async def _login(self, request):
+        """Hand out a new ticket for any basic auth credentials."""
+        if request.headers.get("Authorization") is None:
+            raise web.HTTPUnauthorized()
+        ticket = uuid.uuid4().hex
+        self.tickets.add(ticket)
+        return web.json_response({}, headers={"AuthenticationTicket": ticket})
+
+    async def _get_lists(self, request):
+        """Return all lists."""
+        return web.json_response({"ShoppingLists": list(self.lists.values())})
+
+    async def _create_list(self, request):
+        """Create a list with the OfflineId sent by the client."""
+        body = await request.json()
+        self.lists[body["OfflineId"]] = {
+            "OfflineId": body["OfflineId"],
+            "Title": body["Title"],
+            "SortingStore": body.get("SortingStore", 0),
+            "Rows": [],
+        }
+        return web.json_response({})
+
+    async def _get_list(self, request):
+        """Return one list."""
+        return web.json_response(self._list(request))
+
+    async def _sync(self, request):
+        """Apply CreatedRows, ChangedRows and DeletedRows and return the list."""
+        shopping_list = self._list(request)
+        body = await request.json()
+        for row in body.get("CreatedRows", []):
+            self._create_row(shopping_list, row)
+        rows = {row["OfflineId"]: row for row in shopping_list["Rows"]}
+        for change in body.get("ChangedRows", []):
+            row = rows.get(change["OfflineId"])
+            if row is not None:
+                row.update(change)
+        deleted = set(body.get("DeletedRows", []))
+        if deleted:
+            shopping_list["Rows"] = [row for row in shopping_list["Rows"] if row["OfflineId"] not in deleted]
+        return web.json_response(shopping_list)
+
+    def _list(self, request):
+        """Return the list addressed by the request."""
+        shopping_list = self.lists.get(request.match_info["list_id"])
+        if shopping_list is None:
+            raise web.HTTPNotFound()
+        return shopping_list
+
+    @staticmethod
+    def _create_row(shopping_list, row):
+        """Append a row the way ICA fills in missing fields."""
+        new_row = {
+            "OfflineId": row.get("OfflineId") or str(uuid.uuid4()),
+            "ProductName": row["ProductName"],
+            "IsStrikedOver": bool(row.get("IsStrikedOver", False)),
+            "Quantity": row.get("Quantity"),
+            "InternalOrder": len(shopping_list["Rows"]),
+            "SourceId": row.get("SourceId", -1),
+        }
+        shopping_list["Rows"].append(new_row)
+
+
+def main():
+    """Run the stand-in until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0, help="fixed latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="random extra latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with 500")
+    parser.add_argument("--expire-rate", type=float, default=0, help="share of requests that expire the ticket")
+    args = parser.parse_args()
+
+    fake = FakeIca(args.latency / 1000, args.jitter / 1000, args.error_rate, args.expire_rate)
+
+    async def serve():
+        url = await fake.start(args.host, args.port)
+        print(f"Fake ICA API listening on {url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
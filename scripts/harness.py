@@ -0,0 +1,166 @@
+"""Run the integration inside a minimal Home Assistant, without the network.
+
+Used by benchmark.py. Starts a Home Assistant core with the http and
+websocket_api components on a local port, points ica_shopping_list at a
+FakeIca stand-in and hands out an access token for HTTP and websocket
+clients.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from homeassistant import config_entries, loader
+from homeassistant.auth import auth_manager_from_config
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry,
+    device_registry,
+    entity,
+    entity_registry,
+    translation,
+)
+from homeassistant.setup import async_setup_component
+
+# The integration is loaded from a fresh config directory that links to this checkout, so Home Assistant's loader finds its platforms.
+CONFIG_DIR = tempfile.mkdtemp()
+os.symlink(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components"),
+    os.path.join(CONFIG_DIR, "custom_components"),
+)
+sys.path.insert(0, CONFIG_DIR)
+
+from custom_components import ica_shopping_list  # noqa: E402
+
+DOMAIN = ica_shopping_list.DOMAIN
+
+
+#The following class owns one Home Assistant instance with the integration set up against a stand-in API.
+#setup_time holds how long setting up the component took, which is what Home Assistant startup waits for,
+#and ready_time how long it took until the list was loaded and the handlers stopped waiting for it.
+class Harness:
+    """Home Assistant with ica_shopping_list set up against a stand-in."""
+
+    def __init__(self, api_url, http_port, config_dir=CONFIG_DIR, **options):
+        """Initialize the harness. Storage files are kept in `config_dir`."""
+        self.api_url = api_url
+        self.http_port = http_port
+        self.config_dir = config_dir
+        self.options = options
+        self.hass = None
+        self.token = None
+        self.setup_time = None
+        self.ready_time = None
+        self.session = None
+
+    @property
+    def base_url(self):
+        """Return the URL of the Home Assistant HTTP server."""
+        return f"http://127.0.0.1:{self.http_port}"
+
+    @property
+    def data(self):
+        """Return the ShoppingData of the first list."""
+        return ica_shopping_list.get_shopping_data(self.hass)
+
+    async def start(self):
+        """Start Home Assistant and set up the integration."""
+        hass = self.hass = HomeAssistant(self.config_dir)
+        hass.config.skip_pip = True
+        loader.async_setup(hass)
+        # Home Assistant 2024.2 and later set up the translation cache up front, 2024.1 creates it on first use.
+        if hasattr(translation, "async_setup"):
+            translation.async_setup(hass)
+        entity.async_setup(hass)
+        for registry in (area_registry, device_registry, entity_registry):
+            await registry.async_load(hass)
+        hass.config_entries = config_entries.ConfigEntries(hass, {})
+        await hass.config_entries.async_initialize()
+        hass.auth = await auth_manager_from_config(hass, [{"type": "homeassistant"}], [])
+
+        await async_setup_component(hass, "http", {"http": {"server_port": self.http_port}})
+        await async_setup_component(hass, "websocket_api", {})
+
+        config = {
+            DOMAIN: {
+                "username": "benchmark",
+                "password": "123456",
+                "listname": "Benchmark",
+                "api_url": self.api_url,
+                **self.options,
+            }
+        }
+        start = time.perf_counter()
+        if not await async_setup_component(hass, DOMAIN, config):
+            raise RuntimeError(f"Setting up {DOMAIN} failed")
+        self.setup_time = time.perf_counter() - start
+        await self.data.ready
+        self.ready_time = time.perf_counter() - start
+
+        await hass.async_start()
+        user = await hass.auth.async_create_system_user("benchmark", group_ids=["system-admin"])
+        refresh_token = await hass.auth.async_create_refresh_token(user)
+        self.token = hass.auth.async_create_access_token(refresh_token)
+        self.session = aiohttp.ClientSession(headers={"Authorization": f"Bearer {self.token}"})
+
+    async def stop(self):
+        """Stop Home Assistant."""
+        if self.session is not None:
+            await self.session.close()
+        await self.hass.async_stop(force=True)
+
+    async def websocket(self):
+        """Return an authenticated websocket client."""
+        return await WebsocketClient.connect(self.session, self.base_url, self.token)
+
+
+#The following class is a small websocket client that pairs every command with its result by message id.
+#A background task reads the connection, so many commands can be in flight at the same time.
+class WebsocketClient:
+    """Authenticated Home Assistant websocket connection."""
+
+    def __init__(self, ws):
+        """Initialize the client."""
+        self.ws = ws
+        self.events = {}
+        self._next_id = 1
+        self._results = {}
+        self._reader = asyncio.get_running_loop().create_task(self._read())
+
+    @classmethod
+    async def connect(cls, session, base_url, token):
+        """Connect and authenticate."""
+        ws = await session.ws_connect(base_url + "/api/websocket")
+        await ws.receive_json()
+        await ws.send_json({"type": "auth", "access_token": token})
+        reply = await ws.receive_json()
+        if reply["type"] != "auth_ok":
+            raise RuntimeError(f"Websocket authentication failed: {reply}")
+        return cls(ws)
+
+    async def _read(self):
+        """Dispatch results to their callers and collect events per subscription."""
+        async for message in self.ws:
+            msg = message.json()
+            if msg["type"] == "result":
+                future = self._results.pop(msg["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(msg)
+            elif msg["type"] == "event":
+                self.events.setdefault(msg["id"], asyncio.Queue()).put_nowait(msg["event"])
+
+    async def call(self, msg_type, **kwargs):
+        """Send a command and wait for its result."""
+        msg_id = self._next_id
+        self._next_id += 1
+        future = self._results[msg_id] = asyncio.get_running_loop().create_future()
+        await self.ws.send_json({"id": msg_id, "type": msg_type, **kwargs})
+        return await future
+
+    async def close(self):
+        """Close the connection."""
+        await self.ws.close()
+        await self._reader
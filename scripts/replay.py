@@ -0,0 +1,234 @@
+"""Replay a recorded ICA trace against the local stand-in.
+
+Reads a trace written with the `trace` option, seeds the FakeIca
+stand-in with the list as it was first fetched, and replays what
+happened to it through the integration inside a minimal Home Assistant:
+
+    python scripts/replay.py ica_trace.jsonl --speed 10 --via websocket
+
+Every sync in the trace is replayed as the adds, changes and deletes it
+carried, through ShoppingData, the services or the websocket commands.
+Every fetch of the list first puts the rows ICA returned into the
+stand-in, so changes made in the ICA app are replayed too, and then
+refreshes the list. --speed 1 keeps the recorded pace, higher values
+replay faster and 0 replays without waiting. The stand-in answers with
+the median latency of the trace unless --latency is given.
+
+With --profile DIR a cProfile of every kind of operation is written to
+DIR/<operation>.prof, and with --tracemalloc the peak memory allocated
+by each operation is reported, so two builds can be compared on the
+same trace. Operations are replayed one at a time, so each profile only
+holds one operation.
+"""
+import argparse
+import asyncio
+import cProfile
+from collections import defaultdict
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+from benchmark import Report, free_port
+from fake_ica import FakeIca
+from harness import DOMAIN, Harness
+
+URI_LIST = "/api/user/offlineshoppinglists/"
+
+
+def load_trace(path):
+    """Return the records of the trace at `path`."""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def list_records(records, title=None):
+    """Return the title and the fetches and syncs of one list in the trace, the first fetched list by default."""
+    list_id = None
+    for record in records:
+        response = record.get("response")
+        if record["method"] == "GET" and record["uri"].startswith(URI_LIST) and isinstance(response, dict):
+            if title is None or response.get("Title") == title:
+                list_id, title = response["OfflineId"], response["Title"]
+                break
+    if list_id is None:
+        raise SystemExit(f"No fetch of {title or 'any list'} in the trace")
+    prefix = URI_LIST + list_id
+    return title, [record for record in records if record["uri"] in (prefix, prefix + "/sync") and "error" not in record]
+
+
+#The following class replays the operations of one list. Rows created during the replay get new OfflineIds,
+#so `ids` maps the recorded ids to the replayed ones, and rows that existed before keep theirs.
+#Every operation is timed by kind, and profiled or traced when asked to.
+class Replay:
+    """Replay a trace through the integration."""
+
+    def __init__(self, harness, fake, list_id, via, profile_dir=None, trace_memory=False):
+        """Initialize the replay."""
+        self.harness = harness
+        self.fake = fake
+        self.list_id = list_id
+        self.via = via
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.ids = {}
+        self.samples = defaultdict(list)
+        self.requests = defaultdict(int)
+        self.memory = defaultdict(list)
+        self.profiles = defaultdict(cProfile.Profile)
+        self.ws = None
+
+    @property
+    def data(self):
+        """Return the ShoppingData of the replayed list."""
+        return self.harness.data
+
+    async def run(self, records, speed):
+        """Replay `records` at `speed` times the recorded pace."""
+        if self.via == "websocket":
+            self.ws = await self.harness.websocket()
+        start = time.perf_counter()
+        for record in records:
+            if speed:
+                delay = record["t"] / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if record["method"] == "GET":
+                self.fake.lists[self.list_id]["Rows"] = [self._replayed_row(row) for row in record["response"]["Rows"]]
+                await self._timed("refresh", self.data.async_refresh())
+                continue
+            payload = record["request"]
+            names = [row["ProductName"] for row in payload.get("CreatedRows", [])]
+            changes = [self._change(row) for row in payload.get("ChangedRows", [])]
+            changes += [{"item_id": self.ids.get(offline_id, offline_id), "delete": True} for offline_id in payload.get("DeletedRows", [])]
+            if names:
+                await self._timed("add", self._add(names))
+                for row in payload["CreatedRows"]:
+                    item = self.data.store.find(row["ProductName"])
+                    if item is not None:
+                        self.ids[row["OfflineId"]] = item.id
+            if changes:
+                await self._timed("update", self._update(changes))
+            await self._timed("sync", self.data.queue.async_flush())
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def _timed(self, kind, operation):
+        """Run one operation, timing, profiling and tracing it."""
+        before = sum(self.fake.requests.values())
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        profile = self.profiles[kind] if self.profile_dir else None
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            await operation
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.samples[kind].append(time.perf_counter() - start)
+            self.requests[kind] += sum(self.fake.requests.values()) - before
+            if self.trace_memory:
+                self.memory[kind].append(tracemalloc.get_traced_memory()[1] - current)
+
+    async def _add(self, names):
+        """Add `names` the way --via asks for."""
+        if self.via == "websocket":
+            await self.ws.call("shopping_list/items/add_items", items=names)
+        elif self.via == "services":
+            await self.harness.hass.services.async_call(DOMAIN, "add_items", {"items": names}, blocking=True)
+        else:
+            await self.data.async_add_items(names)
+
+    async def _update(self, changes):
+        """Apply `changes` the way --via asks for.
+
+        The services can only complete items by name, so other changes go through ShoppingData with --via services.
+        """
+        if self.via == "websocket":
+            await self.ws.call("shopping_list/items/update_items", changes=changes)
+            return
+        if self.via == "services":
+            completions = [change for change in changes if set(change) == {"item_id", "complete"} and change["complete"]]
+            names = [self.data.store.get(change["item_id"]).name for change in completions if change["item_id"] in self.data.store]
+            if names:
+                await self.harness.hass.services.async_call(DOMAIN, "complete_item", {"name": names}, blocking=True)
+            changes = [change for change in changes if change not in completions]
+        if changes:
+            await self.data.async_update_items(changes)
+
+    def _change(self, row):
+        """Return the update_items change for a recorded ChangedRows entry."""
+        change = {"item_id": self.ids.get(row["OfflineId"], row["OfflineId"])}
+        if "IsStrikedOver" in row:
+            change["complete"] = row["IsStrikedOver"]
+        if "ProductName" in row:
+            change["name"] = row["ProductName"]
+        return change
+
+    def _replayed_row(self, row):
+        """Return a recorded row with the OfflineId it has in the replay."""
+        return {**row, "OfflineId": self.ids.get(row["OfflineId"], row["OfflineId"])}
+
+    def report(self):
+        """Print the results and write the profiles."""
+        report = Report(self.fake)
+        for kind, samples in self.samples.items():
+            report.latency(kind, samples, self.requests[kind])
+        report.print()
+        if self.trace_memory:
+            print()
+            for kind, peaks in self.memory.items():
+                print(f"{kind}: peak allocation mean {statistics.mean(peaks) / 1024:.1f} KiB, max {max(peaks) / 1024:.1f} KiB")
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for kind, profile in self.profiles.items():
+                path = os.path.join(self.profile_dir, f"{kind}.prof")
+                profile.dump_stats(path)
+                print(f"Wrote {path}")
+
+
+async def run(args):
+    """Replay the trace and print the report."""
+    title, records = list_records(load_trace(args.trace), args.list)
+    first_fetch = next(record for record in records if record["method"] == "GET")
+    latency = args.latency / 1000 if args.latency is not None else statistics.median(record["ms"] for record in records) / 1000
+
+    fake = FakeIca(latency, seed=1)
+    list_id = fake.add_list(title, first_fetch["response"]["Rows"])
+    api_url = await fake.start()
+    harness = Harness(api_url, free_port(), sync_delay=args.sync_delay)
+    harness.options["listname"] = title
+    if args.tracemalloc:
+        tracemalloc.start()
+    await harness.start()
+    await harness.hass.async_block_till_done()
+
+    replay = Replay(harness, fake, list_id, args.via, args.profile, args.tracemalloc)
+    print(f"Replaying {len(records)} requests to {title} via {args.via}")
+    await replay.run(records[records.index(first_fetch) + 1 :], args.speed)
+
+    await harness.stop()
+    await fake.stop()
+    replay.report()
+
+
+def main():
+    """Parse arguments and replay the trace."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="trace written with the trace option")
+    parser.add_argument("--list", help="title of the list to replay, the first fetched list by default")
+    parser.add_argument("--speed", type=float, default=1, help="times the recorded pace, 0 for no waiting")
+    parser.add_argument("--via", choices=("data", "services", "websocket"), default="data", help="how to apply the changes")
+    parser.add_argument("--latency", type=float, help="stand-in latency in ms, the trace median by default")
+    parser.add_argument("--sync-delay", type=float, default=0.05, help="sync_delay option in seconds")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile per operation to DIR")
+    parser.add_argument("--tracemalloc", action="store_true", help="report peak allocations per operation")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
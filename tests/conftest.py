@@ -0,0 +1,90 @@
+"""Fixtures for the tests of the ICA shopping list integration."""
+import asyncio
+import contextlib
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+# The harness links custom_components into a config directory on sys.path, so the tests import the integration the way Home Assistant does.
+from benchmark import free_port  # noqa: E402
+from fake_ica import FakeIca  # noqa: E402
+from harness import Harness  # noqa: E402
+
+LISTNAME = "Test"
+
+
+class FakeBus:
+    """Event bus that only remembers its listeners."""
+
+    def __init__(self):
+        """Initialize the bus."""
+        self.listeners = []
+
+    def async_listen_once(self, event_type, listener):
+        """Remember `listener`."""
+        self.listeners.append((event_type, listener))
+
+
+class FakeConfig:
+    """Config that keeps files in a temporary directory."""
+
+    def __init__(self, config_dir):
+        """Initialize the config."""
+        self.config_dir = config_dir
+
+    def path(self, *parts):
+        """Return a path in the config directory."""
+        return os.path.join(self.config_dir, *parts)
+
+
+class FakeHass:
+    """The parts of HomeAssistant that the queue and the history use."""
+
+    def __init__(self, loop, config_dir):
+        """Initialize the instance."""
+        self.loop = loop
+        self.bus = FakeBus()
+        self.config = FakeConfig(config_dir)
+
+    def async_create_task(self, coro):
+        """Schedule `coro` on the loop."""
+        return self.loop.create_task(coro)
+
+    def async_add_executor_job(self, target, *args):
+        """Run `target` in the default executor."""
+        return self.loop.run_in_executor(None, target, *args)
+
+
+@pytest.fixture
+def run():
+    """Return a function that runs a coroutine to completion on a new loop."""
+    return asyncio.run
+
+
+@pytest.fixture
+def make_hass(tmp_path):
+    """Return a function that builds a FakeHass on the running loop."""
+    return lambda: FakeHass(asyncio.get_running_loop(), str(tmp_path))
+
+
+@pytest.fixture
+def start_ica(tmp_path):
+    """Return a function that starts FakeIca with one list of `rows` and Home Assistant with the integration pointed at it, for `async with`."""
+
+    @contextlib.asynccontextmanager
+    async def start(rows=(), **options):
+        fake = FakeIca()
+        fake.add_list(LISTNAME, rows)
+        harness = Harness(await fake.start(), free_port(), config_dir=str(tmp_path), listname=LISTNAME, **options)
+        try:
+            await harness.start()
+            yield fake, harness
+        finally:
+            await harness.stop()
+            await fake.stop()
+
+    return start
@@ -0,0 +1,66 @@
+"""Tests for AisleOrder, SortedItems and load_aisles."""
+import random
+
+from custom_components.ica_shopping_list.aisles import AisleOrder, SortedItems, load_aisles
+from custom_components.ica_shopping_list.store import ItemStore, normalize_name
+
+AISLES = {"Frukt": ["banan", "äpple"], "Mejeri": ["mjölk", "ost"], "Bröd": ["bröd"]}
+
+
+def test_aisle_matches_the_name_or_one_of_its_words():
+    """Names are matched whole or by word, and unknown names go after the last aisle."""
+    order = AisleOrder(AISLES)
+    assert order.aisle("Äpple") == 0
+    assert order.aisle("Laktosfri mjölk") == 1
+    assert order.aisle("Bröd") == 2
+    assert order.aisle("Tandkräm") == 3
+    assert not AisleOrder()
+
+
+def test_sorted_items_follow_changes():
+    """Updating the sorted view item by item gives the same order as sorting everything again."""
+    names = ["banan", "mjölk", "bröd", "ost", "tandkräm", "äpple", "laktosfri mjölk", "kaffe"]
+    rng = random.Random(1)
+    store = ItemStore()
+    store.apply_rows([{"OfflineId": str(index), "ProductName": name} for index, name in enumerate(names)])
+    view = SortedItems(store, AisleOrder(AISLES))
+    view.rebuild()
+    for step in range(200):
+        item_id = str(rng.randrange(len(names) + 3))
+        action = rng.random()
+        if action < 0.2:
+            store.remove(item_id)
+        elif action < 0.6 or item_id not in store:
+            store.apply_row({"OfflineId": item_id, "ProductName": rng.choice(names), "IsStrikedOver": rng.random() < 0.3})
+        else:
+            store.apply_row({"OfflineId": item_id, "IsStrikedOver": not store.get(item_id).complete})
+        view.update([item_id])
+        expected = sorted(
+            store.items(), key=lambda item: (item.complete, view.order.aisle(item.name), normalize_name(item.name), item.id)
+        )
+        assert [item.id for item in view.items()] == [item.id for item in expected], step
+
+
+def test_completed_items_go_last():
+    """Completed items are sorted after the rest, whatever their aisle."""
+    store = ItemStore()
+    store.apply_rows(
+        [
+            {"OfflineId": "1", "ProductName": "bröd"},
+            {"OfflineId": "2", "ProductName": "banan", "IsStrikedOver": True},
+            {"OfflineId": "3", "ProductName": "ost"},
+        ]
+    )
+    view = SortedItems(store, AisleOrder(AISLES))
+    view.rebuild()
+    assert [item.name for item in view.items()] == ["Ost", "Bröd", "Banan"]
+
+
+def test_load_aisles(tmp_path):
+    """The file is read per list, and a missing or invalid file gives no aisles."""
+    path = tmp_path / "aisles.yaml"
+    path.write_text("ICA Maxi:\n  Frukt: [banan, äpple]\n  Mejeri: mjölk\n", encoding="utf-8")
+    assert load_aisles(str(path)) == {"ICA Maxi": {"Frukt": ["banan", "äpple"], "Mejeri": ["mjölk"]}}
+    assert load_aisles(str(tmp_path / "missing.yaml")) == {}
+    path.write_text("ICA Maxi: [banan]\n", encoding="utf-8")
+    assert load_aisles(str(path)) == {}
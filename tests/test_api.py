@@ -0,0 +1,80 @@
+"""Tests for IcaClient and TicketManager, run inside Home Assistant against FakeIca."""
+import asyncio
+
+LOGIN = "GET /api/login"
+LISTS = "GET /api/user/offlineshoppinglists"
+
+
+def test_rejected_ticket_is_refreshed_once_for_concurrent_requests(run, start_ica):
+    """Requests that all get a 401 share one login and are sent again with the new ticket."""
+
+    async def scenario():
+        async with start_ica([{"ProductName": "mjölk"}]) as (fake, harness):
+            client = harness.data.client.client
+            logins = fake.requests[LOGIN]
+            fake.tickets.clear()
+            results = await asyncio.gather(*(client.async_sync("Test", {}) for _ in range(5)))
+            return results, fake.requests[LOGIN] - logins, client.metrics.counters["ica reauth on 401"]
+
+    results, logins, reauths = run(scenario())
+    assert [len(result["Rows"]) for result in results] == [1] * 5
+    assert logins == 1
+    assert reauths == 5
+
+
+def test_rejected_ticket_is_refreshed_while_looking_up_a_list(run, start_ica):
+    """A ticket that ICA rejects while a list is looked up is replaced, and the lookup is done again."""
+
+    async def scenario():
+        async with start_ica() as (fake, harness):
+            tickets = harness.data.client.client.tickets
+            logins, lookups = fake.requests[LOGIN], fake.requests[LISTS]
+            fake.tickets.clear()
+            ticket, list_id = await tickets.async_get("Other")
+            return ticket in fake.tickets, fake.lists[list_id]["Title"], fake.requests[LOGIN] - logins, fake.requests[LISTS] - lookups
+
+    valid, title, logins, lookups = run(scenario())
+    assert valid
+    assert title == "Other"
+    assert logins == 1
+    assert lookups == 2
+
+
+def test_ticket_and_list_ids_are_kept_across_restarts(run, start_ica):
+    """A restart uses the persisted ticket and list id instead of logging in and looking up the list again."""
+
+    async def scenario():
+        async with start_ica() as (fake, harness):
+            await harness.hass.async_block_till_done()
+            first = fake.requests[LOGIN], fake.requests[LISTS]
+        async with start_ica() as (fake, harness):
+            second = fake.requests[LOGIN], fake.requests[LISTS]
+        return first, second
+
+    first, second = run(scenario())
+    assert first == (1, 1)
+    # The second FakeIca does not know the old ticket, so the first fetch gets a 401 and logs in, but the list id is not looked up.
+    assert second == (1, 0)
+
+
+
+def test_get_requests_are_retried_and_the_breaker_opens(run, start_ica):
+    """Fetches are retried when ICA fails, and once it keeps failing, requests fail without being sent."""
+
+    async def scenario():
+        async with start_ica() as (fake, harness):
+            client = harness.data.client.client
+            fake.error_rate = 1
+            errors = []
+            for _ in range(3):
+                try:
+                    await client.async_get_list("Test")
+                except Exception as err:  # noqa: BLE001
+                    errors.append(type(err).__name__)
+            return errors, client.metrics.counters["ica retries"], client.breaker.as_dict()["state"]
+
+    errors, retries, state = run(scenario())
+    assert errors[0] == "IcaUnavailableError"
+    assert errors[-1] == "IcaCircuitOpenError"
+    assert retries >= 2
+    assert state == "open"
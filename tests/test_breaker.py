@@ -0,0 +1,66 @@
+"""Tests for CircuitBreaker."""
+import pytest
+
+from custom_components.ica_shopping_list import breaker
+from custom_components.ica_shopping_list.breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+)
+from custom_components.ica_shopping_list.metrics import Metrics
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the clock of the breaker with one the test moves."""
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_threshold(clock):
+    """The breaker opens after the threshold of failures in a row, and a success resets the count."""
+    circuit = CircuitBreaker(Metrics(), failure_threshold=3, reset_timeout=30)
+    circuit.record_failure()
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.state == STATE_CLOSED
+    assert circuit.allow()
+    circuit.record_failure()
+    assert circuit.state == STATE_OPEN
+    assert not circuit.allow()
+
+
+def test_half_open_trial(clock):
+    """After the timeout one trial goes through, and its result closes or reopens the breaker."""
+    metrics = Metrics()
+    circuit = CircuitBreaker(metrics, failure_threshold=1, reset_timeout=30)
+    circuit.record_failure()
+    clock[0] += 30
+    assert circuit.allow()
+    assert circuit.state == STATE_HALF_OPEN
+    assert not circuit.allow()
+    circuit.record_failure()
+    assert circuit.state == STATE_OPEN
+    assert not circuit.allow()
+    clock[0] += 30
+    assert circuit.allow()
+    circuit.record_success()
+    assert circuit.as_dict() == {"state": STATE_CLOSED, "failures": 0}
+    assert circuit.allow()
+    assert metrics.counters["ica circuit opened"] == 2
+
+
+def test_lost_trial_does_not_block(clock):
+    """A trial that never reports back lets another one through after the timeout."""
+    circuit = CircuitBreaker(Metrics(), failure_threshold=1, reset_timeout=30)
+    circuit.record_failure()
+    clock[0] += 30
+    assert circuit.allow()
+    clock[0] += 29
+    assert not circuit.allow()
+    clock[0] += 1
+    assert circuit.allow()
@@ -0,0 +1,35 @@
+"""Tests for ResponseCache."""
+import gzip
+import json
+
+from custom_components.ica_shopping_list.cache import ResponseCache
+from custom_components.ica_shopping_list.store import ItemStore
+
+
+def test_body_and_etags_follow_changes():
+    """The body is rebuilt after invalidate, with a new ETag, and the gzip body has an ETag of its own."""
+    store = ItemStore()
+    store.apply_rows([{"OfflineId": str(index), "ProductName": f"vara {index}"} for index in range(100)])
+    cache = ResponseCache(store.items)
+    body, etag = cache.body, cache.etag
+    assert len(json.loads(body)) == 100
+    assert cache.compressible
+    assert gzip.decompress(cache.gzip_body) == body
+    assert cache.gzip_etag != etag
+    assert cache.gzip_etag.startswith(etag[:-1])
+
+    cache.invalidate()
+    assert cache.body == body
+    assert cache.etag == etag
+    store.apply_row({"OfflineId": "0", "IsStrikedOver": True})
+    cache.invalidate()
+    assert json.loads(cache.body)[0]["complete"] is True
+    assert cache.etag != etag
+
+
+def test_small_lists_are_not_compressed():
+    """Bodies below the threshold have no gzip version."""
+    cache = ResponseCache(ItemStore().items)
+    assert cache.body == b"[]"
+    assert not cache.compressible
+    assert cache.gzip_body is None
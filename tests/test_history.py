@@ -0,0 +1,84 @@
+"""Tests for PurchaseHistory."""
+import os
+import random
+
+from custom_components.ica_shopping_list import history
+from custom_components.ica_shopping_list.history import TOP_K, PurchaseHistory
+
+
+def test_top_matches_a_full_ranking(run, make_hass):
+    """The top list kept per purchase is the same as ranking every name from scratch."""
+
+    async def scenario():
+        purchases = PurchaseHistory(make_hass(), "test")
+        rng = random.Random(1)
+        names = [f"vara {index}" for index in range(60)]
+        timestamp = history.SCORE_EPOCH
+        for _ in range(2000):
+            timestamp += rng.randrange(3600 * 24)
+            purchases.async_record(rng.choice(names[: rng.randrange(1, len(names))]), timestamp)
+            ranked = sorted(purchases._stats.values(), key=lambda stats: -stats["score"])[:TOP_K]
+            assert [entry["name"] for entry in purchases.top()] == [stats["name"] for stats in ranked]
+        purchases._flush_handle.cancel()
+
+    run(scenario())
+
+
+def test_recent_purchases_outrank_old_ones(run, make_hass):
+    """A purchase counts half as much after the half-life."""
+
+    async def scenario():
+        purchases = PurchaseHistory(make_hass(), "test")
+        start = history.SCORE_EPOCH
+        for day in range(3):
+            purchases.async_record("Kaffe", start + day * 3600)
+        purchases.async_record("Te", start + 2 * history.HALF_LIFE)
+        purchases.async_record("Te", start + 2 * history.HALF_LIFE)
+        purchases._flush_handle.cancel()
+        return purchases.top()
+
+    top = run(scenario())
+    assert [entry["name"] for entry in top] == ["Te", "Kaffe"]
+    assert [entry["count"] for entry in top] == [2, 3]
+
+
+def test_history_is_persisted_and_compacted(run, make_hass, monkeypatch):
+    """Purchases are appended, read back after a restart, and compacted to one line per name."""
+    monkeypatch.setattr(history, "COMPACT_LINES", 3)
+
+    async def record_and_flush(names):
+        purchases = PurchaseHistory(make_hass(), "test")
+        await purchases.async_load()
+        for index, name in enumerate(names):
+            purchases.async_record(name, history.SCORE_EPOCH + index)
+        await purchases._async_flush()
+        return purchases
+
+    first = run(record_and_flush(["Mjölk", "mjolk", "Bröd"]))
+    with open(first.path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 3
+
+    second = run(record_and_flush(["Ost"] * 4))
+    with open(second.path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 3
+    assert {entry["name"]: entry["count"] for entry in second.top()} == {"Ost": 4, "Mjölk": 2, "Bröd": 1}
+
+    third = run(record_and_flush([]))
+    assert third.top() == second.top()
+    assert len(third) == 3
+
+
+def test_malformed_lines_are_skipped(run, make_hass):
+    """A line that is cut off or does not hold a purchase is skipped, and the rest of the history is read."""
+
+    async def scenario():
+        purchases = PurchaseHistory(make_hass(), "test")
+        os.makedirs(os.path.dirname(purchases.path), exist_ok=True)
+        with open(purchases.path, "w", encoding="utf-8") as file:
+            file.write('{"name": "Kaffe", "count": 1, "score": 1.0, "last": 1}\n')
+            file.write('["Te"]\n{"name": 5, "count": 1, "score": 1.0, "last": 1}\n{"name": "Te"}\n')
+            file.write('{"name": "Ost", "count": 2, "score": 2.0, "last": 2}\n{"name": "Br')
+        await purchases.async_load()
+        return purchases.top()
+
+    assert [entry["name"] for entry in run(scenario())] == ["Ost", "Kaffe"]
@@ -0,0 +1,46 @@
+"""Tests for ListPoller, run inside Home Assistant against FakeIca."""
+import asyncio
+
+from custom_components.ica_shopping_list.poller import ListPoller
+
+MILK = {"OfflineId": "milk", "ProductName": "mjölk"}
+
+
+def test_poller_backs_off_and_picks_up_changes(run, start_ica):
+    """Unchanged polls lengthen the interval, a failed poll does not stop polling, and a change made in ICA is applied."""
+
+    async def scenario():
+        async with start_ica([MILK]) as (fake, harness):
+            data = harness.data
+            refresh = data.async_refresh
+            failures = [RuntimeError("Unexpected")]
+
+            async def flaky_refresh():
+                if failures:
+                    raise failures.pop()
+                return await refresh()
+
+            data.async_refresh = flaky_refresh
+            poller = ListPoller(harness.hass, data, interval_min=0.05, interval_max=0.2)
+            poller.async_start()
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if poller.interval == poller.interval_max:
+                    break
+            backed_off = poller.interval
+            (shopping_list,) = fake.lists.values()
+            shopping_list["Rows"][0]["IsStrikedOver"] = True
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if data.store.get("milk").complete:
+                    break
+            interval_after_change = poller.interval
+            poller._async_stop(None)
+            return failures, backed_off, data.store.get("milk").complete, interval_after_change
+
+    failures, backed_off, complete, interval_after_change = run(scenario())
+    assert failures == []
+    assert backed_off == 0.2
+    assert complete
+    # The poll that saw the change went back to the shortest interval, and at most one more poll ran before the test looked.
+    assert interval_after_change <= 0.1
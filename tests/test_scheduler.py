@@ -0,0 +1,103 @@
+"""Tests for RequestScheduler."""
+import asyncio
+
+import pytest
+
+from custom_components.ica_shopping_list.metrics import Metrics
+from custom_components.ica_shopping_list.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RequestScheduler,
+    request_priority,
+)
+
+
+async def hold(scheduler, order, name, release, priority=PRIORITY_INTERACTIVE, timeout=None):
+    """Take a slot in a task of its own, note when it was handed out and hold it until `release` is set."""
+    request_priority.set(priority)
+    async with scheduler.slot(timeout):
+        order.append(name)
+        await release.wait()
+
+
+def test_in_flight_cap_and_priority(run):
+    """Waiting requests get a slot interactive first, then in arrival order."""
+
+    async def scenario():
+        scheduler = RequestScheduler(asyncio.get_running_loop(), Metrics(), rate=1000, burst=100, max_in_flight=1)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.ensure_future(hold(scheduler, order, "first", release))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(hold(scheduler, order, "poll 1", release, PRIORITY_BACKGROUND)))
+        tasks.append(asyncio.ensure_future(hold(scheduler, order, "poll 2", release, PRIORITY_BACKGROUND)))
+        tasks.append(asyncio.ensure_future(hold(scheduler, order, "user", release)))
+        await asyncio.sleep(0)
+        waiting = scheduler.waiting
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, waiting, scheduler.in_flight
+
+    order, waiting, in_flight = run(scenario())
+    assert order == ["first", "user", "poll 1", "poll 2"]
+    assert waiting == 3
+    assert in_flight == 0
+
+
+def test_timeout_gives_up_the_place_in_line(run):
+    """A request that times out waiting is skipped, and the slot goes to the next one."""
+
+    async def scenario():
+        scheduler = RequestScheduler(asyncio.get_running_loop(), Metrics(), rate=1000, burst=100, max_in_flight=1)
+        order, release = [], asyncio.Event()
+        first = asyncio.ensure_future(hold(scheduler, order, "first", release))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await hold(scheduler, order, "impatient", release, timeout=0.01)
+        patient = asyncio.ensure_future(hold(scheduler, order, "patient", release))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, patient)
+        return order, scheduler
+
+    order, scheduler = run(scenario())
+    assert order == ["first", "patient"]
+    assert scheduler.in_flight == 0
+    assert scheduler.waiting == 0
+
+
+def test_cancelled_waiter_releases_a_slot_it_was_handed(run):
+    """A slot handed to a request that is cancelled before it runs is released again."""
+
+    async def scenario():
+        scheduler = RequestScheduler(asyncio.get_running_loop(), Metrics(), rate=1000, burst=100, max_in_flight=1)
+        order, release = [], asyncio.Event()
+        first = scheduler.slot()
+        await first.__aenter__()
+        cancelled = asyncio.ensure_future(hold(scheduler, order, "cancelled", release))
+        await asyncio.sleep(0)
+        # Releasing the first slot hands it to the waiter, which is cancelled before it could run.
+        await first.__aexit__(None, None, None)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return order, scheduler.in_flight
+
+    order, in_flight = run(scenario())
+    assert order == []
+    assert in_flight == 0
+
+
+def test_rate_limit(run):
+    """Requests beyond the burst wait for the bucket to refill."""
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = RequestScheduler(loop, Metrics(), rate=50, burst=2, max_in_flight=10)
+        start = loop.time()
+        for _ in range(4):
+            async with scheduler.slot():
+                pass
+        return loop.time() - start
+
+    # Two requests go at once, the other two wait 1 / 50 seconds each.
+    assert run(scenario()) >= 0.035
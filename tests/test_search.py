@@ -0,0 +1,77 @@
+"""Tests for NameIndex."""
+import random
+
+from custom_components.ica_shopping_list.search import MAX_LIMIT, NameIndex
+from custom_components.ica_shopping_list.store import normalize_name
+
+
+def make_index(*names):
+    """Return an index with `names` added once each."""
+    index = NameIndex()
+    for name in names:
+        index.add(name)
+    return index
+
+
+def test_prefix_search_ranks_by_count():
+    """Names starting with the query, or with a word that does, are returned most added first."""
+    index = make_index("Mjöl", "Mjölk", "Laktosfri mjölk", "Ost")
+    index.add("mjolk", 2)
+    assert index.search("mjö") == ["Mjölk", "Laktosfri mjölk", "Mjöl"]
+    assert index.search("MJO", limit=1) == ["Mjölk"]
+    assert index.search("laktos") == ["Laktosfri mjölk"]
+    assert index.search(" ") == []
+
+
+def test_first_spelling_is_kept():
+    """A name is shown in the spelling it was first added with."""
+    index = make_index("Crème fraiche")
+    index.add("creme   FRAICHE")
+    assert len(index) == 1
+    assert index.canonical("CREME fraiche") == "Crème fraiche"
+    assert index.canonical("Gräddfil") == "Gräddfil"
+    assert index.as_dict() == {"Crème fraiche": 2}
+
+
+def test_close_matches_when_nothing_starts_with_the_query():
+    """A misspelled query finds names spelled close to it, and nothing far from it."""
+    index = make_index("Mjölk", "Bröd", "Smör")
+    assert index.search("mjölkk") == ["Mjölk"]
+    assert index.search("nmjolk") == ["Mjölk"]
+    assert index.closest("Brod") == ["Bröd"]
+    assert index.search("banan") == []
+
+
+def test_cache_is_dropped_when_results_can_change():
+    """Cached results are dropped for a new name or a new count, and kept when nothing changed."""
+    index = make_index("Mjöl", "Mjölk")
+    assert index.search("mj") == ["Mjöl", "Mjölk"]
+    index.add("Mjölk", 0)
+    assert index._cache
+    index.add("Mjölk")
+    assert index.search("mj") == ["Mjölk", "Mjöl"]
+    index.add("Mjölkchoklad")
+    assert index.search("mjölkc") == ["Mjölkchoklad"]
+    assert "Mjölkchoklad" in index.search("mj")
+
+
+def test_short_prefixes_match_a_full_ranking():
+    """The ranked lists kept for short prefixes give the same results as ranking every match."""
+    rng = random.Random(1)
+    letters = "abcdefghijklmnopqrstuvwxyzåäö"
+    names = [" ".join("".join(rng.choice(letters) for _ in range(rng.randrange(1, 6))) for _ in range(rng.randrange(1, 3))) for _ in range(400)]
+    index = NameIndex()
+    for _ in range(3000):
+        index.add(rng.choice(names), rng.choice([0, 1, 1, 3]))
+    for prefix in {name[:length] for name in names for length in (1, 2)}:
+        key = normalize_name(prefix)
+        if not key:
+            continue
+        matches = {
+            name_key
+            for name_key in index._counts
+            if any(token.startswith(key) for token in {name_key, *name_key.split()})
+        }
+        ranked = sorted(matches, key=lambda name_key: (-index._counts[name_key], name_key))
+        for limit in (1, 10, MAX_LIMIT):
+            assert index.search(prefix, limit) == [index._names[name_key] for name_key in ranked[:limit]], (prefix, limit)
@@ -0,0 +1,204 @@
+"""Tests for ShoppingData, run inside Home Assistant against FakeIca."""
+import asyncio
+
+from homeassistant.components import persistent_notification
+
+import custom_components.ica_shopping_list as ica_shopping_list
+
+MILK = {"OfflineId": "milk", "ProductName": "mjölk"}
+BREAD = {"OfflineId": "bread", "ProductName": "bröd"}
+
+
+def state(data):
+    """Return the items of `data` as sorted (name, complete) tuples."""
+    return sorted((item.name, item.complete) for item in data.items)
+
+
+def server_state(fake):
+    """Return what FakeIca has as sorted (name, complete) tuples."""
+    (shopping_list,) = fake.lists.values()
+    return sorted((row["ProductName"].capitalize(), row["IsStrikedOver"]) for row in shopping_list["Rows"])
+
+
+def test_changes_show_at_once_and_match_ica_after_the_sync(run, start_ica):
+    """Adds, updates and deletes are applied before ICA is asked, and the list matches ICA after the sync."""
+
+    async def scenario():
+        async with start_ica([MILK, BREAD], sync_delay=60) as (fake, harness):
+            data = harness.data
+            await data.async_add("ägg")
+            await data.async_update("milk", {"complete": True})
+            await data.async_update_items([{"item_id": "bread", "delete": True}])
+            optimistic = state(data)
+            synced_before = sum(count for request, count in fake.requests.items() if request.endswith("/sync"))
+            await data.queue.async_flush()
+            return optimistic, synced_before, state(data), server_state(fake)
+
+    optimistic, synced_before, reconciled, server = run(scenario())
+    assert optimistic == [("Mjölk", True), ("Ägg", False)]
+    assert synced_before == 0
+    assert reconciled == optimistic == server
+
+
+def test_failed_sync_is_rolled_back_with_a_notification(run, start_ica, monkeypatch):
+    """A failed sync undoes its changes and tells the user in a persistent notification."""
+    notifications = []
+    monkeypatch.setattr(
+        persistent_notification,
+        "async_create",
+        lambda hass, message, title=None, notification_id=None: notifications.append((notification_id, message)),
+    )
+
+    async def scenario():
+        async with start_ica([MILK, BREAD], sync_delay=60) as (fake, harness):
+            data = harness.data
+            before = state(data)
+            fake.error_rate = 1
+            await data.async_add("ägg")
+            await data.async_update("milk", {"complete": True})
+            await data.async_update_items([{"item_id": "bread", "delete": True}])
+            await data.queue.async_flush()
+            return before, state(data), data.store.pending
+
+    before, rolled_back, pending = run(scenario())
+    assert rolled_back == before
+    assert pending == 2
+    assert len(notifications) == 1
+    notification_id, message = notifications[0]
+    assert notification_id == "ica_shopping_list_test_sync_failed"
+    assert message.startswith("3 changes to Test could not be saved to ICA and were undone")
+
+
+def test_rollback_keeps_changes_made_while_the_sync_was_in_flight(run, start_ica):
+    """Rolling back a failed sync keeps the changes made after it was sent, and they are synced later."""
+
+    async def scenario():
+        async with start_ica([MILK, BREAD], sync_delay=60) as (fake, harness):
+            data = harness.data
+            fake.latency = 0.2
+            fake.error_rate = 1
+            await data.async_update("milk", {"complete": True})
+            flush = asyncio.ensure_future(data.queue.async_flush())
+            await asyncio.sleep(0.1)
+            await data.async_add("ägg")
+            await flush
+            rolled_back = state(data)
+            fake.latency = 0
+            fake.error_rate = 0
+            await data.queue.async_flush()
+            return rolled_back, state(data), server_state(fake)
+
+    rolled_back, synced, server = run(scenario())
+    assert rolled_back == [("Bröd", False), ("Mjölk", False), ("Ägg", False)]
+    assert synced == rolled_back == server
+
+
+def test_confirming_our_own_adds_keeps_the_revision(run, start_ica):
+    """ICA filling in the order of rows we created is not a change, while changes made in ICA are."""
+
+    async def scenario():
+        async with start_ica([MILK], sync_delay=60) as (fake, harness):
+            data = harness.data
+            start = data.revision
+            await data.async_add("ägg", expected_revision=start)
+            await data.queue.async_flush()
+            confirmed = data.revision
+            orders = [item.order for item in data.items]
+            await data.async_add("ost", expected_revision=confirmed)
+            (shopping_list,) = fake.lists.values()
+            shopping_list["Rows"][0]["ProductName"] = "havremjölk"
+            await data.queue.async_flush()
+            return start, confirmed, orders, data.revision
+
+    start, confirmed, orders, after_rename = run(scenario())
+    assert confirmed == start + 1
+    assert None not in orders
+    assert after_rename == confirmed + 2
+
+
+def test_update_view_checks_the_body(run, start_ica):
+    """The update view refuses a body that does not match the schema, and answers 409 for an old revision."""
+
+    async def scenario():
+        async with start_ica([MILK], sync_delay=60) as (fake, harness):
+            url = harness.base_url + "/api/shopping_list/item/milk"
+            statuses = []
+            for body in (
+                {"complete": True, "expected_revision": str(harness.data.revision)},
+                {"complete": "yes"},
+                {"complete": True, "expected_revision": harness.data.revision - 1},
+                {"complete": True, "expected_revision": harness.data.revision},
+            ):
+                async with harness.session.post(url, json=body) as resp:
+                    statuses.append(resp.status)
+            async with harness.session.post(harness.base_url + "/api/shopping_list/item/bread", json={}) as resp:
+                statuses.append(resp.status)
+            return statuses, state(harness.data)
+
+    statuses, items = run(scenario())
+    assert statuses == [400, 400, 409, 200, 404]
+    assert items == [("Mjölk", True)]
+
+
+def test_loading_the_list_from_ica_fires_no_event(run, start_ica, monkeypatch):
+    """Without a snapshot, the list read from ICA at start is not announced, and the first event only tells what changed after it."""
+    # The window of the load is still open when the test adds, so the add would share an event with the load if it were announced.
+    monkeypatch.setattr(ica_shopping_list, "EVENT_DELAY", 0.5)
+
+    async def scenario():
+        async with start_ica([MILK, BREAD], sync_delay=60) as (fake, harness):
+            events = []
+            harness.hass.bus.async_listen(ica_shopping_list.EVENT, lambda event: events.append(event.data))
+            await harness.data.async_add("ägg")
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if events:
+                    break
+            await asyncio.sleep(0.1)
+            return events
+
+    (event,) = run(scenario())
+    assert [item["name"] for item in event["added"]] == ["Ägg"]
+    assert event["completed"] == event["updated"] == event["removed"] == []
+
+
+async def wait_for_history(data, count):
+    """Wait until `count` names are in the purchase history of `data`, or a second has passed, and return the names."""
+    for _ in range(50):
+        if len(data.history) >= count:
+            break
+        await asyncio.sleep(0.02)
+    return [entry["name"] for entry in data.history.top()]
+
+
+def test_items_completed_before_the_first_load_are_not_purchases(run, start_ica):
+    """Without a snapshot, items already completed in ICA are not recorded as bought, and items completed after the load are."""
+
+    async def scenario():
+        async with start_ica([MILK, {**BREAD, "IsStrikedOver": True}], sync_delay=60) as (fake, harness):
+            data = harness.data
+            await data.async_update("milk", {"complete": True})
+            return await wait_for_history(data, 2)
+
+    assert run(scenario()) == ["Mjölk"]
+
+
+def test_list_loads_when_the_history_and_aisles_can_not(run, start_ica, monkeypatch):
+    """A history or aisle file that can not be read is logged, and the list is still loaded from ICA and records purchases."""
+
+    def fail(*args):
+        raise OSError("Unreadable")
+
+    monkeypatch.setattr(ica_shopping_list.PurchaseHistory, "_load", fail)
+    monkeypatch.setattr(ica_shopping_list, "load_aisles", fail)
+
+    async def scenario():
+        async with start_ica([MILK, BREAD], sync_delay=60, aisles="aisles.yaml") as (fake, harness):
+            data = harness.data
+            loaded = state(data)
+            await data.async_update("milk", {"complete": True})
+            return loaded, await wait_for_history(data, 1)
+
+    loaded, purchases = run(scenario())
+    assert loaded == [("Bröd", False), ("Mjölk", False)]
+    assert purchases == ["Mjölk"]
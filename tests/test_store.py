@@ -0,0 +1,72 @@
+"""Tests for ItemStore."""
+from custom_components.ica_shopping_list.model import items_json
+from custom_components.ica_shopping_list.store import ItemStore, normalize_name
+
+
+def row(offline_id, name, complete=False, **fields):
+    """Return an ICA row."""
+    return {"OfflineId": offline_id, "ProductName": name, "IsStrikedOver": complete, **fields}
+
+
+def test_normalize_name():
+    """Whitespace, case and accents are folded."""
+    assert normalize_name("  Laktosfri   Mjölk ") == "laktosfri mjolk"
+    assert normalize_name("ÄGG") == normalize_name("agg")
+
+
+def test_apply_rows_returns_only_what_differs():
+    """apply_rows reports added, changed and removed ids, and nothing for rows that are unchanged."""
+    store = ItemStore()
+    assert store.apply_rows([row("a", "mjölk"), row("b", "bröd")]) == (["a", "b"], [], [])
+    assert store.apply_rows([row("a", "mjölk"), row("b", "bröd")]) == ([], [], [])
+    assert store.apply_rows([row("a", "mjölk", True), row("c", "ost")]) == (["c"], ["a"], ["b"])
+    assert [item.id for item in store.items()] == ["a", "c"]
+    assert store.get("a").complete
+
+
+def test_apply_row_keeps_missing_fields():
+    """A partial row only changes the fields it has."""
+    store = ItemStore()
+    store.apply_rows([row("a", "mjölk", Quantity=2)])
+    assert store.apply_row({"OfflineId": "a", "IsStrikedOver": True}) == ([], ["a"], [])
+    item = store.get("a")
+    assert (item.name, item.complete, item.quantity) == ("Mjölk", True, 2)
+    assert store.apply_row({"OfflineId": "a", "IsStrikedOver": True}) == ([], [], [])
+    assert store.apply_row(row("b", "ost")) == (["b"], [], [])
+
+
+def test_pending_follows_every_change():
+    """pending counts the items that are not completed."""
+    store = ItemStore()
+    store.apply_rows([row("a", "mjölk"), row("b", "bröd", True), row("c", "ost")])
+    assert store.pending == 2
+    store.apply_row({"OfflineId": "a", "IsStrikedOver": True})
+    assert store.pending == 1
+    store.apply_row({"OfflineId": "b", "IsStrikedOver": False})
+    assert store.pending == 2
+    store.remove("c")
+    assert store.pending == 1
+    store.apply_rows([])
+    assert store.pending == 0
+    assert not store.remove("a")
+
+
+def test_find_prefers_items_not_completed_and_follows_renames():
+    """find folds the name, prefers an item that is not completed and follows renames."""
+    store = ItemStore()
+    store.apply_rows([row("a", "Mjölk", True), row("b", "mjolk")])
+    assert store.find(" MJÖLK ").id == "b"
+    store.apply_row({"OfflineId": "b", "ProductName": "grädde"})
+    assert store.find("mjölk").id == "a"
+    assert store.find("Grädde").id == "b"
+    store.remove("a")
+    assert store.find("mjölk") is None
+
+
+def test_items_json_encodes_changed_items_again():
+    """The cached JSON of an item is dropped when it changes."""
+    store = ItemStore()
+    store.apply_rows([row("a", "mjölk")])
+    assert b'"complete":false' in items_json(store.items())
+    store.apply_row({"OfflineId": "a", "IsStrikedOver": True})
+    assert b'"complete":true' in items_json(store.items())
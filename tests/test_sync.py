@@ -0,0 +1,144 @@
+"""Tests for SyncQueue."""
+import asyncio
+import copy
+
+from custom_components.ica_shopping_list.metrics import Metrics
+from custom_components.ica_shopping_list.sync import SyncQueue
+
+
+class FakeClient:
+    """Client that applies syncs to an in-memory list, or fails them."""
+
+    def __init__(self, rows=()):
+        """Initialize the client."""
+        self.metrics = Metrics()
+        self.rows = [dict(row) for row in rows]
+        self.payloads = []
+        self.error = None
+        self.gate = None
+
+    async def async_sync(self, payload):
+        """Apply `payload` the way ICA does and return the list."""
+        self.payloads.append(copy.deepcopy(payload))
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        rows = {row["OfflineId"]: row for row in self.rows}
+        for row in payload.get("CreatedRows", []):
+            rows[row["OfflineId"]] = {"IsStrikedOver": False, **row}
+        for row in payload.get("ChangedRows", []):
+            if row["OfflineId"] in rows:
+                rows[row["OfflineId"]].update(row)
+        for offline_id in payload.get("DeletedRows", []):
+            rows.pop(offline_id, None)
+        self.rows = list(rows.values())
+        return {"Rows": copy.deepcopy(self.rows)}
+
+
+MILK = {"OfflineId": "milk", "ProductName": "mjölk", "IsStrikedOver": False}
+BREAD = {"OfflineId": "bread", "ProductName": "bröd", "IsStrikedOver": False}
+
+
+def test_mutations_are_merged_per_row(run, make_hass):
+    """Changes to a created row are folded into it, a delete cancels it, and repeated changes merge."""
+
+    async def scenario():
+        client = FakeClient([MILK, BREAD])
+        queue = SyncQueue(make_hass(), client, 60)
+        queue.async_add({"OfflineId": "egg", "ProductName": "ägg", "IsStrikedOver": False})
+        queue.async_change({"OfflineId": "egg", "IsStrikedOver": True})
+        queue.async_add({"OfflineId": "tmp", "ProductName": "ost", "IsStrikedOver": False})
+        queue.async_delete("tmp")
+        queue.async_change({"OfflineId": "milk", "IsStrikedOver": True})
+        queue.async_change({"OfflineId": "milk", "ProductName": "havremjölk"})
+        queue.async_delete("bread")
+        queue.async_change({"OfflineId": "bread", "IsStrikedOver": True})
+        assert queue.is_pending()
+        await queue.async_flush()
+        assert not queue.is_pending()
+        return client.payloads
+
+    assert run(scenario()) == [
+        {
+            "CreatedRows": [{"OfflineId": "egg", "ProductName": "ägg", "IsStrikedOver": True}],
+            "ChangedRows": [{"OfflineId": "milk", "IsStrikedOver": True, "ProductName": "havremjölk"}],
+            "DeletedRows": ["bread"],
+        }
+    ]
+
+
+def test_flush_without_mutations_sends_nothing(run, make_hass):
+    """An empty flush does not call ICA."""
+
+    async def scenario():
+        client = FakeClient()
+        assert await SyncQueue(make_hass(), client, 60).async_flush() is None
+        return client.payloads
+
+    assert run(scenario()) == []
+
+
+def test_window_flushes_once(run, make_hass):
+    """Mutations within the delay go out as one sync when the window closes."""
+
+    async def scenario():
+        client = FakeClient()
+        queue = SyncQueue(make_hass(), client, 0.01)
+        for index in range(5):
+            queue.async_add({"OfflineId": str(index), "ProductName": f"vara {index}"})
+        await asyncio.sleep(0.05)
+        return client.payloads
+
+    payloads = run(scenario())
+    assert len(payloads) == 1
+    assert len(payloads[0]["CreatedRows"]) == 5
+
+
+def test_overlay_applies_outstanding_then_pending(run, make_hass):
+    """overlay lays a batch that is in flight and the mutations queued after it over the rows, in order."""
+
+    async def scenario():
+        client = FakeClient([MILK, BREAD])
+        client.gate = asyncio.Event()
+        queue = SyncQueue(make_hass(), client, 60)
+        queue.async_change({"OfflineId": "milk", "IsStrikedOver": True})
+        queue.async_add({"OfflineId": "egg", "ProductName": "ägg"})
+        flush = asyncio.ensure_future(queue.async_flush())
+        await asyncio.sleep(0)
+        queue.async_change({"OfflineId": "egg", "ProductName": "ekologiska ägg"})
+        queue.async_delete("bread")
+        overlaid = {row["OfflineId"]: row for row in queue.overlay([MILK, BREAD])}
+        client.gate.set()
+        await flush
+        await queue.async_flush()
+        return overlaid
+
+    overlaid = run(scenario())
+    assert set(overlaid) == {"milk", "egg"}
+    assert overlaid["milk"]["IsStrikedOver"] is True
+    assert overlaid["egg"]["ProductName"] == "ekologiska ägg"
+
+
+def test_batches_are_sent_in_order(run, make_hass):
+    """A second batch waits until the first one has been answered."""
+
+    async def scenario():
+        client = FakeClient([MILK])
+        client.gate = asyncio.Event()
+        queue = SyncQueue(make_hass(), client, 60)
+        queue.async_change({"OfflineId": "milk", "ProductName": "a"})
+        first = asyncio.ensure_future(queue.async_flush())
+        await asyncio.sleep(0)
+        queue.async_change({"OfflineId": "milk", "ProductName": "b"})
+        second = asyncio.ensure_future(queue.async_flush())
+        await asyncio.sleep(0)
+        sent_before_answer = len(client.payloads)
+        client.gate.set()
+        await asyncio.gather(first, second)
+        return sent_before_answer, client
+
+    sent_before_answer, client = run(scenario())
+    assert sent_before_answer == 1
+    assert [payload["ChangedRows"][0]["ProductName"] for payload in client.payloads] == ["a", "b"]
+    assert client.rows[0]["ProductName"] == "b"
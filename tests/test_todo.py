@@ -0,0 +1,30 @@
+"""Tests for the todo entity, run inside Home Assistant against FakeIca."""
+ENTITY_ID = "todo.ica_test"
+PHONE = {"OfflineId": "phone", "ProductName": "iPhone-laddare"}
+
+
+def test_todo_updates_reach_ica(run, start_ica):
+    """Completing an item only changes its status in ICA, and renaming it sends the new name."""
+
+    async def scenario():
+        async with start_ica([PHONE], sync_delay=60) as (fake, harness):
+            hass = harness.hass
+            await hass.async_block_till_done()
+            (shopping_list,) = fake.lists.values()
+            await hass.services.async_call(
+                "todo", "update_item", {"entity_id": ENTITY_ID, "item": "phone", "status": "completed"}, blocking=True
+            )
+            await harness.data.queue.async_flush()
+            completed = dict(shopping_list["Rows"][0]), hass.states.get(ENTITY_ID).state
+            await hass.services.async_call(
+                "todo", "update_item", {"entity_id": ENTITY_ID, "item": "phone", "rename": "USB-laddare"}, blocking=True
+            )
+            await harness.data.queue.async_flush()
+            return completed, dict(shopping_list["Rows"][0])
+
+    (completed, pending), renamed = run(scenario())
+    assert completed["ProductName"] == "iPhone-laddare"
+    assert completed["IsStrikedOver"] is True
+    assert pending == "0"
+    assert renamed["ProductName"] == "USB-laddare"
+    assert renamed["IsStrikedOver"] is True
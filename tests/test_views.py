@@ -0,0 +1,47 @@
+"""Tests for the HTTP views, run inside Home Assistant against FakeIca."""
+ROWS = [{"OfflineId": str(index), "ProductName": f"vara {index}"} for index in range(100)]
+GZIP = {"Accept-Encoding": "gzip"}
+IDENTITY = {"Accept-Encoding": "identity"}
+
+
+async def get(harness, headers):
+    """GET the list and return the status, headers and decoded JSON body."""
+    async with harness.session.get(harness.base_url + "/api/shopping_list", headers=headers) as resp:
+        body = await resp.json() if resp.status == 200 else None
+        return resp.status, resp.headers, body
+
+
+def test_get_list_answers_with_etags_and_304(run, start_ica):
+    """The gzip and the plain body have their own ETag, a matching If-None-Match gets a 304, and a change gives a new ETag."""
+
+    async def scenario():
+        async with start_ica(ROWS, sync_delay=60) as (fake, harness):
+            results = {
+                "gzip": await get(harness, GZIP),
+                "identity": await get(harness, IDENTITY),
+            }
+            etag = results["identity"][1]["ETag"]
+            gzip_etag = results["gzip"][1]["ETag"]
+            results["weak"] = await get(harness, {**IDENTITY, "If-None-Match": f'"other", W/{etag}'})
+            results["other encoding"] = await get(harness, {**GZIP, "If-None-Match": etag})
+            await harness.data.async_add("ägg")
+            results["changed"] = await get(harness, {**IDENTITY, "If-None-Match": etag})
+            return results, etag, gzip_etag, harness.data.revision
+
+    results, etag, gzip_etag, revision = run(scenario())
+    status, headers, body = results["gzip"]
+    assert status == 200
+    assert headers["Content-Encoding"] == "gzip"
+    assert len(body) == 100
+    status, headers, body = results["identity"]
+    assert status == 200
+    assert "Content-Encoding" not in headers
+    assert len(body) == 100
+    assert etag != gzip_etag
+    assert results["weak"][0] == 304
+    assert results["other encoding"][0] == 200
+    status, headers, body = results["changed"]
+    assert status == 200
+    assert headers["ETag"] != etag
+    assert headers["X-Shopping-List-Revision"] == str(revision)
+    assert len(body) == 101
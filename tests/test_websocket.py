@@ -0,0 +1,98 @@
+"""Tests for the websocket commands, run inside Home Assistant against FakeIca."""
+import asyncio
+
+MILK = {"OfflineId": "milk", "ProductName": "mjölk"}
+
+
+async def next_event(ws, result):
+    """Return the next event of the subscription that `result` answered."""
+    return await asyncio.wait_for(ws.events.setdefault(result["id"], asyncio.Queue()).get(), 5)
+
+
+def test_subscribe_sends_the_list_then_the_changes(run, start_ica):
+    """A subscriber gets the full list, then every change, and resumes with the changes it missed."""
+
+    async def scenario():
+        async with start_ica([MILK], sync_delay=60) as (fake, harness):
+            ws = await harness.websocket()
+            subscription = await ws.call("shopping_list/subscribe")
+            full = await next_event(ws, subscription)
+            await harness.data.async_add("ägg")
+            change = await next_event(ws, subscription)
+            resumed = await ws.call("shopping_list/subscribe", revision=full["revision"])
+            missed = await next_event(ws, resumed)
+            unknown = await ws.call("shopping_list/subscribe", revision=full["revision"] - 1000)
+            resent = await next_event(ws, unknown)
+            await ws.close()
+            return subscription, full, change, missed, resent
+
+    subscription, full, change, missed, resent = run(scenario())
+    assert subscription["success"]
+    assert [item["name"] for item in full["items"]] == ["Mjölk"]
+    assert change["revision"] == full["revision"] + 1
+    assert [item["name"] for item in change["added"]] == ["Ägg"]
+    assert change["changed"] == change["removed"] == []
+    assert missed == change
+    assert resent["revision"] == change["revision"]
+    assert [item["name"] for item in resent["items"]] == ["Mjölk", "Ägg"]
+
+
+def test_add_items_skips_names_already_on_the_list(run, start_ica):
+    """The service, websocket command and view add every name once, and in one sync per call."""
+
+    async def scenario():
+        async with start_ica([MILK], sync_delay=0) as (fake, harness):
+            results = {}
+            results["service"] = await harness.hass.services.async_call(
+                "ica_shopping_list", "add_items", {"items": "Mjolk\nägg\nÄgg"}, blocking=True, return_response=True
+            )
+            ws = await harness.websocket()
+            results["websocket"] = (await ws.call("shopping_list/items/add_items", items=["ägg", "ost", " "]))["result"]
+            async with harness.session.post(harness.base_url + "/api/shopping_list/items", json={"items": ["ost", "bröd"]}) as resp:
+                results["view"] = await resp.json()
+            await ws.close()
+            await harness.data.queue.async_flush()
+            syncs = sum(count for request, count in fake.requests.items() if request.endswith("/sync"))
+            return results, syncs, sorted(item.name for item in harness.data.items)
+
+    results, syncs, names = run(scenario())
+    assert results["service"] == {"added": ["ägg"], "present": ["Mjolk", "Ägg"]}
+    assert results["websocket"] == {"added": ["ost"], "present": ["ägg"]}
+    assert results["view"] == {"added": ["bröd"], "present": ["ost"]}
+    assert syncs == 3
+    assert names == ["Bröd", "Mjölk", "Ost", "Ägg"]
+
+
+def test_update_items_applies_every_change_at_once(run, start_ica):
+    """Renames, completions and deletes are applied as one change, ids that are not on the list are reported, and an old revision is refused."""
+
+    async def scenario():
+        async with start_ica([MILK, {"OfflineId": "bread", "ProductName": "bröd"}], sync_delay=60) as (fake, harness):
+            data = harness.data
+            revision = data.revision
+            ws = await harness.websocket()
+            result = await ws.call(
+                "shopping_list/items/update_items",
+                changes=[
+                    {"item_id": "milk", "name": "havremjölk", "complete": True},
+                    {"item_id": "bread", "delete": True},
+                    {"item_id": "cheese", "complete": True},
+                ],
+                expected_revision=revision,
+            )
+            refused = await ws.call(
+                "shopping_list/items/update_items", changes=[{"item_id": "milk", "complete": False}], expected_revision=revision
+            )
+            await ws.close()
+            await data.queue.async_flush()
+            syncs = sum(count for request, count in fake.requests.items() if request.endswith("/sync"))
+            return revision, result, refused, syncs, [(item.name, item.complete) for item in data.items]
+
+    revision, result, refused, syncs, items = run(scenario())
+    assert result["success"]
+    assert result["result"]["revision"] == revision + 1
+    assert result["result"]["not_found"] == ["cheese"]
+    assert [(item["name"], item["complete"]) for item in result["result"]["items"]] == [("Havremjölk", True)]
+    assert refused["error"]["code"] == "revision_mismatch"
+    assert syncs == 1
+    assert items == [("Havremjölk", True)]